@@ -0,0 +1,339 @@
+"""Benchmarks for the planner hot paths on a synthetic catalogue.
+
+Usage:
+    python benchmark.py --cities 300 --attractions-per-city 60 --output bench.json
+
+Builds a seeded synthetic attractions database plus flight, hotel and pricing
+data, times the main stages and prints (or writes) a JSON report with
+percentiles and peak memory per stage.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+from travel_planner import (
+    FlightOption, HotelOption, PlannerInstrumentation, SimpleItineraryPlanner, SimpleTouristDatabase,
+    DayScheduler, ItineraryStore, SimpleWebSearchTool, SnapshotTouristDatabase, TravelRequest, compile_snapshot, np
+)
+
+CATEGORIES = ["landmark", "museum", "historic", "religious", "park", "cultural", "market", "viewpoint"]
+PRICE_RANGES = ["Free", "$", "$$", "$$$", "$$$$"]
+DURATIONS = ["30 minutes", "1 hour", "1-2 hours", "2-3 hours", "3-4 hours", "4-6 hours"]
+WORDS = ["historic", "culture", "art", "food", "gothic", "romantic", "views", "royal", "modern",
+         "nature", "music", "architecture", "ancient", "family", "nightlife", "shopping"]
+INTERESTS = ["historic", "culture", "landmarks", "food", "art", "nature", "music", "shopping"]
+
+
+def city_name(i: int) -> str:
+    return f"City {i:05d}"
+
+
+def generate_attractions(cities: int, per_city: int, tags: int, seed: int = 42):
+    """Yield rows for the attractions table: (name, city, description, ..., tags)"""
+    rnd = random.Random(seed)
+    tag_vocabulary = WORDS + [f"tag{i:04d}" for i in range(max(0, tags - len(WORDS)))]
+    for c in range(cities):
+        city = city_name(c)
+        districts = [f"District {d}" for d in range(1 + per_city // 8)]
+        for a in range(per_city):
+            words = rnd.sample(WORDS, 3)
+            yield (
+                f"{words[0].title()} Site {a}",
+                city,
+                f"A {words[1]} place known for {words[2]}",
+                rnd.choice(CATEGORIES),
+                round(rnd.uniform(3.0, 5.0), 1),
+                rnd.choice(PRICE_RANGES),
+                rnd.choice(DURATIONS),
+                rnd.choice(districts),
+                ",".join(rnd.sample(tag_vocabulary, min(5, len(tag_vocabulary)))),
+            )
+
+
+def build_database(path: str, cities: int, per_city: int, tags: int, seed: int = 42):
+    db = SimpleTouristDatabase(path, lazy=True)  # create schema and seed rows
+    db.pool.executemany('''INSERT OR IGNORE INTO attractions
+                           (name, city, description, category, rating, price_range, duration, location, tags)
+                           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                        generate_attractions(cities, per_city, tags, seed), batch_size=5000,
+                        then=db.bump_catalogue_version)
+    db.close()
+
+
+class SyntheticWebSearchTool(SimpleWebSearchTool):
+    """SimpleWebSearchTool with generated data for the synthetic cities"""
+
+    def __init__(self, cities: int, flights_per_city: int = 20, hotels_per_city: int = 40, seed: int = 42):
+        super().__init__()
+        rnd = random.Random(seed)
+        airlines = ["Air One", "Blue Jet", "Euro Wings", "Sky Link", "Star Air"]
+        for c in range(cities):
+            city = city_name(c)
+            self.set_flights(city, [
+                FlightOption(rnd.choice(airlines), f"{rnd.randint(6, 11)}:00 AM", f"{rnd.randint(1, 9)}:00 PM",
+                             round(rnd.uniform(150, 900), 2), f"{rnd.randint(2, 12)}h 0m")
+                for _ in range(flights_per_city)
+            ])
+            self.set_hotels(city, [
+                HotelOption(f"Hotel {h} {city}", round(rnd.uniform(2.5, 5.0), 1), round(rnd.uniform(40, 450), 2),
+                            f"District {rnd.randint(0, 9)}", rnd.sample(["WiFi", "Breakfast", "Gym", "Spa", "Bar"], 2))
+                for h in range(hotels_per_city)
+            ])
+            self.set_pricing(city, {
+                "average_meal": round(rnd.uniform(8, 40), 2),
+                "local_transport": round(rnd.uniform(1, 5), 2),
+                "attraction_avg": round(rnd.uniform(5, 30), 2),
+                "currency": "EUR",
+            })
+
+
+def summarize(durations: List[float]) -> Dict:
+    ordered = sorted(durations)
+
+    def percentile(p: float) -> float:
+        k = min(len(ordered) - 1, max(0, int(round(p / 100 * (len(ordered) - 1)))))
+        return ordered[k] * 1000
+
+    return {
+        "runs": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 4),
+        "p50_ms": round(percentile(50), 4),
+        "p90_ms": round(percentile(90), 4),
+        "p99_ms": round(percentile(99), 4),
+        "max_ms": round(ordered[-1] * 1000, 4),
+    }
+
+
+def measure(fn: Callable[[int], object], runs: int, memory_runs: int = 20) -> Dict:
+    """Time fn(i) for i in range(runs), then trace peak memory over a few more calls.
+
+    Memory is traced in a separate pass because tracemalloc slows every allocation.
+    """
+    durations = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(runs):
+            start = time.perf_counter()
+            fn(i)
+            durations.append(time.perf_counter() - start)
+
+        tracemalloc.start()
+        for i in range(min(runs, memory_runs)):
+            fn(i)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    result = summarize(durations)
+    result["peak_memory_kb"] = round(peak / 1024, 1)
+    return result
+
+
+def serialization(fn: Callable[[int], str], runs: int, memory_runs: int = 20) -> Dict:
+    """measure() for a serializer, adding the bytes it writes per second"""
+    encoded = sum(len(fn(i).encode("utf-8")) for i in range(runs))
+    result = measure(fn, runs, memory_runs)
+    result["bytes_per_run"] = round(encoded / runs)
+    result["bytes_per_sec"] = round(encoded / runs / (result["mean_ms"] / 1000)) if result["mean_ms"] else None
+    return result
+
+
+def random_request(rnd: random.Random, cities: int) -> TravelRequest:
+    start = 1 + rnd.randint(0, 20)
+    return TravelRequest(
+        destination=city_name(rnd.randrange(cities)),
+        budget=rnd.choice([800.0, 1500.0, 3000.0]),
+        start_date=f"2024-09-{start:02d}",
+        end_date=f"2024-09-{start + rnd.randint(2, 9):02d}",
+        travelers=rnd.randint(1, 4),
+        interests=rnd.sample(INTERESTS, rnd.randint(1, 4)),
+    )
+
+
+def batch_scaling(planner: SimpleItineraryPlanner, requests: List[TravelRequest], worker_counts) -> Dict:
+    """Wall time of create_itineraries for the same batch with each number of workers (pool startup included)"""
+    report = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for workers in worker_counts:
+            planner.tourist_db.search_cache.clear()  # workers start cold too
+            start = time.perf_counter()
+            planner.create_itineraries(requests, workers=workers)
+            seconds = time.perf_counter() - start
+            report[str(workers)] = {"seconds": round(seconds, 3),
+                                    "requests_per_sec": round(len(requests) / seconds, 1) if seconds else None}
+    return report
+
+
+def check_scoring_parity(db: SimpleTouristDatabase, cities: int, queries: int, seed: int) -> Dict:
+    """Compare the indexed (and NumPy, if available) rankings with the reference scorer"""
+    rnd = random.Random(seed)
+    engines = {"index": db, "compact": SimpleTouristDatabase(db.db_path, compact=True, lazy=True)}
+    if np is not None:
+        engines["numpy"] = SimpleTouristDatabase(db.db_path, scoring_engine="numpy", lazy=True)
+    mismatches = {name: 0 for name in engines}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(queries):
+            city = city_name(rnd.randrange(cities))
+            interests = rnd.sample(INTERESTS + WORDS, rnd.randint(0, 4))
+            top_k = rnd.randint(1, 20)
+            expected = [a.name for a in db.search_attractions_reference(city, " ".join(interests), interests, top_k)]
+            for name, engine in engines.items():
+                got = [a.name for a in engine.search_attractions(city, " ".join(interests), interests, top_k)]
+                mismatches[name] += got != expected
+    return {"queries": queries, "mismatches": mismatches}
+
+
+def catalogue_memory(db_path: str) -> Dict:
+    """Retained memory of an eagerly loaded catalogue (records plus indexes) per attraction"""
+    report = {}
+    for name, compact in (("dataclass", False), ("compact", True)):
+        tracemalloc.start()
+        db = SimpleTouristDatabase(db_path, compact=compact)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        count = len(db.attractions)
+        report[name] = {
+            "attractions": count,
+            "retained_kb": round(current / 1024, 1),
+            "peak_kb": round(peak / 1024, 1),
+            "bytes_per_attraction": round(current / count, 1) if count else None,
+        }
+        del db
+    return report
+
+
+def run(cities: int, per_city: int, tags: int, runs: int, seed: int, workdir: str) -> Dict:
+    rnd = random.Random(seed)
+    db_path = os.path.join(workdir, "bench_attractions.db")
+    build_database(db_path, cities, per_city, tags, seed)
+
+    results: Dict[str, Dict] = {}
+    results["load_attractions"] = measure(lambda i: SimpleTouristDatabase(db_path), max(1, runs // 50), 1)
+    results["catalogue_memory"] = catalogue_memory(db_path)
+
+    db = SimpleTouristDatabase(db_path)
+    planner = SimpleItineraryPlanner(tourist_db=db, web_search=SyntheticWebSearchTool(cities, seed=seed))
+    requests = [random_request(rnd, cities) for _ in range(runs)]
+
+    results["search_attractions"] = measure(
+        lambda i: db.search_attractions(requests[i].destination, " ".join(requests[i].interests),
+                                        requests[i].interests, top_k=15), runs)
+    db.search_cache.clear()
+
+    resolver = db.city_resolver()
+    typos = [r.destination.lower().replace("city", "cty") for r in requests]
+    results["city_resolution"] = measure(lambda i: resolver.resolve(typos[i]), runs)
+    results["city_resolution"]["resolved_correctly"] = sum(
+        resolver.resolve(typo) == r.destination for typo, r in zip(typos, requests))
+
+    attractions = [planner.find_attractions(r) for r in requests]
+    pricing = planner.web_search.get_current_prices(requests[0].destination)
+    start_dates = [planner.parse_dates(r) for r in requests]
+    results["plan_daily_activities"] = measure(
+        lambda i: planner.plan_daily_activities(attractions[i], (start_dates[i][1] - start_dates[i][0]).days,
+                                                requests[i].budget, pricing, start_dates[i][0]), runs)
+
+    scheduler = SimpleItineraryPlanner(tourist_db=db, web_search=planner.web_search, day_scheduler=DayScheduler())
+    long_trip = [db.search_attractions(r.destination, top_k=60) for r in requests]
+    results["day_scheduler"] = measure(
+        lambda i: scheduler.plan_daily_activities(long_trip[i], 21, requests[i].budget, pricing, start_dates[i][0]), runs)
+
+    fares = [(planner.web_search.search_flights("Home City", r.destination, r.start_date),
+              planner.web_search.search_hotels(r.destination, r.start_date, r.end_date)) for r in requests]
+    results["generate_recommendations"] = measure(
+        lambda i: planner.generate_recommendations(requests[i], fares[i][0], fares[i][1], pricing), runs)
+
+    planner.instrumentation = PlannerInstrumentation()
+    results["create_itinerary"] = measure(lambda i: planner.create_itinerary(requests[i]), runs)
+    results["create_itinerary_stages"] = planner.instrumentation.snapshot()["stages"]
+    with contextlib.redirect_stdout(io.StringIO()):
+        itineraries = [planner.create_itinerary(r) for r in requests]
+    results["json_serialization"] = serialization(lambda i: json.dumps(itineraries[i]), runs)
+    results["fragment_serialization"] = serialization(lambda i: planner.fragments.encode(itineraries[i]), runs)
+    bulk = {str(i): itinerary for i, itinerary in enumerate(itineraries)}
+    bulk_runs = max(1, runs // 50)
+    results["bulk_json_serialization"] = serialization(lambda i: json.dumps(bulk, indent=2), bulk_runs, 1)
+    results["bulk_fragment_serialization"] = serialization(
+        lambda i: planner.fragments.encode(bulk, indent=2), bulk_runs, 1)
+    results["fragments"] = planner.fragments.stats()
+
+    store_planner = SimpleItineraryPlanner(tourist_db=db, web_search=planner.web_search,
+                                           itinerary_store=ItineraryStore(os.path.join(workdir, "itineraries.db")))
+    with contextlib.redirect_stdout(io.StringIO()):
+        for r in requests:
+            store_planner.create_itinerary(r)
+    # Repeated requests are a hot set that fits the in-memory layer
+    hot = requests[-min(len(requests), store_planner.itinerary_store.memory_entries // 2):]
+    results["itinerary_store_hit"] = measure(lambda i: store_planner.create_itinerary(hot[i % len(hot)]), runs)
+    results["itinerary_store_hit"]["store"] = store_planner.itinerary_store.stats()
+    # Hits that miss the in-memory layer read and decode the stored JSON
+    store_planner.itinerary_store = ItineraryStore(os.path.join(workdir, "itineraries.db"), memory_entries=0)
+    results["itinerary_store_disk_hit"] = measure(lambda i: store_planner.create_itinerary(requests[i]), runs)
+    results["itinerary_store_disk_hit"]["store"] = store_planner.itinerary_store.stats()
+
+    results["create_itineraries_workers"] = batch_scaling(planner, requests, (1, 2, 4))
+
+    results["scoring_parity"] = check_scoring_parity(db, cities, min(runs, 200), seed)
+    results["connection_pool"] = db.connection_stats()
+
+    # One city gets a dated fare table for the whole of September; the sweep costs every 3-7 night window
+    sweep_request = requests[0]
+    for day in range(1, 31):
+        for option in range(20):
+            planner.web_search.fares.add_flight(sweep_request.destination, FlightOption(
+                "Sweep Air", "9:00 AM", "3:00 PM", round(rnd.uniform(150, 900), 2), "6h 0m"), f"2024-09-{day:02d}")
+            planner.web_search.fares.add_hotel(sweep_request.destination, HotelOption(
+                f"Sweep Hotel {option}", round(rnd.uniform(2.5, 5.0), 1), round(rnd.uniform(40, 450), 2),
+                "Centre", ["WiFi"]), f"2024-09-{day:02d}")
+    results["date_sweep"] = measure(
+        lambda i: planner.sweep_dates(sweep_request, "2024-09-01", "2024-09-30", 3, 7, top_n=3), max(1, runs // 20), 1)
+
+    # Snapshots hold the built-in provider tables only, not the sweep fares loaded above
+    snapshot_path = os.path.join(workdir, "bench.snap")
+    snapshot_providers = SyntheticWebSearchTool(cities, seed=seed)
+    results["snapshot_compile"] = measure(
+        lambda i: compile_snapshot(snapshot_path, db_path, snapshot_providers), 1, 1)
+    results["snapshot_compile"]["bytes"] = os.path.getsize(snapshot_path)
+    results["snapshot_open"] = measure(lambda i: SnapshotTouristDatabase(snapshot_path), max(1, runs // 50), 1)
+    snapshot_db = SnapshotTouristDatabase(snapshot_path)
+    results["snapshot_search_attractions"] = measure(
+        lambda i: snapshot_db.search_attractions(requests[i].destination, " ".join(requests[i].interests),
+                                                 requests[i].interests, top_k=15), runs)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the travel planner hot paths")
+    parser.add_argument("--cities", type=int, default=200)
+    parser.add_argument("--attractions-per-city", type=int, default=50)
+    parser.add_argument("--tags", type=int, default=200, help="Size of the tag vocabulary")
+    parser.add_argument("--runs", type=int, default=500, help="Requests timed per stage")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        results = run(args.cities, args.attractions_per_city, args.tags, args.runs, args.seed, workdir)
+
+    report = {
+        "config": vars(args),
+        "python": platform.python_version(),
+        "numpy": np.__version__ if np is not None else None,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
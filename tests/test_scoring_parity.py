@@ -0,0 +1,83 @@
+"""The indexed scoring engines must rank exactly like search_attractions_reference"""
+import contextlib
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from travel_planner import Attraction, SimpleTouristDatabase, np
+
+# Few ratings and a small vocabulary, so many attractions tie on score
+RATINGS = [3.5, 4.0, 4.5]
+CATEGORIES = ["museum", "park", "market", "landmark"]
+WORDS = ["historic", "art", "food", "gothic", "views", "royal", "music", "nature"]
+CITIES = ["Alpha", "Beta City", "Gamma"]
+
+
+def generate_attractions(rnd: random.Random, per_city: int):
+    for city in CITIES:
+        for a in range(per_city):
+            words = rnd.sample(WORDS, 2)
+            yield Attraction(f"{words[0].title()} Site {a}", f"A {words[1]} place", rnd.choice(CATEGORIES),
+                             rnd.choice(RATINGS), "$", "1 hour", "Centre", rnd.sample(WORDS, 2), city)
+
+
+def random_query(rnd: random.Random):
+    """query, interests, top_k; terms include substrings and phrases, interests may be empty"""
+    vocabulary = WORDS + CATEGORIES + ["hist", "site", "place", "a gothic", "unknownword"]
+    query = " ".join(rnd.sample(vocabulary, rnd.randint(0, 2)))
+    interests = rnd.sample(vocabulary, rnd.randint(0, 3))
+    return query, interests, rnd.randint(1, 60)
+
+
+class ScoringParityTest(unittest.TestCase):
+    QUERIES = 400
+    PER_CITY = 25
+
+    @classmethod
+    def setUpClass(cls):
+        cls.workdir = tempfile.mkdtemp()
+        cls.db_path = os.path.join(cls.workdir, "attractions.db")
+        with contextlib.redirect_stdout(io.StringIO()):
+            db = SimpleTouristDatabase(cls.db_path)
+            db.add_attractions(generate_attractions(random.Random(7), cls.PER_CITY))
+            db.close()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.workdir)
+
+    def open_database(self, **options) -> SimpleTouristDatabase:
+        with contextlib.redirect_stdout(io.StringIO()):
+            db = SimpleTouristDatabase(self.db_path, **options)
+        self.addCleanup(db.close)
+        return db
+
+    def assert_same_ranking(self, engine: SimpleTouristDatabase):
+        reference = self.open_database()
+        rnd = random.Random(42)
+        for _ in range(self.QUERIES):
+            city = rnd.choice(CITIES + ["Paris", "Nowhere"])
+            query, interests, top_k = random_query(rnd)
+            expected = [a.name for a in reference.search_attractions_reference(city, query, interests, top_k)]
+            got = [a.name for a in engine.search_attractions(city, query, interests, top_k)]
+            self.assertEqual(got, expected, (city, query, interests, top_k))
+
+    def test_index(self):
+        self.assert_same_ranking(self.open_database())
+
+    def test_compact(self):
+        self.assert_same_ranking(self.open_database(compact=True, lazy=True))
+
+    @unittest.skipIf(np is None, "NumPy is not installed")
+    def test_numpy(self):
+        self.assert_same_ranking(self.open_database(scoring_engine="numpy", lazy=True))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,39 @@
+import asyncio
+import bisect
+import cProfile
+import csv
+import gzip
+import hashlib
+import heapq
+import io
 import json
+import logging
+import math
+import mmap
+import os
+import pstats
+import queue
+import re
 import sqlite3
+import struct
+import sys
+import threading
+import time
+import tracemalloc
+from array import array
+from collections import OrderedDict, deque
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
-from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from dataclasses import asdict, dataclass, field, replace
+from itertools import accumulate, chain
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional and only needed for scoring_engine="numpy"
+    np = None
 
 @dataclass
 class TravelRequest:
@@ -13,6 +44,19 @@ class TravelRequest:
     travelers: int = 1
     interests: List[str] = None
 
+@dataclass
+class MultiCityRequest:
+    """A trip through several destinations; the planner picks the order unless keep_order is set"""
+    destinations: List[str]
+    budget: float
+    start_date: str
+    end_date: str
+    travelers: int = 1
+    interests: List[str] = None
+    origin: Optional[str] = None  # known city the trip starts from (and returns to with return_to_origin)
+    return_to_origin: bool = False
+    keep_order: bool = False
+
 @dataclass
 class Attraction:
     name: str
@@ -49,19 +93,833 @@ class DayItinerary:
     estimated_cost: float
     notes: str
 
+# Bump SCHEMA_VERSION when a migration is added to setup_database and
+# SEED_VERSION whenever SAMPLE_ATTRACTIONS changes
+SCHEMA_VERSION = 4
+SEED_VERSION = 1
+
+# Sample data for multiple cities (Tokyo removed)
+SAMPLE_ATTRACTIONS = [
+    # Paris, France
+    ("Eiffel Tower", "Paris", "Iconic iron lattice tower and symbol of Paris", "landmark", 4.5, "$", "2-3 hours", "Champ de Mars", "tower,landmark,romantic,architecture,views"),
+    ("Louvre Museum", "Paris", "World's largest art museum housing the Mona Lisa", "museum", 4.6, "$$", "3-4 hours", "Rue de Rivoli", "museum,art,culture,mona lisa,history"),
+    ("Notre-Dame Cathedral", "Paris", "Medieval Catholic cathedral with Gothic architecture", "religious", 4.4, "Free", "1-2 hours", "Île de la Cité", "cathedral,gothic,religious,architecture,historic"),
+    # London, England
+    ("Big Ben", "London", "Iconic clock tower at Palace of Westminster", "landmark", 4.5, "$", "1 hour", "Westminster", "clock,tower,parliament,iconic,historic"),
+    ("British Museum", "London", "World-famous museum with historical artifacts", "museum", 4.7, "Free", "3-4 hours", "Bloomsbury", "museum,history,artifacts,culture,education"),
+    ("Tower of London", "London", "Historic castle housing the Crown Jewels", "historic", 4.4, "$", "2-3 hours", "Tower Hamlets", "castle,crown jewels,historic,medieval,fortress"),
+    # Rome, Italy
+    ("Colosseum", "Rome", "Ancient amphitheater and iconic symbol of Rome", "historic", 4.6, "$$", "2-3 hours", "Palatine Hill", "colosseum,gladiators,ancient,roman,amphitheater"),
+    ("Vatican City", "Rome", "Papal enclave with Sistine Chapel and St. Peter's", "religious", 4.8, "$$", "4-6 hours", "Vatican", "vatican,sistine chapel,pope,religious,art"),
+    ("Trevi Fountain", "Rome", "Baroque fountain where coins bring good luck", "landmark", 4.4, "Free", "30 minutes", "Quirinale", "fountain,baroque,coins,wishes,romantic"),
+    # Milan, Italy
+    ("Milan Cathedral (Duomo)", "Milan", "Gothic cathedral with elaborate spires", "religious", 4.6, "$", "2-3 hours", "Piazza del Duomo", "duomo,gothic,cathedral,spires,architecture"),
+    ("La Scala Opera House", "Milan", "World-famous opera house and museum", "cultural", 4.5, "$$", "1-2 hours", "Brera", "opera,theater,music,culture,performance"),
+    # Madrid, Spain
+    ("Prado Museum", "Madrid", "Premier art museum with Spanish masterpieces", "museum", 4.7, "$$", "3-4 hours", "Centro", "museum,art,spanish masters,goya,velazquez"),
+    ("Royal Palace", "Madrid", "Baroque royal palace with opulent rooms", "historic", 4.4, "$", "2-3 hours", "Centro", "palace,royal,baroque,luxury,spanish royalty"),
+    # Barcelona, Spain
+    ("Sagrada Familia", "Barcelona", "Gaudi's unfinished basilica masterpiece", "religious", 4.8, "$$", "2-3 hours", "Eixample", "gaudi,basilica,modernist,architecture,unesco"),
+    ("Park Güell", "Barcelona", "Whimsical park designed by Antoni Gaudí", "park", 4.6, "$", "2-3 hours", "Gràcia", "gaudi,park,mosaic,architecture,views"),
+    # Berlin, Germany
+    ("Brandenburg Gate", "Berlin", "18th-century neoclassical monument", "landmark", 4.5, "Free", "30 minutes", "Mitte", "gate,neoclassical,historic,symbol,unity"),
+    ("Museum Island", "Berlin", "UNESCO site with five world-class museums", "museum", 4.6, "$$", "4-6 hours", "Mitte", "museums,unesco,art,history,culture"),
+    # Cologne, Germany
+    ("Cologne Cathedral", "Cologne", "Gothic cathedral and UNESCO World Heritage site", "religious", 4.7, "Free", "1-2 hours", "Innenstadt", "cathedral,gothic,unesco,twin towers,religious"),
+    # Amsterdam, Netherlands
+    ("Anne Frank House", "Amsterdam", "Museum in Anne Frank's hiding place", "museum", 4.4, "$$", "1-2 hours", "Jordaan", "anne frank,museum,wwii,history,moving"),
+    ("Van Gogh Museum", "Amsterdam", "World's largest Van Gogh art collection", "museum", 4.6, "$$", "2-3 hours", "Museumplein", "van gogh,art,paintings,museum,impressionist"),
+    # Prague, Czech Republic
+    ("Prague Castle", "Prague", "Largest ancient castle complex in the world", "historic", 4.6, "$", "3-4 hours", "Hradčany", "castle,historic,complex,views,royal"),
+    ("Charles Bridge", "Prague", "Historic stone bridge with statues", "landmark", 4.5, "Free", "1 hour", "Malá Strana", "bridge,historic,statues,vltava,iconic"),
+    ("Old Town Square", "Prague", "Medieval square with astronomical clock", "landmark", 4.4, "Free", "1-2 hours", "Old Town", "square,medieval,astronomical clock,historic,central"),
+    # Vienna, Austria
+    ("Schönbrunn Palace", "Vienna", "Former imperial summer residence", "historic", 4.7, "$$", "3-4 hours", "Hietzing", "palace,imperial,gardens,unesco,royal"),
+    ("St. Stephen's Cathedral", "Vienna", "Gothic cathedral with a distinctive roof", "religious", 4.6, "Free", "1-2 hours", "Innere Stadt", "cathedral,gothic,historic,church,architecture"),
+    # New York
+    ("Central Park", "New York", "Large public park in Manhattan", "park", 4.7, "Free", "2-4 hours", "Manhattan", "park,nature,walking,picnic,peaceful"),
+    ("Statue of Liberty", "New York", "Neoclassical sculpture on Liberty Island", "landmark", 4.5, "$$", "3-4 hours", "Liberty Island", "landmark,statue,liberty,historic,patriotic")
+]
+
+def build_searchable_text(attraction: Attraction) -> str:
+    """Lowercased text an attraction is matched against"""
+    return " ".join([
+        attraction.name,
+        attraction.description,
+        attraction.category,
+        attraction.location,
+        " ".join(attraction.tags)
+    ]).lower()
+
+# Alternative spellings and local names, keyed by city_key(); values are canonical names
+CITY_ALIASES = {
+    "nyc": "New York", "ny": "New York", "new york city": "New York", "manhattan": "New York",
+    "roma": "Rome", "praha": "Prague", "prag": "Prague", "wien": "Vienna",
+    "köln": "Cologne", "koln": "Cologne", "koeln": "Cologne", "milano": "Milan",
+    "londres": "London", "londra": "London", "parigi": "Paris", "berlino": "Berlin",
+}
+
+# (latitude, longitude) of the cities SimpleWebSearchTool knows, for transfer estimates
+CITY_COORDINATES = {
+    "Paris": (48.8566, 2.3522), "London": (51.5074, -0.1278), "Rome": (41.9028, 12.4964),
+    "Milan": (45.4642, 9.1900), "Madrid": (40.4168, -3.7038), "Barcelona": (41.3874, 2.1686),
+    "Berlin": (52.5200, 13.4050), "Cologne": (50.9375, 6.9603), "Amsterdam": (52.3676, 4.9041),
+    "Prague": (50.0755, 14.4378), "Vienna": (48.2082, 16.3738), "New York": (40.7128, -74.0060),
+}
+
+def haversine_km(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0 * math.asin(math.sqrt(h))
+
+def city_key(name: str) -> str:
+    """The one city normalization shared by the database and every provider lookup"""
+    return " ".join((name or "").split()).lower()
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Edit distance counting swapped neighbours as one edit; limit + 1 once it must exceed limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before, previous = None, list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            cost = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b))
+            if before is not None and j > 1 and char_a == b[j - 2] and a[i - 2] == char_b:
+                cost = min(cost, before[j - 2] + 1)
+            current.append(cost)
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return previous[-1]
+
+class NGramIndex:
+    """Character n-gram index over a vocabulary of terms.
+    
+    substring() finds every term containing a string through its 1- to 3-grams,
+    prefix() uses a sorted copy of the terms, and similar() ranks terms by the
+    Dice overlap of padded trigrams for typo-tolerant lookups. Each structure is
+    built on first use, so an index used for one kind of lookup pays for that only.
+    """
+    
+    def __init__(self, terms: Iterable[str] = ()):
+        self.terms: List[str] = []
+        self.term_ids: Dict[str, int] = {}
+        self._grams: Optional[Dict[str, set]] = None
+        # Padded trigram -> term length -> term ids, so fuzzy lookups can skip far-off lengths
+        self._trigrams: Optional[Dict[str, Dict[int, set]]] = None
+        self.sorted_terms: Optional[List[str]] = None
+        for term in terms:
+            self.add(term)
+    
+    @property
+    def grams(self) -> Dict[str, set]:
+        if self._grams is None:
+            self._grams = {}
+            for term_id, term in enumerate(self.terms):
+                self.index_grams(term_id, term)
+        return self._grams
+    
+    @property
+    def trigrams(self) -> Dict[str, Dict[int, set]]:
+        if self._trigrams is None:
+            self._trigrams = {}
+            for term_id, term in enumerate(self.terms):
+                self.index_trigrams(term_id, term)
+        return self._trigrams
+    
+    def index_grams(self, term_id: int, term: str):
+        for n in (1, 2, 3):
+            for i in range(len(term) - n + 1):
+                self._grams.setdefault(term[i:i + n], set()).add(term_id)
+    
+    def index_trigrams(self, term_id: int, term: str):
+        for gram in self.padded_trigrams(term):
+            self._trigrams.setdefault(gram, {}).setdefault(len(term), set()).add(term_id)
+    
+    @staticmethod
+    def padded_trigrams(term: str) -> set:
+        padded = f"  {term} "
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+    
+    def add(self, term: str) -> int:
+        term_id = self.term_ids.get(term)
+        if term_id is not None:
+            return term_id
+        term_id = self.term_ids[term] = len(self.terms)
+        self.terms.append(term)
+        if self._grams is not None:
+            self.index_grams(term_id, term)
+        if self._trigrams is not None:
+            self.index_trigrams(term_id, term)
+        self.sorted_terms = None
+        return term_id
+    
+    def substring(self, piece: str) -> List[str]:
+        """Terms that contain piece"""
+        if len(piece) <= 3:
+            return [self.terms[i] for i in self.grams.get(piece, ())]
+        postings = sorted((self.grams.get(piece[i:i + 3], set()) for i in range(len(piece) - 2)), key=len)
+        candidates = set.intersection(*postings) if postings[0] else set()
+        return [self.terms[i] for i in candidates if piece in self.terms[i]]
+    
+    def prefix(self, prefix: str, limit: int = 10) -> List[str]:
+        if self.sorted_terms is None:
+            self.sorted_terms = sorted(self.terms)
+        start = bisect.bisect_left(self.sorted_terms, prefix)
+        matches = []
+        for term in self.sorted_terms[start:start + limit]:
+            if not term.startswith(prefix):
+                break
+            matches.append(term)
+        return matches
+    
+    def candidates(self, term: str, min_shared: int, max_length_diff: Optional[int] = None) -> Dict[str, int]:
+        """Terms sharing at least min_shared padded trigrams with term, with the shared count.
+        
+        Only the rarest len(grams) - min_shared + 1 posting lists can produce a
+        candidate, so common grams are probed by membership instead of scanned.
+        """
+        postings = []
+        for gram in self.padded_trigrams(term):
+            by_length = self.trigrams.get(gram, {})
+            if max_length_diff is not None:
+                by_length = {length: ids for length, ids in by_length.items()
+                             if abs(length - len(term)) <= max_length_diff}
+            postings.append((sum(map(len, by_length.values())), by_length))
+        postings.sort(key=lambda posting: posting[0])
+        
+        probe = max(0, len(postings) - max(1, min_shared) + 1)
+        overlap: Dict[int, int] = {}
+        for _, by_length in postings[:probe]:
+            for ids in by_length.values():
+                for term_id in ids:
+                    overlap[term_id] = overlap.get(term_id, 0) + 1
+        for _, by_length in postings[probe:]:
+            for term_id in overlap:
+                if term_id in by_length.get(len(self.terms[term_id]), ()):
+                    overlap[term_id] += 1
+        return {self.terms[term_id]: shared for term_id, shared in overlap.items() if shared >= min_shared}
+    
+    def similar(self, term: str, limit: int = 5, min_score: float = 0.5) -> List[Tuple[float, str]]:
+        """(Dice score, term) pairs for the terms sharing the most padded trigrams with term"""
+        grams = len(term) + 1
+        scored = []
+        for candidate, shared in self.candidates(term, math.ceil(min_score * grams / 2)).items():
+            score = 2 * shared / (grams + len(candidate) + 1)
+            if score >= min_score:
+                scored.append((round(score, 4), candidate))
+        scored.sort(key=lambda x: (-x[0], x[1]))
+        return scored[:limit]
+
+class CityResolver:
+    """Maps user-typed city names to canonical ones: exact key, alias, then fuzzy match.
+    
+    A fuzzy match is accepted when it is within a small edit distance (one typo or
+    swap per four characters) and no other city is as close.
+    """
+    
+    def __init__(self, cities: Iterable[str] = (), aliases: Optional[Dict[str, str]] = None,
+                 max_cached: int = 4096):
+        self.canonical: Dict[str, str] = {}
+        self.index = NGramIndex()
+        self.aliases = {city_key(alias): city for alias, city in (CITY_ALIASES if aliases is None else aliases).items()}
+        self.max_cached = max_cached
+        self.cache: Dict[str, Optional[str]] = {}
+        for city in cities:
+            self.add(city)
+        self.index.trigrams  # build now rather than on the first typo
+    
+    def add(self, city: str):
+        key = city_key(city)
+        if key and key not in self.canonical:
+            self.canonical[key] = city
+            self.index.add(key)
+            self.cache.clear()
+    
+    def __len__(self) -> int:
+        return len(self.canonical)
+    
+    def resolve(self, name: str) -> Optional[str]:
+        key = city_key(name)
+        city = self.canonical.get(key)
+        if city is not None:
+            return city
+        if key in self.cache:
+            return self.cache[key]
+        
+        alias = self.aliases.get(key)
+        if alias is not None:
+            city = self.canonical.get(city_key(alias))
+        elif key:
+            city = self.fuzzy(key)
+        
+        if len(self.cache) >= self.max_cached:
+            self.cache.clear()
+        self.cache[key] = city
+        return city
+    
+    def fuzzy(self, key: str, max_checked: int = 32) -> Optional[str]:
+        # Try one edit first: its trigram filter is far tighter, and most typos are single edits.
+        # One edit changes at most three trigrams of the padded key, a swap four.
+        for max_edits in range(1, max(1, len(key) // 4) + 1):
+            candidates = self.index.candidates(key, len(key) + 1 - 4 * max_edits, max_edits)
+            ranked = sorted((shared, candidate) for candidate, shared in candidates.items())
+            best, best_distance, tied = None, max_edits + 1, False
+            for _, candidate in reversed(ranked[-max_checked:]):
+                distance = edit_distance(key, candidate, max_edits)
+                if distance < best_distance:
+                    best, best_distance, tied = candidate, distance, False
+                elif distance == best_distance and distance <= max_edits:
+                    tied = True
+            if best is not None:
+                return None if tied else self.canonical[best]
+        return None
+    
+    def complete(self, prefix: str, limit: int = 10) -> List[str]:
+        """Canonical names of the cities starting with prefix"""
+        return [self.canonical[key] for key in self.index.prefix(city_key(prefix), limit)]
+
+logger = logging.getLogger("travel_planner")
+
+class RateLimitedLogger:
+    """Logs each message key at most once per interval and counts what it suppressed.
+    
+    The level check comes first and arguments are formatted lazily by logging,
+    so a disabled or suppressed message costs a dict lookup on the hot path.
+    """
+    
+    def __init__(self, target: logging.Logger = logger, interval: float = 10.0):
+        self.target = target
+        self.interval = interval
+        self.last_logged: Dict[str, float] = {}
+        self.suppressed: Dict[str, int] = {}
+        self._lock = threading.Lock()
+    
+    def log(self, level: int, key: str, message: str, *args):
+        if not self.target.isEnabledFor(level):
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now - self.last_logged.get(key, -self.interval) < self.interval:
+                self.suppressed[key] = self.suppressed.get(key, 0) + 1
+                return
+            self.last_logged[key] = now
+            skipped = self.suppressed.pop(key, 0)
+        if skipped:
+            message += f" ({skipped} similar messages suppressed)"
+        self.target.log(level, message, *args)
+    
+    def warning(self, key: str, message: str, *args):
+        self.log(logging.WARNING, key, message, *args)
+    
+    def info(self, key: str, message: str, *args):
+        self.log(logging.INFO, key, message, *args)
+    
+    def debug(self, key: str, message: str, *args):
+        self.log(logging.DEBUG, key, message, *args)
+
+rate_limited_log = RateLimitedLogger()
+
+class InternPool:
+    """Maps repeated strings (cities, categories, tags, ...) to small integer ids"""
+    
+    def __init__(self):
+        self.values: List[str] = []
+        self.ids: Dict[str, int] = {}
+    
+    def intern(self, value: str) -> int:
+        value_id = self.ids.get(value)
+        if value_id is None:
+            value_id = self.ids[value] = len(self.values)
+            self.values.append(value)
+        return value_id
+
+class TextColumn:
+    """Variable-length strings packed into one UTF-8 buffer with an offsets array"""
+    
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets = array('Q', [0])
+    
+    def append(self, value: str):
+        self.data += (value or "").encode('utf-8')
+        self.offsets.append(len(self.data))
+    
+    def __getitem__(self, i: int) -> str:
+        return self.data[self.offsets[i]:self.offsets[i + 1]].decode('utf-8')
+    
+    def nbytes(self) -> int:
+        return len(self.data) + self.offsets.itemsize * len(self.offsets)
+
+class CompactAttractionStore:
+    """Columnar, array-backed attraction records for one city.
+    
+    Categorical columns and tags are stored as ids into a shared InternPool,
+    names and descriptions as packed UTF-8. Indexing returns a fresh Attraction
+    view, so code written against lists of Attraction keeps working.
+    """
+    
+    CATEGORICAL = ("city", "category", "price_range", "duration", "location")
+    
+    def __init__(self, pool: Optional[InternPool] = None):
+        self.pool = pool or InternPool()
+        self.names = TextColumn()
+        self.descriptions = TextColumn()
+        self.ratings = array('d')
+        self.codes = {column: array('I') for column in self.CATEGORICAL}
+        self.tag_ids = array('I')
+        self.tag_offsets = array('I', [0])
+    
+    def append_row(self, row):
+        """Append an attractions table row (id, name, city, description, ...)"""
+        self.names.append(row[1])
+        self.descriptions.append(row[3])
+        self.ratings.append(float('nan') if row[5] is None else row[5])
+        for column, value in zip(self.CATEGORICAL, (row[2], row[4], row[6], row[7], row[8])):
+            self.codes[column].append(self.pool.intern(value or ""))
+        self.tag_ids.extend(self.pool.intern(tag) for tag in (row[9].split(',') if row[9] else []))
+        self.tag_offsets.append(len(self.tag_ids))
+    
+    def __len__(self) -> int:
+        return len(self.ratings)
+    
+    def __getitem__(self, i: int) -> Attraction:
+        if i < 0:
+            i += len(self)
+        values = self.pool.values
+        rating = self.ratings[i]
+        return Attraction(
+            name=self.names[i],
+            city=values[self.codes["city"][i]],
+            description=self.descriptions[i],
+            category=values[self.codes["category"][i]],
+            rating=None if rating != rating else rating,
+            price_range=values[self.codes["price_range"][i]],
+            duration=values[self.codes["duration"][i]],
+            location=values[self.codes["location"][i]],
+            tags=[values[t] for t in self.tag_ids[self.tag_offsets[i]:self.tag_offsets[i + 1]]]
+        )
+    
+    def __iter__(self) -> Iterator[Attraction]:
+        for i in range(len(self)):
+            yield self[i]
+    
+    def nbytes(self) -> int:
+        """Size of the column buffers, excluding the shared intern pool"""
+        arrays = [self.ratings, self.tag_ids, self.tag_offsets] + list(self.codes.values())
+        return (self.names.nbytes() + self.descriptions.nbytes()
+                + sum(a.itemsize * len(a) for a in arrays))
+
+class CompactCatalogue:
+    """All loaded attractions as per-city CompactAttractionStores sharing one InternPool"""
+    
+    def __init__(self, pool: Optional[InternPool] = None):
+        self.pool = pool or InternPool()
+        self.stores: Dict[str, CompactAttractionStore] = {}
+    
+    def append_row(self, row):
+        key = city_key(row[2])
+        store = self.stores.get(key)
+        if store is None:
+            store = self.stores[key] = CompactAttractionStore(self.pool)
+        store.append_row(row)
+    
+    def replace_city(self, key: str, store: CompactAttractionStore):
+        if len(store):
+            self.stores[key] = store
+        else:
+            self.stores.pop(key, None)
+    
+    def __len__(self) -> int:
+        return sum(len(store) for store in self.stores.values())
+    
+    def __iter__(self) -> Iterator[Attraction]:
+        for store in self.stores.values():
+            yield from store
+    
+    def nbytes(self) -> int:
+        return sum(store.nbytes() for store in self.stores.values()) + sum(
+            len(value.encode('utf-8')) for value in self.pool.values)
+
+class CityIndex:
+    """Search structures for one city, built once when attractions are loaded"""
+    
+    # Below this many distinct tokens a scan is cheaper than building the n-gram index
+    TOKEN_INDEX_MIN_TOKENS = 2000
+
+    def __init__(self, attractions: List[Attraction], scoring_engine: str = "python"):
+        self.attractions = attractions
+        self.scoring_engine = scoring_engine
+        self._vector_scorer = None
+        compact = isinstance(attractions, CompactAttractionStore)
+        self.ratings = attractions.ratings if compact else [a.rating for a in attractions]
+        texts = [build_searchable_text(a) for a in attractions]
+        # Compact stores rebuild the text on demand instead of keeping a copy
+        self.texts = None if compact else texts
+
+        # Inverted index: token (words of name, description, tags, ...) -> attraction ids
+        self.postings: Dict[str, List[int]] = {}
+        for attraction_id, text in enumerate(texts):
+            for token in set(text.split()):
+                self.postings.setdefault(token, []).append(attraction_id)
+        if compact:
+            self.postings = {token: array('I', ids) for token, ids in self.postings.items()}
+
+        # Stable rating order, used when no query is given and to fill up top-k
+        self.by_rating = sorted(range(len(attractions)), key=self.ratings.__getitem__, reverse=True)
+        if compact:
+            self.by_rating = array('I', self.by_rating)
+        self._term_matches: Dict[str, frozenset] = {}
+        self._token_index: Optional[NGramIndex] = None
+
+    @property
+    def token_index(self) -> NGramIndex:
+        """N-gram index over the postings tokens, built on first use"""
+        if self._token_index is None:
+            self._token_index = NGramIndex(self.postings)
+        return self._token_index
+
+    def tokens_containing(self, piece: str) -> List[str]:
+        if len(self.postings) < self.TOKEN_INDEX_MIN_TOKENS:
+            return [token for token in self.postings if piece in token]
+        return self.token_index.substring(piece)
+
+    def text(self, attraction_id: int) -> str:
+        if self.texts is not None:
+            return self.texts[attraction_id]
+        return build_searchable_text(self.attractions[attraction_id])
+
+    def matching_ids(self, term: str) -> frozenset:
+        """Ids of attractions whose searchable text contains term as a substring"""
+        matches = self._term_matches.get(term)
+        if matches is not None:
+            return matches
+
+        pieces = term.split()
+        if not pieces:
+            matches = frozenset(range(len(self.attractions)))
+        else:
+            # A word without whitespace can only match inside a single token
+            piece_ids = []
+            for piece in pieces:
+                ids = set()
+                for token in self.tokens_containing(piece):
+                    ids.update(self.postings[token])
+                piece_ids.append(ids)
+            matches = set.intersection(*piece_ids)
+            # Phrases may span tokens, so verify candidates against the full text
+            if len(pieces) > 1 or pieces[0] != term:
+                matches = {i for i in matches if term in self.text(i)}
+            matches = frozenset(matches)
+
+        self._term_matches[term] = matches
+        return matches
+
+    def search(self, query: str, interests: List[str], top_k: int) -> List[Attraction]:
+        """Rank attractions exactly like SimpleTouristDatabase.calculate_relevance_score"""
+        if not query and not interests:
+            return [self.attractions[i] for i in self.by_rating[:top_k]]
+
+        weighted_terms = [(word, 1.0) for word in query.lower().split()] if query else []
+        weighted_terms += [(interest.lower(), 2.0) for interest in interests]
+        if self.scoring_engine == "numpy":
+            if self._vector_scorer is None:
+                self._vector_scorer = VectorCityScorer(self)
+            return self._vector_scorer.search(weighted_terms, top_k)
+
+        term_matches = [(self.matching_ids(term), weight) for term, weight in weighted_terms]
+
+        candidates = set()
+        for ids, _ in term_matches:
+            candidates.update(ids)
+
+        scored = []
+        for attraction_id in candidates:
+            score = self.ratings[attraction_id]
+            for ids, weight in term_matches:
+                if attraction_id in ids:
+                    score += weight
+            scored.append((score, attraction_id))
+
+        # Attractions without any match score their rating only
+        for attraction_id in self.by_rating:
+            if len(scored) >= len(candidates) + top_k:
+                break
+            if attraction_id not in candidates:
+                scored.append((self.ratings[attraction_id], attraction_id))
+
+        scored.sort(key=lambda x: (-x[0], x[1]))
+        return [self.attractions[attraction_id] for _, attraction_id in scored[:top_k]]
+
+class VectorCityScorer:
+    """NumPy scoring engine for one CityIndex.
+    
+    The token -> attraction incidence is kept as a sparse column matrix
+    (indptr/indices, one column per token) next to a rating vector, so a query
+    is scored with a few array operations. Scores and tie order are identical
+    to CityIndex.search.
+    """
+    
+    def __init__(self, index: CityIndex):
+        self.index = index
+        self.columns = {token: column for column, token in enumerate(index.postings)}
+        lengths = np.fromiter((len(ids) for ids in index.postings.values()), dtype=np.int64,
+                              count=len(index.postings))
+        self.indptr = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.indptr[1:])
+        self.indices = np.fromiter(chain.from_iterable(index.postings.values()), dtype=np.int32,
+                                   count=int(self.indptr[-1]))
+        self.ratings = np.array(index.ratings, dtype=np.float64)
+        self._term_masks: Dict[str, "np.ndarray"] = {}
+    
+    def term_mask(self, term: str) -> "np.ndarray":
+        """Boolean vector of attractions whose searchable text contains term"""
+        mask = self._term_masks.get(term)
+        if mask is not None:
+            return mask
+        
+        pieces = term.split()
+        mask = np.ones(len(self.ratings), dtype=bool)
+        for piece in pieces:
+            columns = [self.columns[token] for token in self.index.tokens_containing(piece)]
+            piece_mask = np.zeros(len(self.ratings), dtype=bool)
+            if columns:
+                piece_mask[np.concatenate([self.indices[self.indptr[c]:self.indptr[c + 1]] for c in columns])] = True
+            mask &= piece_mask
+        # Phrases may span tokens, so verify candidates against the full text
+        if pieces and (len(pieces) > 1 or pieces[0] != term):
+            for attraction_id in np.flatnonzero(mask):
+                mask[attraction_id] = term in self.index.text(attraction_id)
+        
+        self._term_masks[term] = mask
+        return mask
+    
+    def search(self, weighted_terms: List[tuple], top_k: int) -> List[Attraction]:
+        scores = self.ratings.copy()
+        for term, weight in weighted_terms:
+            np.add(scores, weight, out=scores, where=self.term_mask(term))
+        
+        top_k = min(top_k, len(scores))
+        if top_k <= 0:
+            return []
+        
+        # argpartition finds the k-th best score; ties at that score are then
+        # taken in catalogue order to match the stable sort of the reference scorer
+        kth_score = scores[np.argpartition(-scores, top_k - 1)[top_k - 1]]
+        above = np.flatnonzero(scores > kth_score)
+        tied = np.flatnonzero(scores == kth_score)[:top_k - above.size]
+        chosen = np.concatenate([above, tied])
+        ranked = chosen[np.lexsort((chosen, -scores[chosen]))]
+        return [self.index.attractions[i] for i in ranked]
+
+class SQLiteConnectionPool:
+    """Thread-safe pool of long-lived SQLite connections.
+    
+    Connections are opened lazily up to max_connections, switched to WAL and
+    tuned with the given pragmas, and reused so that sqlite3's per-connection
+    statement cache keeps the prepared statements of repeated queries. Pool
+    wait time and query latency are recorded for stats().
+    """
+    
+    def __init__(self, db_path: str, max_connections: int = 4, timeout: float = 30.0, wal: bool = True,
+                 mmap_size: int = 256 * 1024 * 1024, cache_size_kb: int = 16 * 1024,
+                 cached_statements: int = 256, latency_window: int = 1024):
+        self.db_path = db_path
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.wal = wal
+        self.mmap_size = mmap_size
+        self.cache_size_kb = cache_size_kb
+        self.cached_statements = cached_statements
+        self.idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self.connections: List[sqlite3.Connection] = []
+        self.wait_times = deque(maxlen=latency_window)
+        self.query_times = deque(maxlen=latency_window)
+        self.counters = {"acquisitions": 0, "waits": 0, "queries": 0, "rows_written": 0,
+                         "wait_total_ms": 0.0, "query_total_ms": 0.0}
+        self._lock = threading.Lock()
+    
+    def open_connection(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, check_same_thread=False,
+                               cached_statements=self.cached_statements)
+        if self.wal:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA mmap_size={int(self.mmap_size)}')
+        conn.execute(f'PRAGMA cache_size={-int(self.cache_size_kb)}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        return conn
+    
+    def acquire(self) -> sqlite3.Connection:
+        start = time.perf_counter()
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                if len(self.connections) < self.max_connections:
+                    conn = self.open_connection()
+                    self.connections.append(conn)
+            if conn is None:
+                try:
+                    conn = self.idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise TimeoutError(f"No database connection available after {self.timeout}s") from None
+                with self._lock:
+                    self.counters["waits"] += 1
+        
+        waited = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.counters["acquisitions"] += 1
+            self.counters["wait_total_ms"] += waited
+            self.wait_times.append(waited)
+        return conn
+    
+    def release(self, conn: sqlite3.Connection):
+        if conn.in_transaction:
+            conn.rollback()
+        self.idle.put(conn)
+    
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+    
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """A pooled connection whose work is committed on success and rolled back on error"""
+        with self.connection() as conn:
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+    
+    def record_query(self, start: float, rows_written: int = 0):
+        elapsed = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.counters["queries"] += 1
+            self.counters["rows_written"] += rows_written
+            self.counters["query_total_ms"] += elapsed
+            self.query_times.append(elapsed)
+    
+    def query(self, sql: str, params: tuple = ()) -> List[tuple]:
+        """Run a read query and return all rows"""
+        with self.connection() as conn:
+            start = time.perf_counter()
+            rows = conn.execute(sql, params).fetchall()
+            self.record_query(start)
+        return rows
+    
+    def execute(self, sql: str, params: tuple = ()) -> int:
+        """Run and commit a single write; returns the number of changed rows"""
+        with self.transaction() as conn:
+            start = time.perf_counter()
+            changed = conn.execute(sql, params).rowcount
+            self.record_query(start, max(changed, 0))
+        return changed
+    
+    def executemany(self, sql: str, rows: Iterable[tuple], batch_size: int = 1000,
+                    then: Optional[Callable[[sqlite3.Connection], None]] = None) -> int:
+        """Write rows with executemany in one transaction, batch_size rows per call.
+        then(conn) runs last, in the same transaction."""
+        total = 0
+        with self.transaction() as conn:
+            batch = []
+            for row in chain(rows, [None]):
+                if row is not None:
+                    batch.append(row)
+                    if len(batch) < batch_size:
+                        continue
+                if batch:
+                    start = time.perf_counter()
+                    conn.executemany(sql, batch)
+                    self.record_query(start, len(batch))
+                    total += len(batch)
+                    batch = []
+            if then is not None:
+                then(conn)
+        return total
+    
+    def stats(self) -> Dict:
+        def percentile(samples: List[float], p: float) -> float:
+            return round(samples[min(len(samples) - 1, int(p / 100 * len(samples)))], 4) if samples else 0.0
+        
+        with self._lock:
+            counters = dict(self.counters)
+            waits, queries = sorted(self.wait_times), sorted(self.query_times)
+            counters["connections"] = len(self.connections)
+            counters["idle"] = self.idle.qsize()
+        counters["wait_mean_ms"] = round(counters.pop("wait_total_ms") / counters["acquisitions"], 4) \
+            if counters["acquisitions"] else 0.0
+        counters["query_mean_ms"] = round(counters.pop("query_total_ms") / counters["queries"], 4) \
+            if counters["queries"] else 0.0
+        counters["wait_p99_ms"] = percentile(waits, 99)
+        counters["query_p50_ms"] = percentile(queries, 50)
+        counters["query_p99_ms"] = percentile(queries, 99)
+        return counters
+    
+    def close(self):
+        with self._lock:
+            for conn in self.connections:
+                conn.close()
+            self.connections = []
+            self.idle = queue.LifoQueue()
+
 class SimpleTouristDatabase:
     """Simple tourist attraction database without ML dependencies"""
-    
-    def __init__(self, db_path: str = "attractions.db"):
+
+    def __init__(self, db_path: str = "attractions.db", lazy: bool = False,
+                 max_cached_cities: int = 256, prewarm_cities: Optional[List[str]] = None,
+                 max_cached_searches: int = 4096, scoring_engine: str = "python", compact: bool = False,
+                 pool: Optional[SQLiteConnectionPool] = None):
+        """With lazy=True attractions are read per city on first use and kept in an
+        LRU of at most max_cached_cities partitions instead of loading the whole table.
+        With compact=True they are held in columnar CompactAttractionStores.
+        All queries go through pool (a SQLiteConnectionPool on db_path by default)."""
+        if scoring_engine not in ("python", "numpy"):
+            raise ValueError(f"Unknown scoring engine: {scoring_engine}")
+        if scoring_engine == "numpy" and np is None:
+            raise ImportError("scoring_engine='numpy' requires NumPy to be installed")
         self.db_path = db_path
+        self.pool = pool or SQLiteConnectionPool(db_path)
+        self.scoring_engine = scoring_engine
+        self.compact = compact
+        self.intern_pool = InternPool()
+        self.lazy = lazy
+        self.max_cached_cities = max_cached_cities
+        self.prewarm_cities = prewarm_cities or []
         self.attractions = []
+        self.city_index: Dict[str, CityIndex] = OrderedDict()
+        self._index_lock = threading.Lock()
+        self._city_resolver: Optional[CityResolver] = None
+        self._city_spellings: Optional[tuple] = None
+        
+        # Memoized search results: (city, query, sorted interests, top_k) -> attractions
+        self.max_cached_searches = max_cached_searches
+        self.search_cache: "OrderedDict[tuple, List[Attraction]]" = OrderedDict()
+        self.search_keys_by_city: Dict[str, set] = {}
+        self.city_generation: Dict[str, int] = {}
+        self.search_cache_counters = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
         self.setup_database()
         
     def setup_database(self):
         """Initialize the database and load sample data"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        with self.pool.transaction() as conn:
+            self.create_schema(conn.cursor())
         
+        if self.lazy:
+            for city in self.prewarm_cities:
+                self.get_city_index(city)
+        else:
+            self.load_attractions()
+    
+    def create_schema(self, cursor):
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS attractions (
                 id INTEGER PRIMARY KEY,
@@ -77,120 +935,395 @@ class SimpleTouristDatabase:
             )
         ''')
         
-        # Sample data for multiple cities (Tokyo removed)
-        sample_attractions = [
-            # Paris, France
-            ("Eiffel Tower", "Paris", "Iconic iron lattice tower and symbol of Paris", "landmark", 4.5, "$", "2-3 hours", "Champ de Mars", "tower,landmark,romantic,architecture,views"),
-            ("Louvre Museum", "Paris", "World's largest art museum housing the Mona Lisa", "museum", 4.6, "$$", "3-4 hours", "Rue de Rivoli", "museum,art,culture,mona lisa,history"),
-            ("Notre-Dame Cathedral", "Paris", "Medieval Catholic cathedral with Gothic architecture", "religious", 4.4, "Free", "1-2 hours", "Île de la Cité", "cathedral,gothic,religious,architecture,historic"),
-            # London, England
-            ("Big Ben", "London", "Iconic clock tower at Palace of Westminster", "landmark", 4.5, "$", "1 hour", "Westminster", "clock,tower,parliament,iconic,historic"),
-            ("British Museum", "London", "World-famous museum with historical artifacts", "museum", 4.7, "Free", "3-4 hours", "Bloomsbury", "museum,history,artifacts,culture,education"),
-            ("Tower of London", "London", "Historic castle housing the Crown Jewels", "historic", 4.4, "$", "2-3 hours", "Tower Hamlets", "castle,crown jewels,historic,medieval,fortress"),
-            # Rome, Italy
-            ("Colosseum", "Rome", "Ancient amphitheater and iconic symbol of Rome", "historic", 4.6, "$$", "2-3 hours", "Palatine Hill", "colosseum,gladiators,ancient,roman,amphitheater"),
-            ("Vatican City", "Rome", "Papal enclave with Sistine Chapel and St. Peter's", "religious", 4.8, "$$", "4-6 hours", "Vatican", "vatican,sistine chapel,pope,religious,art"),
-            ("Trevi Fountain", "Rome", "Baroque fountain where coins bring good luck", "landmark", 4.4, "Free", "30 minutes", "Quirinale", "fountain,baroque,coins,wishes,romantic"),
-            # Milan, Italy
-            ("Milan Cathedral (Duomo)", "Milan", "Gothic cathedral with elaborate spires", "religious", 4.6, "$", "2-3 hours", "Piazza del Duomo", "duomo,gothic,cathedral,spires,architecture"),
-            ("La Scala Opera House", "Milan", "World-famous opera house and museum", "cultural", 4.5, "$$", "1-2 hours", "Brera", "opera,theater,music,culture,performance"),
-            # Madrid, Spain
-            ("Prado Museum", "Madrid", "Premier art museum with Spanish masterpieces", "museum", 4.7, "$$", "3-4 hours", "Centro", "museum,art,spanish masters,goya,velazquez"),
-            ("Royal Palace", "Madrid", "Baroque royal palace with opulent rooms", "historic", 4.4, "$", "2-3 hours", "Centro", "palace,royal,baroque,luxury,spanish royalty"),
-            # Barcelona, Spain
-            ("Sagrada Familia", "Barcelona", "Gaudi's unfinished basilica masterpiece", "religious", 4.8, "$$", "2-3 hours", "Eixample", "gaudi,basilica,modernist,architecture,unesco"),
-            ("Park Güell", "Barcelona", "Whimsical park designed by Antoni Gaudí", "park", 4.6, "$", "2-3 hours", "Gràcia", "gaudi,park,mosaic,architecture,views"),
-            # Berlin, Germany
-            ("Brandenburg Gate", "Berlin", "18th-century neoclassical monument", "landmark", 4.5, "Free", "30 minutes", "Mitte", "gate,neoclassical,historic,symbol,unity"),
-            ("Museum Island", "Berlin", "UNESCO site with five world-class museums", "museum", 4.6, "$$", "4-6 hours", "Mitte", "museums,unesco,art,history,culture"),
-            # Cologne, Germany
-            ("Cologne Cathedral", "Cologne", "Gothic cathedral and UNESCO World Heritage site", "religious", 4.7, "Free", "1-2 hours", "Innenstadt", "cathedral,gothic,unesco,twin towers,religious"),
-            # Amsterdam, Netherlands
-            ("Anne Frank House", "Amsterdam", "Museum in Anne Frank's hiding place", "museum", 4.4, "$$", "1-2 hours", "Jordaan", "anne frank,museum,wwii,history,moving"),
-            ("Van Gogh Museum", "Amsterdam", "World's largest Van Gogh art collection", "museum", 4.6, "$$", "2-3 hours", "Museumplein", "van gogh,art,paintings,museum,impressionist"),
-            # Prague, Czech Republic
-            ("Prague Castle", "Prague", "Largest ancient castle complex in the world", "historic", 4.6, "$", "3-4 hours", "Hradčany", "castle,historic,complex,views,royal"),
-            ("Charles Bridge", "Prague", "Historic stone bridge with statues", "landmark", 4.5, "Free", "1 hour", "Malá Strana", "bridge,historic,statues,vltava,iconic"),
-            ("Old Town Square", "Prague", "Medieval square with astronomical clock", "landmark", 4.4, "Free", "1-2 hours", "Old Town", "square,medieval,astronomical clock,historic,central"),
-            # Vienna, Austria
-            ("Schönbrunn Palace", "Vienna", "Former imperial summer residence", "historic", 4.7, "$$", "3-4 hours", "Hietzing", "palace,imperial,gardens,unesco,royal"),
-            ("St. Stephen's Cathedral", "Vienna", "Gothic cathedral with a distinctive roof", "religious", 4.6, "Free", "1-2 hours", "Innere Stadt", "cathedral,gothic,historic,church,architecture"),
-            # New York
-            ("Central Park", "New York", "Large public park in Manhattan", "park", 4.7, "Free", "2-4 hours", "Manhattan", "park,nature,walking,picnic,peaceful"),
-            ("Statue of Liberty", "New York", "Neoclassical sculpture on Liberty Island", "landmark", 4.5, "$$", "3-4 hours", "Liberty Island", "landmark,statue,liberty,historic,patriotic")
-        ]
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS schema_meta (
+                key TEXT PRIMARY KEY,
+                value INTEGER
+            )
+        ''')
         
-        for attraction in sample_attractions:
-            cursor.execute('''INSERT OR IGNORE INTO attractions 
-                             (name, city, description, category, rating, price_range, duration, location, tags) 
-                             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', attraction)
+        schema_version = self.get_meta(cursor, "schema_version")
+        if schema_version < 2:
+            self.migrate_deduplicate(cursor)
+        if schema_version < 3:
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_attractions_city ON attractions (city COLLATE NOCASE)')
+        if schema_version < 4:
+            self.create_version_counter(cursor)
+        if schema_version < SCHEMA_VERSION:
+            self.set_meta(cursor, "schema_version", SCHEMA_VERSION)
+        self.ensure_indexes(cursor)
         
-        conn.commit()
-        conn.close()
+        if self.get_meta(cursor, "seed_version") < SEED_VERSION:
+            self.seed_attractions(cursor)
+            self.set_meta(cursor, "seed_version", SEED_VERSION)
+            self.bump_catalogue_version(cursor)
+    
+    def create_version_counter(self, cursor):
+        """Identity and write counter of the catalogue in schema_meta, see bump_catalogue_version"""
+        cursor.execute("INSERT OR IGNORE INTO schema_meta (key, value) VALUES ('catalogue_id', ?)",
+                       (int.from_bytes(os.urandom(7), "big"),))
+        cursor.execute("INSERT OR IGNORE INTO schema_meta (key, value) VALUES ('catalogue_version', 0)")
+    
+    def ensure_indexes(self, cursor):
+        """Create missing attraction indexes, e.g. after an import with deferred indexes died.
         
-        self.load_attractions()
+        (city, name) duplicates such an import left behind are resolved in favour of
+        the last imported row first, as the import itself does.
+        """
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'attractions'")
+        existing = {row[0] for row in cursor.fetchall()}
+        if "idx_attractions_city_name" not in existing:
+            cursor.execute('''DELETE FROM attractions WHERE id NOT IN
+                              (SELECT MAX(id) FROM attractions GROUP BY city, name)''')
+            if cursor.rowcount > 0:
+                self.bump_catalogue_version(cursor)
+        for index_name, sql in self.ATTRACTION_INDEXES.items():
+            if index_name not in existing:
+                cursor.execute(sql)
+    
+    @staticmethod
+    def bump_catalogue_version(cursor):
+        """Count one write transaction to attractions; call it inside that transaction"""
+        cursor.execute("UPDATE schema_meta SET value = value + 1 WHERE key = 'catalogue_version'")
+    
+    # Writes made through this object are seen at once, other writers within this many seconds
+    VERSION_CHECK_INTERVAL = 1.0
+    
+    def catalogue_version(self) -> str:
+        """Identity and write count of the catalogue; changes with every write made through this class"""
+        checked = getattr(self, "_catalogue_version", None)
+        now = time.monotonic()
+        if checked is None or now - checked[0] >= self.VERSION_CHECK_INTERVAL:
+            meta = dict(self.pool.query(
+                "SELECT key, value FROM schema_meta WHERE key IN ('catalogue_id', 'catalogue_version')"))
+            checked = self._catalogue_version = (now, f"{meta.get('catalogue_id', 0):x}.{meta.get('catalogue_version', 0)}")
+        return checked[1]
+    
+    def get_meta(self, cursor, key: str) -> int:
+        cursor.execute('SELECT value FROM schema_meta WHERE key = ?', (key,))
+        row = cursor.fetchone()
+        return row[0] if row else 0
+    
+    def set_meta(self, cursor, key: str, value: int):
+        cursor.execute('INSERT OR REPLACE INTO schema_meta (key, value) VALUES (?, ?)', (key, value))
+    
+    def migrate_deduplicate(self, cursor):
+        """One-off migration: drop duplicate (city, name) rows and enforce uniqueness"""
+        cursor.execute('''DELETE FROM attractions WHERE id NOT IN
+                          (SELECT MIN(id) FROM attractions GROUP BY city, name)''')
+        if cursor.rowcount > 0:
+            logger.info("Removed %d duplicate attractions", cursor.rowcount)
+        cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_attractions_city_name ON attractions (city, name)')
+    
+    def seed_attractions(self, cursor):
+        """Insert sample attractions that are missing and update the ones that changed"""
+        cursor.execute('''SELECT city, name, description, category, rating, price_range, duration, location, tags
+                          FROM attractions''')
+        existing = {(row[0], row[1]): row[2:] for row in cursor.fetchall()}
+        
+        for attraction in SAMPLE_ATTRACTIONS:
+            name, city = attraction[0], attraction[1]
+            current = existing.get((city, name))
+            if current is None:
+                cursor.execute('''INSERT INTO attractions 
+                                 (name, city, description, category, rating, price_range, duration, location, tags) 
+                                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', attraction)
+            elif tuple(current) != attraction[2:]:
+                cursor.execute('''UPDATE attractions SET description = ?, category = ?, rating = ?,
+                                 price_range = ?, duration = ?, location = ?, tags = ?
+                                 WHERE city = ? AND name = ?''', attraction[2:] + (city, name))
     
     def load_attractions(self):
         """Load attractions from database into memory"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        rows = self.pool.query('SELECT * FROM attractions')
         
-        cursor.execute('SELECT * FROM attractions')
-        rows = cursor.fetchall()
+        if self.compact:
+            self.attractions = CompactCatalogue(self.intern_pool)
+            for row in rows:
+                self.attractions.append_row(row)
+        else:
+            self.attractions = [self.row_to_attraction(row) for row in rows]
         
-        self.attractions = []
-        for row in rows:
-            attraction = Attraction(
-                name=row[1],
-                city=row[2],  # Store city explicitly
-                description=row[3],
-                category=row[4],
-                rating=row[5],
-                price_range=row[6],
-                duration=row[7],
-                location=row[8],
-                tags=row[9].split(',') if row[9] else []
-            )
-            self.attractions.append(attraction)
+        self.build_indexes()
+    
+    def row_to_attraction(self, row) -> Attraction:
+        return Attraction(
+            name=row[1],
+            city=row[2],  # Store city explicitly
+            description=row[3],
+            category=row[4],
+            rating=row[5],
+            price_range=row[6],
+            duration=row[7],
+            location=row[8],
+            tags=row[9].split(',') if row[9] else []
+        )
+    
+    def city_spellings(self) -> Dict[str, set]:
+        """city_key() -> the spellings stored in the city column, rebuilt when the catalogue changes"""
+        version = self.catalogue_version()
+        cached = self._city_spellings
+        if cached is None or cached[0] != version:
+            spellings: Dict[str, set] = {}
+            for (city,) in self.pool.query('SELECT DISTINCT city FROM attractions'):
+                spellings.setdefault(city_key(city), set()).add(city)
+            cached = self._city_spellings = (version, spellings)
+        return cached[1]
+    
+    def load_city(self, city: str) -> List[Attraction]:
+        """Load the attractions of a single city, using the (city, name) index"""
+        # SQL cannot fold case beyond ASCII or collapse spaces like city_key(), so look up the exact spellings
+        spellings = sorted(self.city_spellings().get(city_key(city), ()))
+        rows = self.pool.query(f'SELECT * FROM attractions WHERE city IN ({", ".join("?" * len(spellings))}) '
+                               'ORDER BY id', tuple(spellings)) if spellings else []
+        if self.compact:
+            store = CompactAttractionStore(self.intern_pool)
+            for row in rows:
+                store.append_row(row)
+            return store
+        return [self.row_to_attraction(row) for row in rows]
+    
+    def get_city_index(self, city: str) -> Optional[CityIndex]:
+        """Return the search index for a normalized (lowercased) city name"""
+        city = city_key(city)
+        with self._index_lock:
+            index = self.city_index.get(city)
+            if index is not None or not self.lazy:
+                if index is not None and self.lazy:
+                    self.city_index.move_to_end(city)
+                return index
         
-        conn.close()
+        attractions = self.load_city(city)
+        if not attractions:
+            return None  # not cached, so unknown cities cannot push known ones out of the LRU
+        index = self.new_city_index(attractions)
+        with self._index_lock:
+            self.city_index[city] = index
+            self.city_index.move_to_end(city)
+            while len(self.city_index) > self.max_cached_cities:
+                self.city_index.popitem(last=False)
+        return index
+
+    def build_indexes(self):
+        """Group attractions by normalized city and build a search index per city"""
+        if self.compact:
+            self.city_index = OrderedDict((city, self.new_city_index(store))
+                                          for city, store in self.attractions.stores.items())
+            return
+        by_city: Dict[str, List[Attraction]] = {}
+        for attraction in self.attractions:
+            by_city.setdefault(city_key(attraction.city), []).append(attraction)
+        self.city_index = OrderedDict((city, self.new_city_index(attractions)) for city, attractions in by_city.items())
+    
+    def new_city_index(self, attractions: List[Attraction]) -> CityIndex:
+        return CityIndex(attractions, self.scoring_engine)
     
     def search_attractions(self, city: str, query: str = "", interests: List[str] = None, top_k: int = 10) -> List[Attraction]:
         """Search for attractions using city field and optional query/interests"""
-        # Filter by city (case-insensitive exact match on city field)
-        city = city.strip().capitalize()  # Normalize city name
-        city_attractions = [a for a in self.attractions if a.city.lower() == city.lower()]
+        # Case-insensitive match on the city field; aliases and typos resolve to a known city
+        key_city = city_key(city)
+        index = self.get_city_index(key_city)
+        if index is None or not index.attractions:
+            resolved = self.resolve_city(city)
+            index = self.get_city_index(resolved) if resolved else None
+            if index is None or not index.attractions:
+                rate_limited_log.warning("no-attractions-db", "No attractions found for %s", city.strip())
+                return []
+            key_city = city_key(resolved)
+        
+        # Scoring lowercases terms and adds the same weight per matching interest,
+        # so neither case nor interest order changes the ranking
+        key = (key_city, " ".join((query or "").lower().split()),
+               tuple(sorted(interest.lower() for interest in interests or [])), top_k)
+        with self._index_lock:
+            cached = self.search_cache.get(key)
+            if cached is not None:
+                self.search_cache.move_to_end(key)
+                self.search_cache_counters["hits"] += 1
+                return list(cached)
+            self.search_cache_counters["misses"] += 1
+            generation = self.city_generation.get(key_city, 0)
+        
+        results = index.search(query, interests or [], top_k)
         
-        if not city_attractions:
-            print(f"⚠️ No attractions found for {city}")
+        with self._index_lock:
+            # Skip storing if the city was invalidated while we were searching
+            if self.city_generation.get(key_city, 0) == generation:
+                self.search_cache[key] = results
+                self.search_keys_by_city.setdefault(key_city, set()).add(key)
+                while len(self.search_cache) > self.max_cached_searches:
+                    evicted, _ = self.search_cache.popitem(last=False)
+                    self.search_keys_by_city[evicted[0]].discard(evicted)
+                    self.search_cache_counters["evictions"] += 1
+        return list(results)
+    
+    def city_resolver(self) -> CityResolver:
+        """Resolver over the catalogue's cities (all of them, also when lazy)"""
+        resolver = self._city_resolver
+        if resolver is None:
+            if self.lazy:
+                cities = [row[0] for row in self.pool.query('SELECT DISTINCT city FROM attractions')]
+            else:
+                cities = [index.attractions[0].city for index in list(self.city_index.values()) if index.attractions]
+            resolver = self._city_resolver = CityResolver(city for city in cities if city)
+        return resolver
+    
+    def resolve_city(self, city: str) -> Optional[str]:
+        return self.city_resolver().resolve(city)
+    
+    def suggest_terms(self, city: str, text: str, limit: int = 10) -> List[str]:
+        """Attraction tokens of city completing text, or close to it when nothing starts with it"""
+        resolved = self.resolve_city(city)
+        index = self.get_city_index(resolved) if resolved else None
+        term = (text or "").strip().lower()
+        if index is None or not term:
             return []
+        completions = index.token_index.prefix(term, limit)
+        return completions or [token for _, token in index.token_index.similar(term, limit, min_score=0.4)]
+    
+    def search_cache_stats(self) -> Dict:
+        with self._index_lock:
+            counters = dict(self.search_cache_counters)
+            lookups = counters["hits"] + counters["misses"]
+            counters["size"] = len(self.search_cache)
+            counters["cities"] = sum(1 for keys in self.search_keys_by_city.values() if keys)
+            counters["hit_rate"] = round(counters["hits"] / lookups, 4) if lookups else 0.0
+            return counters
+    
+    def invalidate_city(self, city: str):
+        """Drop the cached index and search results of one city"""
+        normalized = city_key(city)
+        self._catalogue_version = None
+        with self._index_lock:
+            for key in self.search_keys_by_city.pop(normalized, ()):
+                self.search_cache.pop(key, None)
+            self.search_cache_counters["invalidations"] += 1
+            self.city_generation[normalized] = self.city_generation.get(normalized, 0) + 1
+            if self._city_resolver is not None:
+                self._city_resolver.add(city.strip())
+            if self.lazy:
+                self.city_index.pop(normalized, None)
+        if self._city_spellings is not None:
+            # Keep the spellings current for this process's own writes instead of rescanning
+            spellings = self._city_spellings[1]
+            spellings[normalized] = spellings.get(normalized, set()) | {city}
+            self._city_spellings = (self.catalogue_version(), spellings)
+        if self.lazy:
+            return
         
-        # If no query or interests, return top-rated attractions
-        if not query and not interests:
-            return sorted(city_attractions, key=lambda x: x.rating, reverse=True)[:top_k]
+        attractions = self.load_city(normalized)
+        with self._index_lock:
+            if self.compact:
+                self.attractions.replace_city(normalized, attractions)
+            else:
+                self.attractions = [a for a in self.attractions if city_key(a.city) != normalized] + attractions
+            if attractions:
+                self.city_index[normalized] = self.new_city_index(attractions)
+            else:
+                self.city_index.pop(normalized, None)
+    
+    ATTRACTION_INDEXES = {
+        "idx_attractions_city_name": 'CREATE UNIQUE INDEX IF NOT EXISTS idx_attractions_city_name ON attractions (city, name)',
+        "idx_attractions_city": 'CREATE INDEX IF NOT EXISTS idx_attractions_city ON attractions (city COLLATE NOCASE)',
+    }
+    
+    INSERT_ATTRACTION = '''INSERT INTO attractions 
+                           (name, city, description, category, rating, price_range, duration, location, tags) 
+                           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)'''
+    
+    def attraction_to_row(self, attraction: Attraction) -> tuple:
+        return (attraction.name, attraction.city, attraction.description, attraction.category,
+                attraction.rating, attraction.price_range, attraction.duration, attraction.location,
+                ",".join(attraction.tags or []))
+    
+    def write(self, sql: str, params: tuple = ()) -> int:
+        """pool.execute for attractions writes, counted in catalogue_version in the same transaction"""
+        with self.pool.transaction() as conn:
+            start = time.perf_counter()
+            changed = conn.execute(sql, params).rowcount
+            self.pool.record_query(start, max(changed, 0))
+            self.bump_catalogue_version(conn)
+        return changed
+    
+    def add_attraction(self, attraction: Attraction):
+        self.write(self.INSERT_ATTRACTION, self.attraction_to_row(attraction))
+        self.invalidate_city(attraction.city)
+    
+    def add_attractions(self, attractions: Iterable[Attraction], batch_size: int = 1000) -> int:
+        """Bulk insert with batched executemany in a single transaction; returns the row count"""
+        cities = set()
+        
+        def rows():
+            for attraction in attractions:
+                cities.add(attraction.city)
+                yield self.attraction_to_row(attraction)
         
-        # Score attractions based on query and interests
-        scored_attractions = []
-        for attraction in city_attractions:
-            score = self.calculate_relevance_score(attraction, query, interests or [])
-            scored_attractions.append((attraction, score))
+        count = self.pool.executemany(self.INSERT_ATTRACTION, rows(), batch_size, then=self.bump_catalogue_version)
+        for city in cities:
+            self.invalidate_city(city)
+        return count
+    
+    def reload(self, cities: Iterable[str] = ()):
+        """Drop every cached index and search result, e.g. after a bulk import"""
+        self._catalogue_version = None
+        with self._index_lock:
+            stale = set(self.city_index) | set(self.search_keys_by_city) | {city_key(c) for c in cities}
+            for normalized in stale:
+                self.city_generation[normalized] = self.city_generation.get(normalized, 0) + 1
+            self.search_cache.clear()
+            self.search_keys_by_city.clear()
+            self.search_cache_counters["invalidations"] += 1
+            self._city_resolver = None
+            self._city_spellings = None
+            if self.lazy:
+                self.city_index.clear()
+                return
+        self.load_attractions()
+    
+    def connection_stats(self) -> Dict:
+        return self.pool.stats()
+    
+    def close(self):
+        self.pool.close()
+    
+    def update_attraction(self, city: str, name: str, **fields):
+        """Update columns (description, rating, tags, ...) of the attraction named name in city"""
+        allowed = {"description", "category", "rating", "price_range", "duration", "location", "tags"}
+        unknown = set(fields) - allowed
+        if unknown:
+            raise ValueError(f"Unknown attraction fields: {', '.join(sorted(unknown))}")
+        if not fields:
+            return
+        if isinstance(fields.get("tags"), list):
+            fields["tags"] = ",".join(fields["tags"])
         
-        # Sort by score and return top k
-        scored_attractions.sort(key=lambda x: x[1], reverse=True)
-        return [attraction for attraction, score in scored_attractions[:top_k]]
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        self.write(f'UPDATE attractions SET {assignments} WHERE city = ? AND name = ?',
+                   tuple(fields.values()) + (city, name))
+        self.invalidate_city(city)
+    
+    def delete_attraction(self, city: str, name: str):
+        self.write('DELETE FROM attractions WHERE city = ? AND name = ?', (city, name))
+        self.invalidate_city(city)
+    
+    def search_attractions_reference(self, city: str, query: str = "", interests: List[str] = None,
+                                     top_k: int = 10) -> List[Attraction]:
+        """Unindexed full scan with calculate_relevance_score; the reference ranking"""
+        city = city_key(city)
+        index = self.get_city_index(city)
+        city_attractions = index.attractions if index else []
+        if not query and not interests:
+            return sorted(city_attractions, key=lambda x: x.rating, reverse=True)[:top_k]
+        scored = [(a, self.calculate_relevance_score(a, query, interests or [])) for a in city_attractions]
+        scored.sort(key=lambda x: x[1], reverse=True)
+        return [attraction for attraction, score in scored[:top_k]]
     
     def calculate_relevance_score(self, attraction: Attraction, query: str, interests: List[str]) -> float:
         """Calculate relevance score for an attraction"""
         score = attraction.rating  # Base score from rating
         
         # Text fields to search in
-        searchable_text = " ".join([
-            attraction.name,
-            attraction.description,
-            attraction.category,
-            attraction.location,
-            " ".join(attraction.tags)
-        ]).lower()
+        searchable_text = build_searchable_text(attraction)
         
         # Query matching
         if query:
@@ -214,11 +1347,411 @@ class SimpleTouristDatabase:
         
         return score
 
-class SimpleWebSearchTool:
-    """Simplified web search tool for flights and hotels"""
+@dataclass
+class ImportReport:
+    source: str
+    rows_read: int = 0
+    rows_imported: int = 0
+    rows_skipped: int = 0
+    resumed_from: int = 0
+    seconds: float = 0.0
+    errors: List[str] = field(default_factory=list)
+    
+    @property
+    def rows_per_second(self) -> float:
+        return round(self.rows_read / self.seconds, 1) if self.seconds > 0 else 0.0
+
+def read_dump_records(path: str, skip: int = 0) -> Iterator[Tuple[int, object]]:
+    """Yield (record number, dict or parse error) for each CSV/NDJSON record (.gz allowed) after the first skip"""
+    opener = gzip.open if path.endswith(".gz") else open
+    name = path[:-3] if path.endswith(".gz") else path
+    with opener(path, "rt", encoding="utf-8", newline="") as f:
+        if name.endswith(".csv"):
+            for number, record in enumerate(csv.DictReader(f), 1):
+                if number > skip:
+                    yield number, record
+            return
+        number = 0
+        for line in f:
+            if not line.strip():
+                continue
+            number += 1
+            if number <= skip:
+                continue
+            try:
+                yield number, json.loads(line)
+            except ValueError as e:
+                yield number, e
+
+class AttractionImporter:
+    """Streaming bulk import of attraction dumps (CSV or NDJSON, optionally gzipped).
+    
+    Records are validated and normalized into attractions rows and inserted with
+    executemany, batch_size rows per transaction. The transaction also records how
+    many records of the file are done, so an interrupted import resumes after the
+    last committed batch. With defer_indexes=True the attraction indexes are
+    dropped during the load and rebuilt at the end, even if the import fails;
+    (city, name) duplicates are then resolved in favour of the last imported
+    row, as with the unique index.
+    """
+    
+    FIELDS = ("name", "city", "description", "category", "rating", "price_range", "duration", "location", "tags")
+    PRICE_RANGES = {"free": "Free", "$": "$", "$$": "$$", "$$$": "$$$", "$$$$": "$$$$"}
+    MAX_ERRORS = 20
+    
+    def __init__(self, db: SimpleTouristDatabase, batch_size: int = 10000, defer_indexes: bool = True,
+                 verbose: bool = True):
+        self.db = db
+        self.batch_size = batch_size
+        self.defer_indexes = defer_indexes
+        self.verbose = verbose
+        with db.pool.transaction() as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS import_progress (
+                                source TEXT PRIMARY KEY,
+                                signature TEXT,
+                                records_done INTEGER,
+                                rows_imported INTEGER,
+                                rows_skipped INTEGER,
+                                completed INTEGER
+                            )''')
+    
+    def read_records(self, path: str, skip: int = 0) -> Iterator[Tuple[int, object]]:
+        return read_dump_records(path, skip)
+    
+    def normalize(self, record) -> tuple:
+        """Validate one record and return it as an attractions row; raises ValueError"""
+        if isinstance(record, Exception):
+            raise ValueError(f"invalid JSON: {record}")
+        if not isinstance(record, dict):
+            raise ValueError("record is not an object")
+        
+        def text(key: str, default: str = "") -> str:
+            value = record.get(key)
+            return " ".join(str(value).split()) if value is not None else default
+        
+        name, city = text("name"), text("city")
+        if not name or not city:
+            raise ValueError("name and city are required")
+        
+        try:
+            rating = float(record.get("rating") or 0.0)
+        except (TypeError, ValueError):
+            raise ValueError(f"invalid rating {record.get('rating')!r}") from None
+        if not 0.0 <= rating <= 5.0:
+            raise ValueError(f"rating {rating} outside 0-5")
+        
+        price = record.get("price_range")
+        if isinstance(price, (int, float)) or (isinstance(price, str) and price.strip().replace(".", "", 1).isdigit()):
+            amount = float(price)
+            price_range = next((label for label, limit in (("Free", 0), ("$", 15), ("$$", 30), ("$$$", 50))
+                                if amount <= limit), "$$$$")
+        else:
+            price_range = self.PRICE_RANGES.get(text("price_range", "free").lower())
+            if price_range is None:
+                raise ValueError(f"invalid price_range {price!r}")
+        
+        duration = record.get("duration")
+        if isinstance(duration, (int, float)):
+            duration = f"{duration:g} hour" + ("" if duration == 1 else "s")
+        else:
+            duration = text("duration")
+        
+        tags = record.get("tags") or []
+        if isinstance(tags, str):
+            tags = re.split(r"[,;|]", tags)
+        tags = list(dict.fromkeys(t for t in (" ".join(str(tag).lower().split()) for tag in tags) if t))
+        
+        return (name, city, text("description"), text("category").lower(), rating, price_range,
+                duration, text("location"), ",".join(tags))
+    
+    def signature(self, path: str) -> str:
+        stat = os.stat(path)
+        return f"{stat.st_size}:{int(stat.st_mtime)}"
+    
+    def import_file(self, path: str, restart: bool = False) -> ImportReport:
+        source = os.path.abspath(path)
+        signature = self.signature(path)
+        report = ImportReport(source=source)
+        
+        row = self.db.pool.query('''SELECT signature, records_done, rows_imported, rows_skipped, completed
+                                   FROM import_progress WHERE source = ?''', (source,))
+        if row and not restart and row[0][0] == signature:
+            _, report.resumed_from, report.rows_imported, report.rows_skipped, completed = row[0]
+            if completed:
+                if self.verbose:
+                    logger.info("%s was already imported", path)
+                return report
+            if self.verbose:
+                logger.info("Resuming %s after record %d", path, report.resumed_from)
+        
+        if self.defer_indexes:
+            with self.db.pool.transaction() as conn:
+                for index_name in SimpleTouristDatabase.ATTRACTION_INDEXES:
+                    conn.execute(f'DROP INDEX IF EXISTS {index_name}')
+        
+        insert = self.db.INSERT_ATTRACTION.replace("INSERT INTO", "INSERT OR REPLACE INTO", 1)
+        records_done = report.resumed_from
+        cities = set()
+        start = time.perf_counter()
+        batch = []
+        try:
+            for number, record in chain(self.read_records(path, report.resumed_from), [(None, None)]):
+                if number is not None:
+                    report.rows_read += 1
+                    records_done = number
+                    try:
+                        batch.append(self.normalize(record))
+                        cities.add(batch[-1][1].lower())
+                    except ValueError as e:
+                        report.rows_skipped += 1
+                        if len(report.errors) < self.MAX_ERRORS:
+                            report.errors.append(f"record {number}: {e}")
+                    if len(batch) < self.batch_size:
+                        continue
+                self.commit_batch(insert, batch, source, signature, records_done, report, completed=number is None)
+                batch = []
+                if self.verbose and number is not None:
+                    rate_limited_log.info("import-progress", "Imported %s: %d records (%.0f rows/s)", path,
+                                          records_done, report.rows_read / (time.perf_counter() - start))
+        finally:
+            # Also on errors; if the process is killed, the next SimpleTouristDatabase restores them
+            if self.defer_indexes:
+                with self.db.pool.transaction() as conn:
+                    self.db.ensure_indexes(conn.cursor())
+        report.seconds = round(time.perf_counter() - start, 3)
+        
+        self.db.reload(cities)
+        if self.verbose:
+            logger.info("Imported %d attractions from %s, skipped %d (%.0f rows/s)", report.rows_imported, path,
+                        report.rows_skipped, report.rows_per_second)
+        return report
+    
+    def commit_batch(self, insert: str, batch: List[tuple], source: str, signature: str,
+                     records_done: int, report: ImportReport, completed: bool):
+        """Insert batch and record progress in the same transaction"""
+        with self.db.pool.transaction() as conn:
+            start = time.perf_counter()
+            if batch:
+                conn.executemany(insert, batch)
+            report.rows_imported += len(batch)
+            # Once per committed batch, so an import that is interrupted still changes the version
+            self.db.bump_catalogue_version(conn)
+            conn.execute('''INSERT OR REPLACE INTO import_progress
+                            (source, signature, records_done, rows_imported, rows_skipped, completed)
+                            VALUES (?, ?, ?, ?, ?, ?)''',
+                         (source, signature, records_done, report.rows_imported, report.rows_skipped, int(completed)))
+            self.db.pool.record_query(start, len(batch))
+
+DEFAULT_PRICING = {
+    "average_meal": 25.00,
+    "local_transport": 3.50,
+    "attraction_avg": 15.00,
+    "currency": "USD"
+}
+
+def hotel_value(hotel: HotelOption) -> float:
+    """Quality for the money used to pick the recommended hotel"""
+    return hotel.rating - (hotel.price_per_night / 100)
+
+class ReadOnlyDict(dict):
+    """dict that refuses changes; still a dict for json and isinstance, and picklable"""
+    
+    def _read_only(self, *args, **kwargs):
+        raise TypeError(f"{type(self).__name__} is read-only")
+    
+    __setitem__ = __delitem__ = __ior__ = clear = pop = popitem = setdefault = update = _read_only
+    
+    def __reduce__(self):
+        return type(self), (dict(self),)
+
+class PricedOptions(list):
+    """Flight or hotel options, in their listed order, with a price-sorted view for range queries.
+    
+    Equal prices keep their listed order. best_value uses a prefix arg-max over
+    the price order, so the best option under any price cap is one bisect away.
+    """
+    
+    def __init__(self, options: Iterable = (), price: str = "price", value=None):
+        super().__init__(options)
+        self.price = price
+        self.value = value
+        self.positions = sorted(range(len(self)), key=lambda i: getattr(self[i], price))
+        self.by_price = [self[i] for i in self.positions]
+        self.prices = [getattr(option, price) for option in self.by_price]
+        self._best: Optional[List[int]] = None
+        self.source = None
+    
+    def count_affordable(self, max_price: float) -> int:
+        return bisect.bisect_right(self.prices, max_price)
+    
+    def affordable(self, max_price: float) -> list:
+        """Options priced at most max_price, cheapest first"""
+        return self.by_price[:self.count_affordable(max_price)]
+    
+    def cheapest(self):
+        return self.by_price[0] if self.by_price else None
+    
+    def best_value(self, max_price: float):
+        """Highest value option priced at most max_price (first listed on ties), or None"""
+        end = self.count_affordable(max_price)
+        if end == 0:
+            return None
+        if self._best is None:
+            best, best_key = [], None
+            for i, option in enumerate(self.by_price):
+                key = (self.value(option), -self.positions[i])
+                if best_key is None or key > best_key:
+                    best_key, winner = key, i
+                best.append(winner)
+            self._best = best
+        return self.by_price[self._best[end - 1]]
+
+class ProviderStore:
+    """Flight and hotel fares by city and date, kept sorted by price.
+    
+    A table loaded for a date takes precedence over the city's dateless table,
+    which takes precedence over the defaults passed in by the caller. Flight
+    dates are departure dates; hotel dates are check-in dates and their price
+    is the nightly rate for a stay starting then. Cities match by city_key.
+    """
     
     def __init__(self):
-        self.flight_data = {
+        self.flight_tables: Dict[Tuple[str, Optional[str]], List[FlightOption]] = {}
+        self.hotel_tables: Dict[Tuple[str, Optional[str]], List[HotelOption]] = {}
+        self.pricing: Dict[str, Dict] = {}
+        self.names: Dict[str, str] = {}
+        self._sorted: Dict[tuple, PricedOptions] = {}
+        # Digest of everything added, in order: equal after loading the same files
+        self.digest = hashlib.sha1()
+    
+    @property
+    def version(self) -> str:
+        return self.digest.hexdigest()[:16]
+    
+    def __len__(self) -> int:
+        return sum(map(len, self.flight_tables.values())) + sum(map(len, self.hotel_tables.values()))
+    
+    def city(self, city: str) -> str:
+        key = city_key(city)
+        self.names.setdefault(key, city.strip())
+        return key
+    
+    def add_flight(self, city: str, flight: FlightOption, date: Optional[str] = None):
+        key = (self.city(city), date)
+        self.digest.update(repr(("flight", key, flight)).encode('utf-8'))
+        self.flight_tables.setdefault(key, []).append(flight)
+        self._sorted.pop(("flights",) + key, None)
+    
+    def add_hotel(self, city: str, hotel: HotelOption, date: Optional[str] = None):
+        key = (self.city(city), date)
+        self.digest.update(repr(("hotel", key, hotel)).encode('utf-8'))
+        self.hotel_tables.setdefault(key, []).append(hotel)
+        self._sorted.pop(("hotels",) + key, None)
+    
+    def set_pricing(self, city: str, pricing: Dict):
+        key = self.city(city)
+        self.digest.update(repr(("pricing", key, sorted(pricing.items()))).encode('utf-8'))
+        self.pricing[key] = pricing
+    
+    def cities(self) -> List[str]:
+        return list(self.names.values())
+    
+    def dates(self, city: str, kind: str = "flights") -> List[str]:
+        """Dates with their own fare table for city, sorted"""
+        key = city_key(city)
+        tables = self.flight_tables if kind == "flights" else self.hotel_tables
+        return sorted(date for table_city, date in tables if table_city == key and date is not None)
+    
+    def priced(self, kind: str, key: tuple, options: List, price: str, value=None) -> PricedOptions:
+        cached = self._sorted.get((kind,) + key)
+        # Defaults are owned by the caller, so re-sort them whenever they are replaced or resized
+        if cached is None or cached.source is not options or len(cached) != len(options):
+            cached = self._sorted[(kind,) + key] = PricedOptions(options, price, value)
+            cached.source = options
+        return cached
+    
+    def lookup(self, kind: str, tables: Dict, city: str, date: Optional[str], default: List,
+               price: str, value=None) -> PricedOptions:
+        key = city_key(city)
+        if date is not None and not ISO_DATE.fullmatch(date):
+            try:
+                date = datetime.strptime(date, "%Y-%m-%d").strftime("%Y-%m-%d")
+            except ValueError:
+                pass
+        for table_key in ((key, date), (key, None)):
+            table = tables.get(table_key)
+            if table is not None:
+                return self.priced(kind, table_key, table, price, value)
+        return self.priced(kind, ("default", key), default, price, value)
+    
+    def flights(self, city: str, date: Optional[str] = None, default: List[FlightOption] = ()) -> PricedOptions:
+        return self.lookup("flights", self.flight_tables, city, date, default, "price")
+    
+    def hotels(self, city: str, date: Optional[str] = None, default: List[HotelOption] = ()) -> PricedOptions:
+        return self.lookup("hotels", self.hotel_tables, city, date, default, "price_per_night", hotel_value)
+    
+    def add_record(self, record: Dict):
+        """Add one fare record (type flight, hotel or pricing); raises ValueError"""
+        if isinstance(record, Exception):
+            raise ValueError(f"invalid JSON: {record}")
+        if not isinstance(record, dict):
+            raise ValueError("record is not an object")
+        kind, city = str(record.get("type") or "").strip().lower(), str(record.get("city") or "").strip()
+        if not city:
+            raise ValueError("city is required")
+        date = str(record.get("date") or "").strip() or None
+        if date is not None:
+            # Zero-padded, so 2024-9-01 matches lookups for 2024-09-01
+            date = datetime.strptime(date, "%Y-%m-%d").strftime("%Y-%m-%d")
+        
+        def number(name: str) -> float:
+            try:
+                return float(record[name])
+            except (KeyError, TypeError, ValueError):
+                raise ValueError(f"invalid {name} {record.get(name)!r}") from None
+        
+        if kind == "flight":
+            self.add_flight(city, FlightOption(str(record.get("airline") or ""), str(record.get("departure") or ""),
+                                               str(record.get("arrival") or ""), number("price"),
+                                               str(record.get("duration") or "")), date)
+        elif kind == "hotel":
+            amenities = record.get("amenities") or []
+            if isinstance(amenities, str):
+                amenities = [a.strip() for a in amenities.split(";") if a.strip()]
+            self.add_hotel(city, HotelOption(str(record.get("name") or ""), number("rating"),
+                                             number("price_per_night"), str(record.get("location") or ""),
+                                             amenities), date)
+        elif kind == "pricing":
+            self.set_pricing(city, {"average_meal": number("average_meal"),
+                                    "local_transport": number("local_transport"),
+                                    "attraction_avg": number("attraction_avg"),
+                                    "currency": str(record.get("currency") or DEFAULT_PRICING["currency"])})
+        else:
+            raise ValueError(f"unknown type {record.get('type')!r}")
+        return kind
+    
+    def load(self, path: str) -> Dict[str, int]:
+        """Load fares from a CSV/NDJSON file (.gz allowed); bad records are skipped and logged"""
+        counts = {"flight": 0, "hotel": 0, "pricing": 0, "skipped": 0}
+        for number, record in read_dump_records(path):
+            try:
+                counts[self.add_record(record)] += 1
+            except ValueError as e:
+                counts["skipped"] += 1
+                rate_limited_log.warning("fare-record", "Skipping fare record %s:%d: %s", path, number, e)
+        return counts
+
+class SimpleWebSearchTool:
+    """Simplified web search tool for flights and hotels.
+    
+    flight_data, hotel_data and pricing_data are the built-in fares; fares loaded
+    into self.fares (per date, see ProviderStore) take precedence over them. The
+    tables are read-only: set_flights, set_hotels and set_pricing replace a city's
+    entry and keep data_version current.
+    """
+    
+    def __init__(self, fare_files: Iterable[str] = ()):
+        flights = {
             "Paris": [
                 FlightOption("Air France", "8:00 AM", "2:00 PM", 485.00, "6h 0m"),
                 FlightOption("Delta", "10:30 AM", "4:45 PM", 520.00, "6h 15m"),
@@ -269,7 +1802,7 @@ class SimpleWebSearchTool:
             ]
         }
         
-        self.hotel_data = {
+        hotels = {
             "Paris": [
                 HotelOption("Le Grand Hotel Paris", 4.7, 285.00, "Opera District", ["WiFi", "Spa", "Restaurant"]),
                 HotelOption("Budget Inn Paris", 3.8, 95.00, "République", ["WiFi", "Breakfast"]),
@@ -320,7 +1853,7 @@ class SimpleWebSearchTool:
             ]
         }
         
-        self.pricing_data = {
+        pricing = {
             "Paris": {"average_meal": 35.00, "local_transport": 2.50, "attraction_avg": 25.00, "currency": "EUR"},
             "London": {"average_meal": 32.00, "local_transport": 4.50, "attraction_avg": 28.00, "currency": "GBP"},
             "Rome": {"average_meal": 22.00, "local_transport": 1.50, "attraction_avg": 18.00, "currency": "EUR"},
@@ -334,70 +1867,1540 @@ class SimpleWebSearchTool:
             "Vienna": {"average_meal": 25.00, "local_transport": 2.80, "attraction_avg": 20.00, "currency": "EUR"},
             "New York": {"average_meal": 35.00, "local_transport": 3.50, "attraction_avg": 25.00, "currency": "USD"}
         }
+        
+        self.flight_data: Dict[str, Tuple[FlightOption, ...]] = ReadOnlyDict()
+        self.hotel_data: Dict[str, Tuple[HotelOption, ...]] = ReadOnlyDict()
+        self.pricing_data: Dict[str, Dict] = ReadOnlyDict()
+        self._builtin_version: Optional[str] = None
+        for city, options in flights.items():
+            self.set_flights(city, options)
+        for city, options in hotels.items():
+            self.set_hotels(city, options)
+        for city, prices in pricing.items():
+            self.set_pricing(city, prices)
+        
+        self.fares = ProviderStore()
+        for path in fare_files:
+            self.fares.load(path)
+    
+    def resolve_city(self, city: str) -> str:
+        """Canonical name of city in the provider data (any case, alias or small typo)"""
+        if city in self.flight_data or city in self.hotel_data or city in self.pricing_data:
+            return city
+        # Rebuilt only when the data changes
+        version = self.data_version()
+        cached = getattr(self, "_city_resolver", None)
+        if cached is None or cached[0] != version:
+            known = self.flight_data.keys() | self.hotel_data.keys() | self.pricing_data.keys() | set(self.fares.cities())
+            cached = self._city_resolver = (version, CityResolver(known))
+        return cached[1].resolve(city) or city
+    
+    def set_flights(self, city: str, flights: Iterable[FlightOption]):
+        dict.__setitem__(self.flight_data, city, tuple(flights))
+        self._builtin_version = None
+    
+    def set_hotels(self, city: str, hotels: Iterable[HotelOption]):
+        dict.__setitem__(self.hotel_data, city, tuple(hotels))
+        self._builtin_version = None
+    
+    def set_pricing(self, city: str, pricing: Dict):
+        dict.__setitem__(self.pricing_data, city, ReadOnlyDict(pricing))
+        self._builtin_version = None
+    
+    def data_version(self) -> str:
+        """Digest of the provider data: the built-in tables and the loaded fares"""
+        builtin = self._builtin_version
+        if builtin is None:
+            builtin = self._builtin_version = fingerprint(
+                sorted(self.flight_data.items()), sorted(self.hotel_data.items()),
+                sorted((city, sorted(p.items())) for city, p in self.pricing_data.items()))[:16]
+        return f"{builtin}.{self.fares.version}"
     
     def search_flights(self, origin: str, destination: str, date: str, passengers: int = 1) -> List[FlightOption]:
-        return self.flight_data.get(destination, [])
+        city = self.resolve_city(destination)
+        return self.fares.flights(city, date, self.flight_data.get(city, []))
     
     def search_hotels(self, city: str, checkin: str, checkout: str, guests: int = 1) -> List[HotelOption]:
-        return self.hotel_data.get(city, [])
+        city = self.resolve_city(city)
+        return self.fares.hotels(city, checkin, self.hotel_data.get(city, []))
     
     def get_current_prices(self, city: str) -> Dict:
-        return self.pricing_data.get(city, {
-            "average_meal": 25.00,
-            "local_transport": 3.50,
-            "attraction_avg": 15.00,
-            "currency": "USD"
-        })
+        city = self.resolve_city(city)
+        pricing = self.fares.pricing.get(city_key(city))
+        return pricing if pricing is not None else self.pricing_data.get(city, dict(DEFAULT_PRICING))
 
-class SimpleItineraryPlanner:
-    """Main planning agent without ML dependencies"""
+CACHED_OPTION_TYPES = {cls.__name__: cls for cls in (FlightOption, HotelOption)}
+
+def lookup_to_json(value) -> str:
+    """JSON text of a cached lookup: a pricing dict or a list of FlightOption/HotelOption"""
+    if isinstance(value, dict):
+        return json.dumps({"pricing": value})
+    return json.dumps({"options": [dict(asdict(option), type=type(option).__name__) for option in value]})
+
+def lookup_from_json(text: str):
+    """Inverse of lookup_to_json; raises ValueError for anything it did not write"""
+    data = json.loads(text)
+    if "pricing" in data:
+        return data["pricing"]
+    try:
+        return [CACHED_OPTION_TYPES[fields.pop("type")](**fields) for fields in data["options"]]
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"not a cached lookup: {e}") from None
+
+class SQLiteCacheBackend:
+    """On-disk store for LookupCache so cached lookups survive restarts.
     
-    def __init__(self):
-        self.tourist_db = SimpleTouristDatabase()
-        self.web_search = SimpleWebSearchTool()
+    Values are stored as JSON, never pickled, so a tampered cache file cannot run code.
+    """
     
-    def create_itinerary(self, request: TravelRequest) -> Dict:
-        try:
+    def __init__(self, db_path: str = "lookup_cache.db"):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS lookup_cache (
+                                key TEXT PRIMARY KEY,
+                                value BLOB,
+                                expires_at REAL
+                            )''')
+        self.conn.execute('DELETE FROM lookup_cache WHERE expires_at <= ?', (time.time(),))
+        self.conn.commit()
+    
+    def get(self, key: str):
+        """Return (value, expires_at) or None"""
+        with self._lock:
+            row = self.conn.execute('SELECT value, expires_at FROM lookup_cache WHERE key = ?', (key,)).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        try:
+            return lookup_from_json(row[0]), row[1]
+        except (ValueError, TypeError, UnicodeDecodeError):
+            # Written by an older version (or not by this class at all); load it again
+            return None
+    
+    def set(self, key: str, value, expires_at: float):
+        with self._lock:
+            self.conn.execute('INSERT OR REPLACE INTO lookup_cache (key, value, expires_at) VALUES (?, ?, ?)',
+                              (key, lookup_to_json(value), expires_at))
+            self.conn.commit()
+    
+    def clear(self):
+        with self._lock:
+            self.conn.execute('DELETE FROM lookup_cache')
+            self.conn.commit()
+
+class LookupCache:
+    """Thread-safe TTL + LRU cache with single-flight loading.
+    
+    Entries expire after the TTL of their lookup kind; past max_entries the least
+    recently used entry is evicted. Concurrent misses for the same key wait for
+    a single load instead of each calling the provider.
+    """
+    
+    DEFAULT_TTLS = {"flights": 15 * 60, "hotels": 30 * 60, "pricing": 6 * 60 * 60}
+    
+    def __init__(self, max_entries: int = 10000, ttls: Optional[Dict[str, float]] = None,
+                 backend: Optional[SQLiteCacheBackend] = None):
+        self.max_entries = max_entries
+        self.ttls = dict(self.DEFAULT_TTLS, **(ttls or {}))
+        self.backend = backend
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.in_flight: Dict[str, threading.Event] = {}
+        self.counters = {"hits": 0, "misses": 0, "disk_hits": 0, "evictions": 0, "expirations": 0, "coalesced": 0}
+        self._lock = threading.Lock()
+    
+    def get_or_load(self, kind: str, key: tuple, loader):
+        cache_key = repr((kind,) + tuple(key))
+        while True:
+            with self._lock:
+                entry = self.entries.get(cache_key)
+                if entry is not None:
+                    if entry[1] > time.time():
+                        self.entries.move_to_end(cache_key)
+                        self.counters["hits"] += 1
+                        return entry[0]
+                    del self.entries[cache_key]
+                    self.counters["expirations"] += 1
+                
+                event = self.in_flight.get(cache_key)
+                if event is None:
+                    event = self.in_flight[cache_key] = threading.Event()
+                    break
+                self.counters["coalesced"] += 1
+            # Another thread is loading this key; wait for it and look again
+            event.wait()
+        
+        try:
+            stored = self.backend.get(cache_key) if self.backend else None
+            if stored is not None:
+                value, expires_at = stored
+                with self._lock:
+                    self.counters["disk_hits"] += 1
+            else:
+                value = loader()
+                expires_at = time.time() + self.ttls.get(kind, 0)
+                with self._lock:
+                    self.counters["misses"] += 1
+                if self.backend:
+                    self.backend.set(cache_key, value, expires_at)
+            self.put(cache_key, value, expires_at)
+            return value
+        finally:
+            with self._lock:
+                del self.in_flight[cache_key]
+            event.set()
+    
+    def put(self, cache_key: str, value, expires_at: float):
+        with self._lock:
+            self.entries[cache_key] = (value, expires_at)
+            self.entries.move_to_end(cache_key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.counters["evictions"] += 1
+    
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+        if self.backend:
+            self.backend.clear()
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["misses"] + self.counters["disk_hits"]
+            return dict(self.counters, size=len(self.entries),
+                        hit_rate=round((lookups - self.counters["misses"]) / lookups, 4) if lookups else 0.0)
+
+class CachedWebSearchTool:
+    """Drop-in SimpleWebSearchTool that answers repeated lookups from a LookupCache.
+    
+    Cache keys include the provider data_version, so lookups cached before the
+    data changed (loaded fares, for example) are never served, on disk either.
+    """
+    
+    def __init__(self, web_search: Optional[SimpleWebSearchTool] = None, cache: Optional[LookupCache] = None):
+        self.web_search = web_search or SimpleWebSearchTool()
+        self.cache = cache or LookupCache()
+    
+    @classmethod
+    def with_disk_cache(cls, attractions_db_path: str = "attractions.db", **cache_options) -> "CachedWebSearchTool":
+        """Cache persisted in lookup_cache.db next to the attractions database"""
+        cache_path = os.path.join(os.path.dirname(os.path.abspath(attractions_db_path)), "lookup_cache.db")
+        return cls(cache=LookupCache(backend=SQLiteCacheBackend(cache_path), **cache_options))
+    
+    def __getattr__(self, name):
+        # flight_data, hotel_data, pricing_data, ...
+        if name.startswith("__") or name == "web_search":
+            raise AttributeError(name)
+        return getattr(self.web_search, name)
+    
+    def cache_city(self, city: str) -> str:
+        # Spelling variants of one city share a cache entry
+        resolve = getattr(self.web_search, "resolve_city", None)
+        return city_key(resolve(city) if resolve else city)
+    
+    def cache_version(self) -> str:
+        data_version = getattr(self.web_search, "data_version", None)
+        return data_version() if data_version else ""
+    
+    def search_flights(self, origin: str, destination: str, date: str, passengers: int = 1) -> List[FlightOption]:
+        key = (self.cache_version(), origin, self.cache_city(destination), date, passengers)
+        return self.cache.get_or_load("flights", key,
+                                      lambda: self.web_search.search_flights(origin, destination, date, passengers))
+    
+    def search_hotels(self, city: str, checkin: str, checkout: str, guests: int = 1) -> List[HotelOption]:
+        key = (self.cache_version(), self.cache_city(city), checkin, checkout, guests)
+        return self.cache.get_or_load("hotels", key,
+                                      lambda: self.web_search.search_hotels(city, checkin, checkout, guests))
+    
+    def get_current_prices(self, city: str) -> Dict:
+        return self.cache.get_or_load("pricing", (self.cache_version(), self.cache_city(city)),
+                                      lambda: self.web_search.get_current_prices(city))
+
+SNAPSHOT_MAGIC = b"TPSNAP\0\0"
+SNAPSHOT_FORMAT = 1
+
+def compile_snapshot(snapshot_path: str, db_path: str = "attractions.db",
+                     web_search: Optional[SimpleWebSearchTool] = None) -> Dict:
+    """Write attractions, per-city search indexes and provider data to a binary snapshot.
+    
+    The file is written next to snapshot_path and moved into place with os.replace,
+    so readers see either the old or the new snapshot, never a partial one.
+    Only the built-in provider tables are compiled: fares loaded into
+    web_search.fares raise ValueError, load those in the workers instead.
+    Returns the snapshot header.
+    """
+    web_search = web_search or SimpleWebSearchTool()
+    if len(web_search.fares) or web_search.fares.pricing:
+        raise ValueError("Snapshots do not include loaded fares; load the fare files where the snapshot is used")
+    db = SimpleTouristDatabase(db_path)
+    strings = InternPool()
+    columns = {name: array('I') for name in ("name", "description", "city", "category", "price_range",
+                                               "duration", "location")}
+    ratings, tag_ids, tag_offsets = array('d'), array('I'), array('I', [0])
+    city_keys, city_rows, by_rating = array('I'), array('I', [0]), array('I')
+    token_ranges, token_strings, posting_ids, posting_offsets = array('I', [0]), array('I'), array('I'), array('I', [0])
+    
+    for key in sorted(db.city_index):
+        index = db.city_index[key]
+        city_keys.append(strings.intern(key))
+        for attraction in index.attractions:
+            for column in columns:
+                columns[column].append(strings.intern(getattr(attraction, column) or ""))
+            ratings.append(float('nan') if attraction.rating is None else attraction.rating)
+            tag_ids.extend(strings.intern(tag) for tag in attraction.tags or [])
+            tag_offsets.append(len(tag_ids))
+        city_rows.append(len(ratings))
+        by_rating.extend(index.by_rating)
+        for token in sorted(index.postings):
+            token_strings.append(strings.intern(token))
+            posting_ids.extend(index.postings[token])
+            posting_offsets.append(len(posting_ids))
+        token_ranges.append(len(token_strings))
+    
+    providers = {}
+    for city in set(web_search.flight_data) | set(web_search.hotel_data) | set(web_search.pricing_data):
+        providers[city_key(city)] = json.dumps({
+            "city": city,
+            "flights": [asdict(f) for f in web_search.flight_data.get(city, [])],
+            "hotels": [asdict(h) for h in web_search.hotel_data.get(city, [])],
+            "pricing": web_search.pricing_data.get(city),
+        }).encode('utf-8')
+    provider_keys, provider_offsets, provider_data = array('I'), array('Q', [0]), bytearray()
+    for key in sorted(providers):
+        provider_keys.append(strings.intern(key))
+        provider_data += providers[key]
+        provider_offsets.append(len(provider_data))
+    
+    string_offsets, string_data = array('Q', [0]), bytearray()
+    for value in strings.values:
+        string_data += value.encode('utf-8')
+        string_offsets.append(len(string_data))
+    
+    sections = dict({f"attr_{name}": column for name, column in columns.items()},
+                    attr_rating=ratings, tag_ids=tag_ids, tag_offsets=tag_offsets,
+                    city_keys=city_keys, city_rows=city_rows, by_rating=by_rating,
+                    token_ranges=token_ranges, token_strings=token_strings,
+                    posting_ids=posting_ids, posting_offsets=posting_offsets,
+                    provider_keys=provider_keys, provider_offsets=provider_offsets, provider_data=provider_data,
+                    string_offsets=string_offsets, string_data=string_data)
+    body, table = bytearray(), {}
+    for name, values in sections.items():
+        body += b"\0" * (-len(body) % 8)
+        raw = values.tobytes() if isinstance(values, array) else bytes(values)
+        table[name] = [len(body), len(raw), values.typecode if isinstance(values, array) else "B"]
+        body += raw
+    
+    header = {
+        "format": SNAPSHOT_FORMAT,
+        "byteorder": sys.byteorder,
+        "version": time.time_ns(),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "source": os.path.abspath(db_path),
+        "schema_version": SCHEMA_VERSION,
+        "seed_version": SEED_VERSION,
+        "attractions": len(ratings),
+        "cities": len(city_keys),
+        "provider_cities": {"flights": len(web_search.flight_data), "hotels": len(web_search.hotel_data),
+                            "pricing": len(web_search.pricing_data)},
+        "sections": table,
+    }
+    encoded = json.dumps(header).encode('utf-8')
+    prefix = SNAPSHOT_MAGIC + struct.pack("<I", len(encoded)) + encoded
+    prefix += b"\0" * (-len(prefix) % 8)
+    
+    directory = os.path.dirname(os.path.abspath(snapshot_path))
+    temporary = os.path.join(directory, f".{os.path.basename(snapshot_path)}.{os.getpid()}.tmp")
+    with open(temporary, "wb") as f:
+        f.write(prefix)
+        f.write(body)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, snapshot_path)
+    db.close()
+    return header
+
+class CatalogueSnapshot:
+    """Read-only, memory-mapped view of a compiled snapshot.
+    
+    Sections are memoryviews straight into the mapping, so nothing is copied at open
+    and every process mapping the same file shares its pages. Strings are decoded,
+    and Attraction objects built, only when read.
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self.stat = os.fstat(f.fileno())
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self.buffer)
+        if bytes(view[:8]) != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} is not a catalogue snapshot")
+        header_length = struct.unpack("<I", view[8:12])[0]
+        self.header = json.loads(bytes(view[12:12 + header_length]))
+        if self.header["format"] != SNAPSHOT_FORMAT or self.header["byteorder"] != sys.byteorder:
+            raise ValueError(f"{path} has snapshot format {self.header['format']} ({self.header['byteorder']}-endian), "
+                             f"expected {SNAPSHOT_FORMAT} ({sys.byteorder}-endian)")
+        body = 12 + header_length + (-(12 + header_length) % 8)
+        self.sections = {name: view[body + offset:body + offset + length].cast(typecode)
+                         for name, (offset, length, typecode) in self.header["sections"].items()}
+        for name, section in self.sections.items():
+            setattr(self, name, section)
+    
+    @property
+    def version(self) -> int:
+        return self.header["version"]
+    
+    def string(self, string_id: int) -> str:
+        return str(self.string_data[self.string_offsets[string_id]:self.string_offsets[string_id + 1]], 'utf-8')
+    
+    def find(self, keys: "memoryview", key: str) -> Optional[int]:
+        """Position of key in a sorted column of string ids"""
+        lo, hi = 0, len(keys)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.string(keys[mid]) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < len(keys) and self.string(keys[lo]) == key else None
+    
+    def city_names(self) -> List[str]:
+        """Display name (the city of its first attraction) of every city"""
+        return [self.string(self.attr_city[self.city_rows[i]]) for i in range(len(self.city_keys))
+                if self.city_rows[i] < self.city_rows[i + 1]]
+    
+    def city_store(self, key: str) -> Optional["SnapshotAttractionStore"]:
+        position = self.find(self.city_keys, key)
+        if position is None:
+            return None
+        return SnapshotAttractionStore(self, position)
+    
+    def attraction(self, row: int) -> Attraction:
+        rating = self.attr_rating[row]
+        return Attraction(
+            name=self.string(self.attr_name[row]),
+            city=self.string(self.attr_city[row]),
+            description=self.string(self.attr_description[row]),
+            category=self.string(self.attr_category[row]),
+            rating=None if rating != rating else rating,
+            price_range=self.string(self.attr_price_range[row]),
+            duration=self.string(self.attr_duration[row]),
+            location=self.string(self.attr_location[row]),
+            tags=[self.string(t) for t in self.tag_ids[self.tag_offsets[row]:self.tag_offsets[row + 1]]]
+        )
+    
+    def provider(self, key: str) -> Optional[Dict]:
+        position = self.find(self.provider_keys, key)
+        if position is None:
+            return None
+        return json.loads(bytes(self.provider_data[self.provider_offsets[position]:self.provider_offsets[position + 1]]))
+
+class SnapshotAttractionStore:
+    """The attractions of one snapshot city, in the same list-like shape as CompactAttractionStore.
+    
+    Attractions are decoded on first access and kept while the city stays cached.
+    """
+    
+    def __init__(self, snapshot: CatalogueSnapshot, position: int):
+        self.snapshot = snapshot
+        self.position = position
+        self.start, self.end = snapshot.city_rows[position], snapshot.city_rows[position + 1]
+        self.ratings = snapshot.attr_rating[self.start:self.end]
+        self.decoded: List[Optional[Attraction]] = [None] * (self.end - self.start)
+    
+    def __len__(self) -> int:
+        return self.end - self.start
+    
+    def __getitem__(self, i: int) -> Attraction:
+        attraction = self.decoded[i]
+        if attraction is None:
+            attraction = self.decoded[i] = self.snapshot.attraction(self.start + i % len(self))
+        return attraction
+    
+    def __iter__(self) -> Iterator[Attraction]:
+        for i in range(len(self)):
+            yield self[i]
+
+class SnapshotPostings(Mapping):
+    """token -> attraction ids of one snapshot city, looked up by bisection over sorted tokens"""
+    
+    def __init__(self, snapshot: CatalogueSnapshot, position: int):
+        self.snapshot = snapshot
+        self.start, self.end = snapshot.token_ranges[position], snapshot.token_ranges[position + 1]
+        self._tokens: Optional[List[str]] = None
+    
+    @property
+    def tokens(self) -> List[str]:
+        """Sorted tokens of the city, decoded once since substring matching scans them"""
+        if self._tokens is None:
+            self._tokens = [self.snapshot.string(t) for t in self.snapshot.token_strings[self.start:self.end]]
+        return self._tokens
+    
+    def __getitem__(self, token: str) -> "memoryview":
+        position = bisect.bisect_left(self.tokens, token)
+        if position == len(self.tokens) or self.tokens[position] != token:
+            raise KeyError(token)
+        offsets = self.snapshot.posting_offsets
+        return self.snapshot.posting_ids[offsets[self.start + position]:offsets[self.start + position + 1]]
+    
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.tokens)
+    
+    def __len__(self) -> int:
+        return self.end - self.start
+    
+    def items(self):
+        offsets, ids = self.snapshot.posting_offsets, self.snapshot.posting_ids
+        for i, token in enumerate(self.tokens, self.start):
+            yield token, ids[offsets[i]:offsets[i + 1]]
+    
+    def values(self):
+        offsets, ids = self.snapshot.posting_offsets, self.snapshot.posting_ids
+        for i in range(self.start, self.end):
+            yield ids[offsets[i]:offsets[i + 1]]
+
+class SnapshotCityIndex(CityIndex):
+    """CityIndex whose postings and rating order are read from the snapshot instead of built"""
+    
+    def __init__(self, store: SnapshotAttractionStore, scoring_engine: str = "python"):
+        self.attractions = store
+        self.scoring_engine = scoring_engine
+        self._vector_scorer = None
+        self.ratings = store.ratings
+        self.texts = None
+        self.postings = SnapshotPostings(store.snapshot, store.position)
+        self.by_rating = store.snapshot.by_rating[store.start:store.end]
+        self._term_matches: Dict[str, frozenset] = {}
+        self._token_index = None
+
+class SnapshotHandle:
+    """The current CatalogueSnapshot at path, reopened when the file is replaced.
+    
+    compile_snapshot swaps files with os.replace, so a changed inode or mtime means
+    a new snapshot; the old mapping stays valid for readers still holding it.
+    """
+    
+    def __init__(self, path: str, check_interval: float = 1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self.snapshot = CatalogueSnapshot(path)
+        self.checked_at = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def current(self) -> CatalogueSnapshot:
+        now = time.monotonic()
+        if now - self.checked_at < self.check_interval:
+            return self.snapshot
+        with self._lock:
+            self.checked_at = now
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                return self.snapshot
+            old = self.snapshot.stat
+            if (stat.st_ino, stat.st_mtime_ns, stat.st_size) != (old.st_ino, old.st_mtime_ns, old.st_size):
+                self.snapshot = CatalogueSnapshot(self.path)
+        return self.snapshot
+
+class SnapshotTouristDatabase(SimpleTouristDatabase):
+    """Read-only SimpleTouristDatabase served from a compiled snapshot.
+    
+    Opening maps the file instead of reading SQLite, and cities are indexed on
+    first use straight from the snapshot. A replaced snapshot file is picked up
+    within check_interval seconds, dropping cached indexes and search results.
+    """
+    
+    def __init__(self, snapshot_path: str, max_cached_cities: int = 256, max_cached_searches: int = 4096,
+                 scoring_engine: str = "python", check_interval: float = 1.0):
+        self.snapshot_path = snapshot_path
+        self.handle = SnapshotHandle(snapshot_path, check_interval)
+        self.snapshot_version = self.handle.snapshot.version
+        super().__init__(snapshot_path, lazy=True, max_cached_cities=max_cached_cities,
+                         max_cached_searches=max_cached_searches, scoring_engine=scoring_engine)
+    
+    def setup_database(self):
+        pass
+    
+    def current_snapshot(self) -> CatalogueSnapshot:
+        snapshot = self.handle.current()
+        if snapshot.version != self.snapshot_version:
+            self.snapshot_version = snapshot.version
+            self.reload()
+        return snapshot
+    
+    def get_city_index(self, city: str) -> Optional[CityIndex]:
+        self.current_snapshot()
+        return super().get_city_index(city)
+    
+    def load_city(self, city: str):
+        store = self.current_snapshot().city_store(city_key(city))
+        return store if store is not None else []
+    
+    def new_city_index(self, attractions) -> CityIndex:
+        if isinstance(attractions, SnapshotAttractionStore):
+            return SnapshotCityIndex(attractions, self.scoring_engine)
+        return super().new_city_index(attractions)
+    
+    def city_resolver(self) -> CityResolver:
+        if self._city_resolver is None:
+            self._city_resolver = CityResolver(self.current_snapshot().city_names())
+        return self._city_resolver
+    
+    def catalogue_version(self) -> str:
+        return f"snapshot.{self.current_snapshot().version}"
+    
+    def read_only(self, *args, **kwargs):
+        raise ValueError("Snapshot databases are read-only; change attractions.db and recompile the snapshot")
+    
+    add_attraction = add_attractions = update_attraction = delete_attraction = read_only
+
+class SnapshotProviderData(Mapping):
+    """city -> flights, hotels or pricing of the current snapshot, decoded on first access"""
+    
+    def __init__(self, handle: SnapshotHandle, kind: str):
+        self.handle = handle
+        self.kind = kind
+        self.cache: Dict[str, object] = {}
+        self.version = None
+    
+    def load(self, city: str):
+        snapshot = self.handle.current()
+        if snapshot.version != self.version:
+            self.cache, self.version = {}, snapshot.version
+        key = city_key(city)
+        if key not in self.cache:
+            payload = snapshot.provider(key)
+            value = payload[self.kind] if payload else None
+            if value is not None and self.kind == "flights":
+                value = [FlightOption(**flight) for flight in value]
+            elif value is not None and self.kind == "hotels":
+                value = [HotelOption(**hotel) for hotel in value]
+            self.cache[key] = (payload["city"] if payload else None, value)
+        return self.cache[key]
+    
+    def __getitem__(self, city: str):
+        name, value = self.load(city)
+        if value is None or name != city:
+            raise KeyError(city)
+        return value
+    
+    def __iter__(self) -> Iterator[str]:
+        snapshot = self.handle.current()
+        for key in snapshot.provider_keys:
+            name, value = self.load(snapshot.string(key))
+            if value is not None:
+                yield name
+    
+    def __len__(self) -> int:
+        counts = self.handle.current().header.get("provider_cities")
+        # Counted when compiled; older snapshots decode every record instead
+        return counts[self.kind] if counts else sum(1 for _ in self)
+
+class SnapshotWebSearchTool(SimpleWebSearchTool):
+    """SimpleWebSearchTool over the provider data of a compiled snapshot"""
+    
+    def __init__(self, snapshot_path: str, check_interval: float = 1.0, handle: Optional[SnapshotHandle] = None):
+        self.handle = handle or SnapshotHandle(snapshot_path, check_interval)
+        self.flight_data = SnapshotProviderData(self.handle, "flights")
+        self.hotel_data = SnapshotProviderData(self.handle, "hotels")
+        self.pricing_data = SnapshotProviderData(self.handle, "pricing")
+        self.fares = ProviderStore()
+    
+    def data_version(self) -> str:
+        return f"snapshot.{self.handle.current().version}.{self.fares.version}"
+
+def snapshot_planner(snapshot_path: str, check_interval: float = 1.0, **planner_options) -> "SimpleItineraryPlanner":
+    """Planner whose attractions and provider data come from one shared snapshot mapping"""
+    tourist_db = SnapshotTouristDatabase(snapshot_path, check_interval=check_interval)
+    web_search = SnapshotWebSearchTool(snapshot_path, handle=tourist_db.handle)
+    return SimpleItineraryPlanner(tourist_db=tourist_db, web_search=web_search, **planner_options)
+
+DURATION_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(?:\s*-\s*(\d+(?:\.\d+)?))?\s*(hours?|hrs?|h|minutes?|mins?|m)\b")
+
+def parse_duration_hours(duration: str, default: float = 2.0) -> float:
+    """Turn "2-3 hours", "30 minutes" or "1 hour" into hours, using the midpoint of ranges"""
+    match = DURATION_PATTERN.search((duration or "").lower())
+    if not match:
+        return default
+    low = float(match.group(1))
+    high = float(match.group(2)) if match.group(2) else low
+    hours = (low + high) / 2
+    return hours / 60 if match.group(3).startswith("m") else hours
+
+class ScheduledDay:
+    """Activities assigned to one day while DayScheduler is packing"""
+    
+    def __init__(self):
+        self.items: List[tuple] = []  # (value, hours, cost, location, attraction)
+        self.activity_hours = 0.0
+        self.cost = 0.0
+        self.areas: Dict[str, int] = {}
+    
+    def hours_with(self, item: tuple, travel_hours: float) -> float:
+        areas = len(self.areas) + (item[3] not in self.areas)
+        return self.activity_hours + item[1] + travel_hours * max(0, areas - 1)
+    
+    def hours_without(self, item: tuple, travel_hours: float) -> float:
+        areas = len(self.areas) - (self.areas[item[3]] == 1)
+        return self.activity_hours - item[1] + travel_hours * max(0, areas - 1)
+    
+    def add(self, item: tuple):
+        self.items.append(item)
+        self.activity_hours += item[1]
+        self.cost += item[2]
+        self.areas[item[3]] = self.areas.get(item[3], 0) + 1
+    
+    def remove(self, item: tuple):
+        self.items.remove(item)
+        self.activity_hours -= item[1]
+        self.cost -= item[2]
+        self.areas[item[3]] -= 1
+        if not self.areas[item[3]]:
+            del self.areas[item[3]]
+
+class DayScheduler:
+    """Packs ranked attractions into days using their duration and location.
+    
+    Attractions are grouped by neighbourhood (Attraction.location) and placed
+    greedily, best ranked first, into days under an hours budget and an optional
+    per-day activity cost cap; each extra neighbourhood in a day costs
+    travel_hours. A local search then moves activities between days to cut
+    neighbourhood changes and fills freed time with attractions left over.
+    """
+    
+    def __init__(self, hours_per_day: float = 8.0, day_start_hour: float = 9.0,
+                 max_daily_cost: Optional[float] = None, travel_hours: float = 0.5,
+                 max_iterations: int = 50):
+        self.hours_per_day = hours_per_day
+        self.day_start_hour = day_start_hour
+        self.max_daily_cost = max_daily_cost
+        self.travel_hours = travel_hours
+        self.max_iterations = max_iterations
+    
+    def fits(self, day: ScheduledDay, item: tuple) -> bool:
+        if day.hours_with(item, self.travel_hours) > self.hours_per_day:
+            return False
+        return self.max_daily_cost is None or day.cost + item[2] <= self.max_daily_cost
+    
+    def schedule(self, attractions: List[Attraction], days: int, activity_cost) -> List[List[tuple]]:
+        """Return per day a list of (attraction, start_hour, hours); activity_cost(attraction) -> float"""
+        plans = [ScheduledDay() for _ in range(days)]
+        if not attractions or days <= 0:
+            return [[] for _ in plans]
+        
+        # Higher value for better ranked attractions
+        items = [(len(attractions) - rank, parse_duration_hours(a.duration), activity_cost(a), a.location or "", a)
+                 for rank, a in enumerate(attractions)]
+        by_area: Dict[str, List[tuple]] = {}
+        for item in items:
+            by_area.setdefault(item[3], []).append(item)
+        areas = sorted(by_area.values(), key=lambda area_items: -sum(i[0] for i in area_items))
+        
+        unscheduled = []
+        for area_items in areas:
+            for item in area_items:
+                day = self.best_day(plans, item)
+                if day is None:
+                    unscheduled.append(item)
+                else:
+                    day.add(item)
+        
+        self.improve(plans, unscheduled)
+        return [self.timeline(day) for day in plans]
+    
+    def best_day(self, plans: List[ScheduledDay], item: tuple) -> Optional[ScheduledDay]:
+        """Prefer a day already in the item's neighbourhood, then an empty day, then any
+        day with room; ties go to the day with the most hours left"""
+        best, best_key = None, None
+        for day in plans:
+            if not self.fits(day, item):
+                continue
+            key = (item[3] in day.areas, not day.items, -day.activity_hours)
+            if best_key is None or key > best_key:
+                best, best_key = day, key
+        return best
+    
+    def improve(self, plans: List[ScheduledDay], unscheduled: List[tuple]):
+        for _ in range(self.max_iterations):
+            improved = False
+            # Relocate activities that are alone in their neighbourhood to a day already there
+            for source in plans:
+                for item in list(source.items):
+                    if source.areas[item[3]] > 1:
+                        continue
+                    for target in plans:
+                        if target is not source and item[3] in target.areas and self.fits(target, item):
+                            source.remove(item)
+                            target.add(item)
+                            improved = True
+                            break
+            # Use freed time for the best remaining attractions
+            unscheduled.sort(key=lambda i: -i[0])
+            for item in list(unscheduled):
+                day = self.best_day(plans, item)
+                if day is not None:
+                    day.add(item)
+                    unscheduled.remove(item)
+                    improved = True
+            if not improved:
+                break
+    
+    def timeline(self, day: ScheduledDay) -> List[tuple]:
+        """Order a day's activities by neighbourhood and best rank, and assign start times"""
+        area_rank: Dict[str, int] = {}
+        for item in sorted(day.items, key=lambda i: -i[0]):
+            area_rank.setdefault(item[3], len(area_rank))
+        ordered = sorted(day.items, key=lambda i: (area_rank[i[3]], -i[0]))
+        
+        schedule, clock, previous_area = [], self.day_start_hour, None
+        for item in ordered:
+            if previous_area is not None and item[3] != previous_area:
+                clock += self.travel_hours
+            schedule.append((item[4], clock, item[1]))
+            clock += item[1]
+            previous_area = item[3]
+        return schedule
+
+@dataclass
+class BudgetPlan:
+    flight: Optional[FlightOption]
+    hotel: Optional[HotelOption]
+    activities: List[Attraction]
+    costs: Dict[str, float]
+    total_cost: float
+    value: float
+    within_budget: bool
+    shortfall: float = 0.0  # how far the cheapest plan is over budget when nothing fits
+
+class BudgetSolver:
+    """Chooses flight, hotel and activities together to maximize value within the budget.
+    
+    Costs use the real trip: round-trip fares for every traveler, one room per
+    guests_per_room travelers for every night, and the daily meals/transport the
+    day planner charges and every activity's price, both for every traveler.
+    
+    Value is counted in days of the best possible trip: a night in a 5-star hotel
+    is worth 1, and so is a day of max_activities_per_day 5-star activities at the
+    top of the search results (lower-ranked ones are worth down to half). Every
+    flight hour costs flight_hour_penalty. When no plan fits the budget, the
+    cheapest flight and hotel with the best free activities are returned with
+    within_budget False and the shortfall.
+    
+    Activities are a cardinality-limited 0/1 knapsack solved once by DP over whole
+    currency units, giving the best activity value for every leftover budget.
+    Flights and hotels are reduced to their price/value Pareto fronts and each
+    (flight, hotel) pair is then an O(1) lookup, pruned by an upper bound, so
+    hundreds of options per city stay fast.
+    """
+    
+    def __init__(self, guests_per_room: int = 2, max_activities_per_day: int = 3,
+                 flight_hour_penalty: float = 0.02):
+        self.guests_per_room = guests_per_room
+        self.max_activities_per_day = max_activities_per_day
+        self.flight_hour_penalty = flight_hour_penalty
+    
+    @staticmethod
+    def pareto_front(options: List[tuple]) -> List[tuple]:
+        """Keep (cost, value, option) entries not beaten on both cost and value"""
+        front, best_value = [], float("-inf")
+        for entry in sorted(options, key=lambda e: (e[0], -e[1])):
+            if entry[1] > best_value:
+                front.append(entry)
+                best_value = entry[1]
+        return front
+    
+    def activity_table(self, items: List[tuple], max_count: int):
+        """0/1 knapsack over integer costs with at most max_count items.
+        
+        Returns (best, choice): best[c] is the best value with total cost <= c and
+        choice[c] the chosen item indexes.
+        """
+        capacity = sum(cost for cost, _ in items)
+        # layers[k][c]: best value using exactly k items with total cost exactly c
+        NEG = float("-inf")
+        layers = [[NEG] * (capacity + 1) for _ in range(max_count + 1)]
+        layers[0][0] = 0.0
+        taken: List[List[List[Optional[tuple]]]] = [[None] * (capacity + 1) for _ in range(max_count + 1)]
+        for index, (cost, value) in enumerate(items):
+            for k in range(min(max_count, index + 1), 0, -1):
+                previous, current = layers[k - 1], layers[k]
+                for c in range(capacity, cost - 1, -1):
+                    candidate = previous[c - cost] + value
+                    if candidate > current[c]:
+                        current[c] = candidate
+                        taken[k][c] = (index, taken[k - 1][c - cost])
+        
+        best = [0.0] * (capacity + 1)
+        choice: List[Optional[tuple]] = [None] * (capacity + 1)
+        for c in range(capacity + 1):
+            best[c], choice[c] = (best[c - 1], choice[c - 1]) if c else (0.0, None)
+            for k in range(1, max_count + 1):
+                if layers[k][c] > best[c]:
+                    best[c], choice[c] = layers[k][c], taken[k][c]
+        
+        chosen_sets = []
+        for link in choice:
+            chosen = []
+            while link is not None:
+                chosen.append(link[0])
+                link = link[1]
+            chosen_sets.append(sorted(chosen))
+        return best, chosen_sets
+    
+    def solve(self, request: TravelRequest, nights: int, flights: List[FlightOption], hotels: List[HotelOption],
+              attractions: List[Attraction], pricing: Dict, activity_cost) -> BudgetPlan:
+        travelers = max(1, request.travelers)
+        rooms = math.ceil(travelers / self.guests_per_room)
+        meals_transport = (pricing["average_meal"] * 3 + pricing["local_transport"] * 4) * nights * travelers
+        
+        flight_front = self.pareto_front([
+            (f.price * 2 * travelers, -self.flight_hour_penalty * parse_duration_hours(f.duration), f)
+            for f in flights]) or [(0.0, 0.0, None)]
+        hotel_front = self.pareto_front([
+            (h.price_per_night * nights * rooms, (h.rating or 0) / 5 * nights, h) for h in hotels]) or [(0.0, 0.0, None)]
+        
+        ranked = list(attractions)
+        slot_value = 1 / (5 * max(1, self.max_activities_per_day))
+        items = [(int(math.ceil(activity_cost(a) * travelers)),
+                  (a.rating or 0) * slot_value * (1 + (len(ranked) - rank) / len(ranked)) / 2)
+                 for rank, a in enumerate(ranked)]
+        max_count = min(len(items), self.max_activities_per_day * nights)
+        best_activities, chosen_sets = self.activity_table(items, max_count)
+        top_activity_value = best_activities[-1]
+        best_flight_value = max(value for _, value, _ in flight_front)
+        
+        best = None
+        for hotel_cost, hotel_value, hotel in sorted(hotel_front, key=lambda e: -e[1]):
+            if best is not None and hotel_value + best_flight_value + top_activity_value <= best[0]:
+                break  # no remaining hotel can beat the best plan
+            for flight_cost, flight_value, flight in flight_front:
+                left = request.budget - meals_transport - hotel_cost - flight_cost
+                if left < 0:
+                    break  # flights are sorted by cost
+                capacity = min(int(left), len(best_activities) - 1)
+                value = hotel_value + flight_value + best_activities[capacity]
+                if best is None or value > best[0]:
+                    best = (value, flight, flight_cost, hotel, hotel_cost, chosen_sets[capacity])
+        
+        within_budget = best is not None
+        if best is None:
+            # Nothing fits: cheapest flight and hotel, and the best free activities up to the cap
+            flight_cost, flight_value, flight = flight_front[0]
+            hotel_cost, hotel_value, hotel = hotel_front[0]
+            free = sorted((i for i, (cost, _) in enumerate(items) if cost == 0), key=lambda i: -items[i][1])[:max_count]
+            value = hotel_value + flight_value + sum(items[i][1] for i in free)
+            best = (value, flight, flight_cost, hotel, hotel_cost, sorted(free))
+        
+        value, flight, flight_cost, hotel, hotel_cost, chosen = best
+        activities = [ranked[i] for i in chosen]
+        costs = {
+            "flights": round(flight_cost, 2),
+            "accommodation": round(hotel_cost, 2),
+            "activities": round(sum(activity_cost(a) for a in activities) * travelers, 2),
+            "meals_transport": round(meals_transport, 2),
+        }
+        total_cost = round(sum(costs.values()), 2)
+        shortfall = 0.0 if within_budget else round(max(0.0, total_cost - request.budget), 2)
+        return BudgetPlan(flight, hotel, activities, costs, total_cost, round(value, 4), within_budget, shortfall)
+
+def fingerprint(*parts) -> str:
+    """Stable digest of stage inputs, used to decide whether a stage result can be reused"""
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+def copy_recommendations(recommendations: Dict) -> Dict:
+    # Itinerary dicts may be edited by callers; keep the cached stage result intact
+    return dict(recommendations, local_tips=list(recommendations["local_tips"]))
+
+@dataclass
+class PlanState:
+    """An itinerary plus the stage results and fingerprints needed to re-plan it"""
+    request: TravelRequest
+    stages: Dict[str, tuple] = field(default_factory=dict)
+    itinerary: Optional[Dict] = None
+    reused: List[str] = field(default_factory=list)
+    recomputed: List[str] = field(default_factory=list)
+    reused_days: int = 0
+    recomputed_days: int = 0
+
+@dataclass
+class RequestProfile:
+    """Per-request profiling switch for create_itinerary; filled in when the request finishes.
+    
+    cProfile and tracemalloc are process-wide, so profile one request at a time.
+    """
+    cprofile: bool = False
+    trace_memory: bool = False
+    top: int = 25
+    stage_ms: Dict[str, float] = field(default_factory=dict)
+    profile_text: Optional[str] = None
+    peak_memory_kb: Optional[float] = None
+
+@dataclass
+class DateWindow:
+    """One candidate trip window costed by SimpleItineraryPlanner.sweep_dates"""
+    start_date: str
+    end_date: str
+    nights: int
+    flight_cost: float
+    hotel_cost: float
+    activities_cost: float
+    estimated_cost: float
+    within_budget: bool
+
+class PlannerInstrumentation:
+    """Per-stage latency histograms and counters for the planner, exportable as Prometheus text"""
+    
+    STAGES = ("search", "flights", "hotels", "pricing", "scheduling", "recommendations", "serialization", "total")
+    DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+    
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.histograms: Dict[str, List[int]] = {}
+        self.sums: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+    
+    def observe(self, stage: str, seconds: float):
+        slot = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = [0] * (len(self.buckets) + 1)
+                self.sums[stage] = 0.0
+            histogram[slot] += 1
+            self.sums[stage] += seconds
+        profile = getattr(self._local, "profile", None)
+        if profile is not None:
+            profile.stage_ms[stage] = round(profile.stage_ms.get(stage, 0.0) + seconds * 1000, 4)
+    
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+    
+    def increment(self, counter: str, amount: int = 1):
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+    
+    @contextmanager
+    def request(self, profile: Optional[RequestProfile] = None):
+        """Time one whole request as the "total" stage, with optional cProfile/tracemalloc"""
+        profiler = cProfile.Profile() if profile and profile.cprofile else None
+        started_tracing = bool(profile and profile.trace_memory and not tracemalloc.is_tracing())
+        if started_tracing:
+            tracemalloc.start()
+        elif profile and profile.trace_memory:
+            tracemalloc.reset_peak()
+        self._local.profile = profile
+        if profiler:
+            profiler.enable()
+        try:
+            with self.stage("total"):
+                yield
+            self.increment("itineraries")
+        except Exception:
+            self.increment("errors")
+            raise
+        finally:
+            if profiler:
+                profiler.disable()
+                out = io.StringIO()
+                pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(profile.top)
+                profile.profile_text = out.getvalue()
+            if profile and profile.trace_memory:
+                profile.peak_memory_kb = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+                if started_tracing:
+                    tracemalloc.stop()
+            self._local.profile = None
+    
+    def snapshot(self) -> Dict:
+        with self._lock:
+            stages = {stage: {"count": sum(histogram), "mean_ms": round(self.sums[stage] / sum(histogram) * 1000, 4)}
+                      for stage, histogram in self.histograms.items()}
+            return {"stages": stages, "counters": dict(self.counters)}
+    
+    def export_prometheus(self, prefix: str = "travel_planner") -> str:
+        """Histograms and counters in the Prometheus text exposition format"""
+        with self._lock:
+            histograms = {stage: list(histogram) for stage, histogram in self.histograms.items()}
+            sums, counters = dict(self.sums), dict(self.counters)
+        
+        lines = [f"# HELP {prefix}_stage_seconds Time spent per planning stage",
+                 f"# TYPE {prefix}_stage_seconds histogram"]
+        for stage in sorted(histograms, key=lambda name: (name not in self.STAGES, name)):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), histograms[stage]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {sums[stage]:.6f}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {cumulative}')
+        for counter in sorted(counters):
+            lines.append(f"# TYPE {prefix}_{counter}_total counter")
+            lines.append(f"{prefix}_{counter}_total {counters[counter]}")
+        return "\n".join(lines) + "\n"
+
+# Bump ITINERARY_FORMAT whenever the itinerary dict changes, so stored itineraries are not served
+ITINERARY_FORMAT = 2
+ISO_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+class ItineraryStore:
+    """Persistent, content-addressed store of finished itineraries.
+    
+    Keys are digests of the normalized request, the planner options and the
+    catalogue/provider data versions, so changed data simply stops matching
+    old entries. Entries older than max_age are never served, and past
+    max_entries or max_bytes the least recently used ones are evicted.
+    Itineraries are stored as JSON (never pickled, so a tampered store file
+    cannot run code); pass the planner's fragments to encode them faster.
+    The memory_entries most recently used itineraries are also kept decoded
+    in memory, so repeated hits skip SQLite and JSON decoding. Hits are
+    shallow copies: like fragments, their nested parts are read-only.
+    """
+    
+    def __init__(self, db_path: str = "itinerary_store.db", max_entries: int = 10000,
+                 max_bytes: int = 256 * 1024 * 1024, max_age: float = 24 * 60 * 60, touch_interval: float = 60.0,
+                 fragments: Optional["ItineraryFragments"] = None, memory_entries: int = 256):
+        self.db_path = db_path
+        self.encode = fragments.encode if fragments is not None else json.dumps
+        self.memory_entries = memory_entries
+        # key -> [itinerary, created_at, accessed_at], least recently used first
+        self.memory: "OrderedDict[str, list]" = OrderedDict()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.touch_interval = touch_interval
+        self.pool = SQLiteConnectionPool(db_path, max_connections=2)
+        with self.pool.transaction() as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS itineraries (
+                                key TEXT PRIMARY KEY,
+                                body BLOB,
+                                size INTEGER,
+                                created_at REAL,
+                                accessed_at REAL
+                            )''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_itineraries_accessed ON itineraries (accessed_at)')
+        self.counters = {"hits": 0, "memory_hits": 0, "misses": 0, "stores": 0, "expirations": 0, "evictions": 0}
+        self._lock = threading.Lock()
+        self.entries, self.total_bytes = self.pool.query('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM itineraries')[0]
+    
+    @staticmethod
+    def request_key(request: TravelRequest, versions: tuple) -> str:
+        """Digest of the request fields that change the plan; case, spacing and interest order do not"""
+        dates = tuple(d if ISO_DATE.fullmatch(d) else datetime.strptime(d, "%Y-%m-%d").strftime("%Y-%m-%d")
+                      for d in (request.start_date, request.end_date))
+        interests = sorted(" ".join(i.lower().split()) for i in request.interests or [])
+        return hashlib.sha256(repr((ITINERARY_FORMAT, city_key(request.destination), dates, float(request.budget),
+                                    int(request.travelers), interests) + tuple(versions)).encode('utf-8')).hexdigest()
+    
+    def remember(self, key: str, itinerary: Dict, created_at: float, accessed_at: float):
+        """Keep itinerary in the in-memory layer; call with the lock held"""
+        if self.memory_entries <= 0:
+            return
+        self.memory[key] = [itinerary, created_at, accessed_at]
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+    
+    def get(self, key: str) -> Optional[Dict]:
+        now = time.time()
+        with self._lock:
+            entry = self.memory.get(key)
+            if entry is not None and entry[1] > now - self.max_age:
+                self.memory.move_to_end(key)
+                self.counters["hits"] += 1
+                self.counters["memory_hits"] += 1
+                touch = entry[2] <= now - self.touch_interval
+                if touch:
+                    entry[2] = now
+            elif entry is not None:
+                del self.memory[key]
+                entry = None
+        if entry is not None:
+            if touch:
+                self.pool.execute('UPDATE itineraries SET accessed_at = ? WHERE key = ?', (now, key))
+            return dict(entry[0])
+        rows = self.pool.query('SELECT body, created_at, accessed_at FROM itineraries WHERE key = ?', (key,))
+        if not rows or rows[0][1] <= now - self.max_age:
+            with self._lock:
+                self.counters["misses"] += 1
+                self.counters["expirations"] += bool(rows)
+            return None
+        body, created_at, accessed_at = rows[0]
+        # Recency only matters for eviction, so it is refreshed at most every touch_interval
+        if accessed_at <= now - self.touch_interval:
+            self.pool.execute('UPDATE itineraries SET accessed_at = ? WHERE key = ?', (now, key))
+            accessed_at = now
+        try:
+            itinerary = json.loads(body)
+        except ValueError:
+            # Not written by this store (or truncated); plan again and overwrite it
+            with self._lock:
+                self.counters["misses"] += 1
+            return None
+        with self._lock:
+            self.counters["hits"] += 1
+            self.remember(key, itinerary, created_at, accessed_at)
+        return dict(itinerary)
+    
+    def put(self, key: str, itinerary: Dict):
+        body = self.encode(itinerary).encode('utf-8')
+        now = time.time()
+        with self.pool.transaction() as conn:
+            old = conn.execute('SELECT size FROM itineraries WHERE key = ?', (key,)).fetchone()
+            conn.execute('INSERT OR REPLACE INTO itineraries (key, body, size, created_at, accessed_at) '
+                         'VALUES (?, ?, ?, ?, ?)', (key, body, len(body), now, now))
+        with self._lock:
+            self.remember(key, dict(itinerary), now, now)
+            self.counters["stores"] += 1
+            self.entries += 0 if old else 1
+            self.total_bytes += len(body) - (old[0] if old else 0)
+            over = self.entries > self.max_entries or self.total_bytes > self.max_bytes
+        if over:
+            self.evict()
+    
+    def evict(self):
+        """Drop expired entries, then least recently used ones until within both limits"""
+        with self.pool.transaction() as conn:
+            expired = conn.execute('DELETE FROM itineraries WHERE created_at <= ?',
+                                   (time.time() - self.max_age,)).rowcount
+            entries, total_bytes = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM itineraries').fetchone()
+            # Evict down to 90% of the limits so a full store does not evict on every put
+            entry_target, byte_target = int(self.max_entries * 0.9), int(self.max_bytes * 0.9)
+            evicted = 0
+            if entries > self.max_entries or total_bytes > self.max_bytes:
+                for key, size in conn.execute('SELECT key, size FROM itineraries ORDER BY accessed_at').fetchall():
+                    if entries <= entry_target and total_bytes <= byte_target:
+                        break
+                    conn.execute('DELETE FROM itineraries WHERE key = ?', (key,))
+                    entries, total_bytes, evicted = entries - 1, total_bytes - size, evicted + 1
+                    with self._lock:
+                        self.memory.pop(key, None)
+        with self._lock:
+            self.counters["expirations"] += expired
+            self.counters["evictions"] += evicted
+            self.entries, self.total_bytes = entries, total_bytes
+    
+    def clear(self):
+        self.pool.execute('DELETE FROM itineraries')
+        with self._lock:
+            self.memory.clear()
+            self.entries = self.total_bytes = 0
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return dict(self.counters, entries=self.entries, bytes=self.total_bytes, memory_entries=len(self.memory),
+                        hit_rate=round(self.counters["hits"] / lookups, 4) if lookups else 0.0)
+    
+    def close(self):
+        self.pool.close()
+
+class ItineraryFragments:
+    """Itinerary parts shared by every itinerary planned from the same data, and their JSON.
+    
+    The flight and hotel dicts of one fare table, the local tips of one pricing,
+    the cost tips and the activity dict of one attraction in one time slot are
+    built once and shared. encode() writes them from cached JSON text, so they
+    must be treated as read-only: copy a part of an itinerary before editing it.
+    """
+    
+    def __init__(self, max_entries: int = 8192):
+        self.max_entries = max_entries
+        # key -> (source, value); the source is kept so a recycled id() can never match
+        self.entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        # (id(value), indent, level) -> (value, JSON text)
+        self.texts: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self.shared: Dict[int, object] = {}
+        self.keys: Dict[str, str] = {}
+        self.counters = {"hits": 0, "builds": 0, "encoded_hits": 0}
+        self._lock = threading.Lock()
+    
+    def lookup(self, key: tuple, source, build):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] is source:
+                self.entries.move_to_end(key)
+                self.counters["hits"] += 1
+                return entry[1]
+        value = build()
+        with self._lock:
+            self.entries[key] = (source, value)
+            self.shared[id(value)] = value
+            self.counters["builds"] += 1
+            while len(self.entries) > self.max_entries:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.shared.pop(id(evicted), None)
+        return value
+    
+    def item(self, option, to_dict) -> Optional[Dict]:
+        """Shared dict of one flight or hotel option"""
+        if option is None:
+            return None
+        return self.lookup(("item", id(option)), option, lambda: to_dict(option))
+    
+    def items(self, options: List, to_dict) -> List[Dict]:
+        """Shared list of the dicts of one fare table"""
+        items = self.lookup(("items", id(options)), options, lambda: [to_dict(o) for o in options])
+        if len(items) != len(options):
+            # The table was edited in place; the next lookup must not reuse this list
+            with self._lock:
+                self.entries.pop(("items", id(options)), None)
+            return [to_dict(o) for o in options]
+        return items
+    
+    def by_content(self, name: str, content: tuple, build):
+        """Shared value built from hashable content, e.g. the local tips of a pricing dict"""
+        return self.lookup((name, content), content, build)
+    
+    def activity(self, attraction: Attraction, time_slot: str, build) -> Dict:
+        return self.lookup(("activity", id(attraction), time_slot), attraction, build)
+    
+    def encode(self, value, indent: Optional[int] = None) -> str:
+        """JSON text of value, exactly as json.dumps(value, indent=indent) writes it"""
+        chunks: List[str] = []
+        self.encode_value(value, None if indent is None else " " * indent, 0, chunks)
+        return "".join(chunks)
+    
+    def encode_value(self, value, indent: Optional[str], level: int, chunks: List[str]):
+        scalar = JSON_SCALARS.get(type(value))
+        if scalar is not None:
+            chunks.append(scalar(value))
+        elif self.shared.get(id(value), self) is value:
+            chunks.append(self.shared_text(value, indent, level))
+        elif isinstance(value, (dict, list, tuple)):
+            self.encode_container(value, indent, level, chunks)
+        else:
+            chunks.append(json.dumps(value))
+    
+    def shared_text(self, value, indent: Optional[str], level: int) -> str:
+        key = (id(value), indent, level)
+        with self._lock:
+            cached = self.texts.get(key)
+            if cached is not None and cached[0] is value:
+                self.texts.move_to_end(key)
+                self.counters["encoded_hits"] += 1
+                return cached[1]
+        # Shared parts hold no other cached text worth splicing, so the C encoder writes them whole
+        text = json.dumps(value, indent=indent)
+        if indent is not None and level:
+            # JSON strings escape newlines, so every newline here is layout
+            text = text.replace("\n", "\n" + indent * level)
+        with self._lock:
+            self.texts[key] = (value, text)
+            while len(self.texts) > self.max_entries:
+                self.texts.popitem(last=False)
+        return text
+    
+    def encode_container(self, value, indent: Optional[str], level: int, chunks: List[str]):
+        if not value:
+            chunks.append("{}" if isinstance(value, dict) else "[]")
+            return
+        if indent is None:
+            separator = ", "
+            opening = closing = ""
+        else:
+            separator = ",\n" + indent * (level + 1)
+            opening = "\n" + indent * (level + 1)
+            closing = "\n" + indent * level
+        if isinstance(value, dict):
+            chunks.append("{" + opening)
+            keys = self.keys
+            for i, (key, item) in enumerate(value.items()):
+                if i:
+                    chunks.append(separator)
+                text = keys.get(key) if type(key) is str else None
+                if text is None:
+                    text = json.dumps({key: None})[1:-7] + ": "
+                    if type(key) is str and len(keys) < self.max_entries:
+                        keys[key] = text
+                chunks.append(text)
+                self.encode_value(item, indent, level + 1, chunks)
+            chunks.append(closing + "}")
+        else:
+            chunks.append("[" + opening)
+            for i, item in enumerate(value):
+                if i:
+                    chunks.append(separator)
+                self.encode_value(item, indent, level + 1, chunks)
+            chunks.append(closing + "]")
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self.counters, entries=len(self.entries), encoded=len(self.texts))
+
+def encode_json_float(value: float) -> str:
+    if value != value:
+        return "NaN"
+    if value in (float("inf"), float("-inf")):
+        return "Infinity" if value > 0 else "-Infinity"
+    return float.__repr__(value)
+
+# How json.dumps writes the scalar types itineraries are made of
+JSON_SCALARS = {
+    str: json.encoder.encode_basestring_ascii,
+    int: int.__repr__,
+    float: encode_json_float,
+    bool: lambda value: "true" if value else "false",
+    type(None): lambda value: "null",
+}
+
+COST_TIPS = (
+    "Book flights early for better deals",
+    "Consider staying in neighborhoods outside city center",
+    "Look for free walking tours and attractions",
+    "Eat at local markets for cheaper meals"
+)
+
+class SimpleItineraryPlanner:
+    """Main planning agent without ML dependencies"""
+    
+    def __init__(self, tourist_db: Optional[SimpleTouristDatabase] = None,
+                 web_search: Optional[SimpleWebSearchTool] = None,
+                 day_scheduler: Optional[DayScheduler] = None,
+                 budget_solver: Optional[BudgetSolver] = None,
+                 instrumentation: Optional[PlannerInstrumentation] = None,
+                 itinerary_store: Optional[ItineraryStore] = None):
+        """day_scheduler replaces the default equal slicing of attractions into days;
+        budget_solver picks flight, hotel and activities jointly under the budget;
+        itinerary_store answers repeated requests without planning them again"""
+        self.tourist_db = tourist_db or SimpleTouristDatabase()
+        self.web_search = web_search or SimpleWebSearchTool()
+        self.day_scheduler = day_scheduler
+        self.budget_solver = budget_solver
+        self.instrumentation = instrumentation or PlannerInstrumentation()
+        self.itinerary_store = itinerary_store
+        self.fragments = ItineraryFragments()
+    
+    def planner_options(self) -> Dict:
+        """Planning options that batch workers need to plan like this planner"""
+        return {"day_scheduler": self.day_scheduler, "budget_solver": self.budget_solver}
+    
+    def data_versions(self) -> Optional[tuple]:
+        """Planner options and catalogue/provider data versions, or None when a source has no version"""
+        catalogue = getattr(self.tourist_db, "catalogue_version", None)
+        providers = getattr(self.web_search, "data_version", None)
+        if catalogue is None or providers is None:
+            return None
+        options = [(type(option).__name__, sorted(vars(option).items()))
+                   for option in (self.day_scheduler, self.budget_solver) if option is not None]
+        return fingerprint(options), catalogue(), providers()
+    
+    def store_key(self, request: TravelRequest) -> Optional[str]:
+        """itinerary_store key of request, or None when results cannot be stored"""
+        if self.itinerary_store is None:
+            return None
+        versions = self.data_versions()
+        if versions is None:
+            return None
+        try:
+            return self.itinerary_store.request_key(request, versions)
+        except (TypeError, ValueError):
+            return None  # invalid requests are left to fail in planning
+    
+    def stored_itinerary(self, key: Optional[str], request: TravelRequest) -> Optional[Dict]:
+        if key is None:
+            return None
+        itinerary = self.itinerary_store.get(key)
+        self.instrumentation.increment("itinerary_store_hits" if itinerary else "itinerary_store_misses")
+        if itinerary is not None:
+            # Equivalent requests share an entry; echo this request's own spelling
+            itinerary.update(destination=request.destination, budget=request.budget,
+                             dates=f"{request.start_date} to {request.end_date}")
+        return itinerary
+    
+    def parse_dates(self, request: TravelRequest):
+        try:
             start_date = datetime.strptime(request.start_date, "%Y-%m-%d")
             end_date = datetime.strptime(request.end_date, "%Y-%m-%d")
             if end_date < start_date:
                 raise ValueError("End date must be after start date")
         except ValueError as e:
             raise ValueError(f"Invalid date format or range: {e}. Use YYYY-MM-DD format.")
-
-        print("🔍 Searching for attractions...")
+        return start_date, end_date
+    
+    def find_attractions(self, request: TravelRequest) -> List[Attraction]:
         interests_query = " ".join(request.interests) if request.interests else ""
-        attractions = self.tourist_db.search_attractions(
+        return self.tourist_db.search_attractions(
             request.destination, 
             interests_query, 
             request.interests, 
             top_k=15
         )
+    
+    def create_itinerary(self, request: TravelRequest, profile: Optional[RequestProfile] = None) -> Dict:
+        """Plan one request; stage timings go to self.instrumentation (and to profile if given)"""
+        metrics = self.instrumentation
+        key = self.store_key(request)
+        stored = self.stored_itinerary(key, request)
+        if stored is not None:
+            return stored
+        
+        with metrics.request(profile):
+            itinerary = self.plan_itinerary(request)
+        if key is not None:
+            self.itinerary_store.put(key, itinerary)
+        return itinerary
+    
+    def plan_itinerary(self, request: TravelRequest) -> Dict:
+        """Run every planning stage for request"""
+        metrics = self.instrumentation
+        start_date, end_date = self.parse_dates(request)
+        
+        with metrics.stage("search"):
+            attractions = self.find_attractions(request)
         if not attractions:
-            print(f"⚠️ No attractions found for {request.destination}")
+            metrics.increment("empty_searches")
         
-        print("✈️ Searching for flights...")
-        flights = self.web_search.search_flights("Home City", request.destination, request.start_date, request.travelers)
+        with metrics.stage("flights"):
+            flights = self.web_search.search_flights("Home City", request.destination, request.start_date,
+                                                     request.travelers)
         
-        print("🏨 Searching for hotels...")
-        hotels = self.web_search.search_hotels(request.destination, request.start_date, request.end_date, request.travelers)
+        with metrics.stage("hotels"):
+            hotels = self.web_search.search_hotels(request.destination, request.start_date, request.end_date,
+                                                   request.travelers)
         
-        print("💰 Getting pricing information...")
-        pricing = self.web_search.get_current_prices(request.destination)
+        with metrics.stage("pricing"):
+            pricing = self.web_search.get_current_prices(request.destination)
         
+        return self.assemble_itinerary(request, start_date, end_date, attractions, flights, hotels, pricing)
+    
+    def assemble_itinerary(self, request: TravelRequest, start_date: datetime, end_date: datetime,
+                           attractions: List[Attraction], flights: List[FlightOption],
+                           hotels: List[HotelOption], pricing: Dict, verbose: bool = True) -> Dict:
+        """Build the itinerary dict from already gathered attractions and provider data.
+        verbose only adds debug log records; stage timings are always recorded."""
         trip_days = (end_date - start_date).days
         if trip_days <= 0:
             raise ValueError("Trip duration must be at least one day")
         
-        print("📅 Planning daily activities...")
-        daily_itineraries = self.plan_daily_activities(
-            attractions, trip_days, request.budget, pricing, start_date
-        )
+        if self.budget_solver is not None:
+            return self.assemble_solved_itinerary(request, start_date, trip_days, attractions,
+                                                  flights, hotels, pricing, verbose)
+        
+        metrics = self.instrumentation
+        if verbose:
+            rate_limited_log.debug("planning-days", "Planning %d days in %s", trip_days, request.destination)
+        with metrics.stage("scheduling"):
+            daily_itineraries = self.plan_daily_activities(
+                attractions, trip_days, request.budget, pricing, start_date
+            )
         
-        print("🎯 Generating recommendations...")
-        recommendations = self.generate_recommendations(request, flights, hotels, pricing)
+        with metrics.stage("recommendations"):
+            recommendations = self.generate_recommendations(request, flights, hotels, pricing, nights=trip_days)
         
+        with metrics.stage("serialization"):
+            return self.build_itinerary_dict(request, trip_days, attractions, flights, hotels,
+                                             daily_itineraries, recommendations)
+    
+    def build_itinerary_dict(self, request: TravelRequest, trip_days: int, attractions: List[Attraction],
+                             flights: List[FlightOption], hotels: List[HotelOption],
+                             daily_itineraries: List[DayItinerary], recommendations: Dict) -> Dict:
         total_cost = self.calculate_total_cost(recommendations, daily_itineraries, trip_days)
+        costs = self.cost_components(recommendations, daily_itineraries, trip_days)
         
         return {
             "destination": request.destination,
@@ -405,42 +3408,457 @@ class SimpleItineraryPlanner:
             "duration": f"{trip_days} days",
             "budget": request.budget,
             "estimated_cost": total_cost,
-            "flights": [self.flight_to_dict(f) for f in flights],
-            "hotels": [self.hotel_to_dict(h) for h in hotels],
+            "flights": self.fragments.items(flights, self.flight_to_dict),
+            "hotels": self.fragments.items(hotels, self.hotel_to_dict),
             "daily_itineraries": [self.itinerary_to_dict(day) for day in daily_itineraries],
             "recommendations": recommendations,
-            "budget_breakdown": self.create_budget_breakdown(total_cost, trip_days),
+            "budget_breakdown": self.create_budget_breakdown(total_cost, trip_days, costs),
             "attractions_found": len(attractions)
         }
     
+    def plan_with_state(self, request: TravelRequest, previous: Optional["PlanState"] = None) -> "PlanState":
+        """Plan request and return the itinerary together with its per-stage results.
+        
+        Each stage (attraction search, flights, hotels, pricing, days,
+        recommendations) is fingerprinted by its inputs; when previous has a
+        result with the same fingerprint it is reused instead of recomputed.
+        With the default day slicer individual days are reused too, so moving the
+        end date only builds the added days. The itinerary equals create_itinerary.
+        """
+        start_date, end_date = self.parse_dates(request)
+        trip_days = (end_date - start_date).days
+        state = PlanState(request=request)
+        previous_stages = previous.stages if previous else {}
+        
+        def stage(name: str, inputs: tuple, compute):
+            key = fingerprint(*inputs)
+            cached = previous_stages.get(name)
+            if cached is not None and cached[0] == key:
+                state.reused.append(name)
+                value = cached[1]
+            else:
+                state.recomputed.append(name)
+                value = compute()
+            state.stages[name] = (key, value)
+            return value
+        
+        destination = city_key(request.destination)
+        interests = tuple(request.interests) if request.interests else ()
+        # Data versions make a catalogue or fare update invalidate the stages that read that data
+        catalogue = getattr(self.tourist_db, "catalogue_version", lambda: None)()
+        providers = getattr(self.web_search, "data_version", lambda: None)()
+        attractions = stage("attractions", (destination, interests, catalogue), lambda: self.find_attractions(request))
+        flights = stage("flights", (destination, request.start_date, request.travelers, providers),
+                        lambda: self.web_search.search_flights("Home City", request.destination,
+                                                               request.start_date, request.travelers))
+        hotels = stage("hotels", (destination, request.start_date, request.end_date, request.travelers, providers),
+                       lambda: self.web_search.search_hotels(request.destination, request.start_date,
+                                                             request.end_date, request.travelers))
+        pricing = stage("pricing", (destination, providers),
+                        lambda: self.web_search.get_current_prices(request.destination))
+        
+        if trip_days <= 0:
+            raise ValueError("Trip duration must be at least one day")
+        if self.budget_solver is not None:
+            # The solver couples every stage, so only the lookups are reused
+            state.itinerary = self.assemble_solved_itinerary(request, start_date, trip_days, attractions,
+                                                             flights, hotels, pricing, verbose=False)
+            return state
+        
+        attractions_key = state.stages["attractions"][0]
+        pricing_key = state.stages["pricing"][0]
+        if self.day_scheduler is not None:
+            daily_itineraries = stage(
+                "days", (attractions_key, pricing_key, trip_days, request.budget, request.start_date,
+                         sorted(vars(self.day_scheduler).items())),
+                lambda: self.plan_daily_activities(attractions, trip_days, request.budget, pricing, start_date))
+        else:
+            daily_itineraries = self.replan_days(state, previous_stages, attractions, trip_days,
+                                                 request.budget, pricing, fingerprint(pricing_key, catalogue),
+                                                 start_date)
+        
+        recommendations = stage(
+            "recommendations", (request.budget, request.travelers, trip_days, state.stages["flights"][0],
+                                state.stages["hotels"][0], pricing_key),
+            lambda: self.generate_recommendations(request, flights, hotels, pricing, nights=trip_days))
+        
+        state.itinerary = self.build_itinerary_dict(request, trip_days, attractions, flights, hotels,
+                                                    daily_itineraries, copy_recommendations(recommendations))
+        return state
+    
+    def replan_days(self, state: "PlanState", previous_stages: Dict, attractions: List[Attraction], days: int,
+                    budget: float, pricing: Dict, data_key: str, start_date: datetime) -> List[DayItinerary]:
+        """Slicer days, reusing every day whose attractions, date and pricing are unchanged.
+        data_key also covers the catalogue version, since a day only names its attractions."""
+        previous_days = previous_stages.get("day_cache", ("", {}))[1]
+        day_cache = {}
+        daily_budget = budget / days if days > 0 else budget
+        daily_itineraries = []
+        for day, day_attractions in enumerate(self.slice_days(attractions, days)):
+            current_date = start_date + timedelta(days=day)
+            key = fingerprint(day, current_date, [(a.city, a.name) for a in day_attractions], data_key)
+            cached = previous_days.get(key)
+            if cached is None:
+                itinerary = self.build_day(day + 1, current_date, day_attractions, daily_budget, pricing)
+            else:
+                # Notes depend on the per-day budget share, which changes with the trip length
+                itinerary = replace(cached, notes=self.generate_day_notes(
+                    day + 1, cached.activities, daily_budget, cached.estimated_cost))
+            day_cache[key] = itinerary
+            daily_itineraries.append(itinerary)
+        
+        reused = len(set(day_cache) & set(previous_days))
+        state.reused_days, state.recomputed_days = reused, len(daily_itineraries) - reused
+        state.stages["day_cache"] = ("", day_cache)
+        return daily_itineraries
+    
+    def replan(self, previous: "PlanState", **changes) -> "PlanState":
+        """Re-plan after changing some TravelRequest fields, e.g. replan(state, end_date="2024-09-06")"""
+        return self.plan_with_state(replace(previous.request, **changes), previous)
+    
+    def assemble_solved_itinerary(self, request: TravelRequest, start_date: datetime, trip_days: int,
+                                  attractions: List[Attraction], flights: List[FlightOption],
+                                  hotels: List[HotelOption], pricing: Dict, verbose: bool = True) -> Dict:
+        """Itinerary built around the BudgetSolver's joint flight/hotel/activity choice"""
+        metrics = self.instrumentation
+        if verbose:
+            rate_limited_log.debug("budget-solver", "Optimizing %s trip for a budget of %s",
+                                   request.destination, request.budget)
+        with metrics.stage("scheduling"):
+            plan = self.budget_solver.solve(request, trip_days, flights, hotels, attractions, pricing,
+                                            lambda a: self.parse_price_range(a.price_range))
+            daily_itineraries = self.plan_chosen_activities(
+                plan.activities, trip_days, request.budget, pricing, start_date
+            )
+        
+        with metrics.stage("recommendations"):
+            recommendations = self.generate_recommendations(request, flights, hotels, pricing, nights=trip_days)
+        recommendations["recommended_flight"] = self.fragments.item(plan.flight, self.flight_to_dict)
+        recommendations["recommended_hotel"] = self.fragments.item(plan.hotel, self.hotel_to_dict)
+        
+        # The day scheduler may drop activities, so cost what was actually planned; day costs are per person
+        travelers = max(1, request.travelers)
+        activities_cost = sum(a["estimated_cost"] for day in daily_itineraries for a in day.activities)
+        meals_transport = sum(day.estimated_cost for day in daily_itineraries) - activities_cost
+        costs = dict(plan.costs,
+                     activities=round(activities_cost * travelers, 2),
+                     meals_transport=round(meals_transport * travelers, 2))
+        total_cost = round(sum(costs.values()), 2)
+        
+        with metrics.stage("serialization"):
+            return self.solved_itinerary_dict(request, trip_days, attractions, flights, hotels,
+                                              daily_itineraries, recommendations, plan, costs, total_cost)
+    
+    def solved_itinerary_dict(self, request: TravelRequest, trip_days: int, attractions: List[Attraction],
+                              flights: List[FlightOption], hotels: List[HotelOption],
+                              daily_itineraries: List[DayItinerary], recommendations: Dict,
+                              plan: BudgetPlan, costs: Dict, total_cost: float) -> Dict:
+        return {
+            "destination": request.destination,
+            "dates": f"{request.start_date} to {request.end_date}",
+            "duration": f"{trip_days} days",
+            "budget": request.budget,
+            "estimated_cost": total_cost,
+            "flights": self.fragments.items(flights, self.flight_to_dict),
+            "hotels": self.fragments.items(hotels, self.hotel_to_dict),
+            "daily_itineraries": [self.itinerary_to_dict(day) for day in daily_itineraries],
+            "recommendations": recommendations,
+            "budget_breakdown": self.create_budget_breakdown(total_cost, trip_days, costs),
+            "attractions_found": len(attractions),
+            "budget_plan": self.budget_plan_dict(request, plan)
+        }
+    
+    @staticmethod
+    def budget_plan_dict(request: TravelRequest, plan: BudgetPlan) -> Dict:
+        summary = {"within_budget": plan.within_budget, "value": plan.value,
+                   "selected_activities": len(plan.activities)}
+        if not plan.within_budget:
+            summary["shortfall"] = plan.shortfall
+            summary["note"] = (f"The budget of {request.budget:.2f} does not cover any plan; this is the cheapest "
+                               f"flight and hotel with free activities only, {plan.shortfall:.2f} over budget")
+        return summary
+    
+    def create_itineraries(self, requests: List[TravelRequest], workers: int = 1) -> List[Dict]:
+        """Plan a batch of requests.
+        
+        Provider lookups are done once per distinct input in this process, so loaded
+        fares and injected providers apply. With workers > 1 the attraction searches
+        and the planning run in a pool of `workers` processes that read the same
+        catalogue (db_path or snapshot). Workers only pay off with several cores and
+        slow planning (budget_solver, long trips): the benchmark's
+        create_itineraries_workers stage measures it. Results are in input order; a
+        request that fails yields {"destination": ..., "error": ...}.
+        Requests found in itinerary_store are not planned again.
+        """
+        keys = [self.store_key(request) for request in requests]
+        results = [self.stored_itinerary(key, request) for key, request in zip(keys, requests)]
+        pending = [i for i, result in enumerate(results) if result is None]
+        if pending:
+            planned = self.plan_batch([requests[i] for i in pending], workers)
+            for i, itinerary in zip(pending, planned):
+                results[i] = itinerary
+                if keys[i] is not None and "error" not in itinerary:
+                    self.itinerary_store.put(keys[i], itinerary)
+        return results
+    
+    def plan_batch(self, requests: List[TravelRequest], workers: int = 1) -> List[Dict]:
+        chunk_size = max(1, -(-len(requests) // (max(workers, 1) * 4)))
+        # Searching is the CPU-heavy lookup, so workers do it against their own view of the catalogue
+        chunks = self.prepare_batch(requests, chunk_size, search=workers <= 1)
+        results: List[Optional[Dict]] = [None] * len(requests)
+        
+        if workers <= 1:
+            for chunk in chunks:
+                for position, result in self.plan_batch_chunk(chunk):
+                    results[position] = result
+            return results
+        
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker,
+                                 initargs=(self.tourist_db.db_path, self.planner_options(),
+                                           getattr(self.tourist_db, "snapshot_path", None))) as pool:
+            for chunk_results in pool.map(_plan_batch_chunk, chunks):
+                for position, result in chunk_results:
+                    results[position] = result
+        return results
+    
+    def prepare_batch(self, requests: List[TravelRequest], chunk_size: int, search: bool = True) -> List[List]:
+        """Group requests by destination and run the lookups once per distinct input.
+        
+        Returns chunks of (position, request, lookups or error) items. Items of one
+        destination share the same lookup objects, so a chunk pickles them once.
+        With search=False the attractions are left as None for plan_batch_chunk.
+        """
+        by_city: Dict[str, List[int]] = {}
+        for position, request in enumerate(requests):
+            by_city.setdefault(city_key(request.destination), []).append(position)
+        
+        chunks = []
+        for positions in by_city.values():
+            memo: Dict[tuple, object] = {}
+            
+            def lookup(key: tuple, fetch):
+                if key not in memo:
+                    memo[key] = fetch()
+                return memo[key]
+            
+            items = []
+            for position in positions:
+                request = requests[position]
+                try:
+                    interests = tuple(request.interests) if request.interests else ()
+                    lookups = (
+                        lookup(("attractions", request.destination, interests),
+                               lambda: self.find_attractions(request)) if search else None,
+                        lookup(("flights", request.destination, request.start_date, request.travelers),
+                               lambda: self.web_search.search_flights("Home City", request.destination,
+                                                                      request.start_date, request.travelers)),
+                        lookup(("hotels", request.destination, request.start_date, request.end_date, request.travelers),
+                               lambda: self.web_search.search_hotels(request.destination, request.start_date,
+                                                                     request.end_date, request.travelers)),
+                        lookup(("pricing", request.destination),
+                               lambda: self.web_search.get_current_prices(request.destination)),
+                    )
+                    items.append((position, request, lookups, None))
+                except Exception as e:
+                    items.append((position, request, None, str(e)))
+            
+            for start in range(0, len(items), chunk_size):
+                chunks.append(items[start:start + chunk_size])
+        return chunks
+    
+    def plan_batch_chunk(self, chunk: List) -> List[tuple]:
+        results = []
+        searches: Dict[tuple, List[Attraction]] = {}
+        for position, request, lookups, error in chunk:
+            if error is None:
+                try:
+                    if lookups[0] is None:
+                        key = (request.destination, tuple(request.interests or ()))
+                        if key not in searches:
+                            searches[key] = self.find_attractions(request)
+                        lookups = (searches[key],) + tuple(lookups[1:])
+                    start_date, end_date = self.parse_dates(request)
+                    result = self.assemble_itinerary(request, start_date, end_date, *lookups, verbose=False)
+                except Exception as e:
+                    error = str(e)
+            if error is not None:
+                result = {"destination": request.destination, "error": error}
+            results.append((position, result))
+        return results
+    
+    def sweep_dates(self, request: TravelRequest, earliest: str, latest: str, nights: int,
+                    max_nights: Optional[int] = None, top_n: int = 3) -> List[Dict]:
+        """Cheapest trip windows of nights..max_nights nights between earliest and latest.
+        
+        latest is the last possible return day. Attractions, pricing and the activity
+        cost of each stay length are computed once; every window then only adds the
+        flight and hotel recommended for its dates. Full itineraries are built for the
+        top_n cheapest windows, returned as {"window": DateWindow fields, "itinerary": ...}.
+        With a budget_solver, windows are still ranked by the recommended flight and hotel.
+        """
+        first = datetime.strptime(earliest, "%Y-%m-%d")
+        last = datetime.strptime(latest, "%Y-%m-%d")
+        max_nights = max_nights or nights
+        if nights < 1 or max_nights < nights:
+            raise ValueError("nights must be at least 1 and at most max_nights")
+        if (last - first).days < nights:
+            raise ValueError(f"{earliest} to {latest} is shorter than {nights} nights")
+        
+        attractions = self.find_attractions(request)
+        pricing = self.web_search.get_current_prices(request.destination)
+        prefix = list(accumulate((self.parse_price_range(a.price_range) for a in attractions), initial=0))
+        stay_costs = {n: self.stay_activity_costs(attractions, n, request.budget, pricing, first, prefix)
+                      for n in range(nights, max_nights + 1)}
+        
+        windows, fares = [], {}
+        for offset in range((last - first).days - nights + 1):
+            start = first + timedelta(days=offset)
+            start_text = start.strftime("%Y-%m-%d")
+            flights = self.web_search.search_flights("Home City", request.destination, start_text, request.travelers)
+            if not isinstance(flights, PricedOptions):
+                flights = PricedOptions(flights, "price")
+            flight = flights.cheapest()
+            flight_cost = flight.price * 2 if flight else 0
+            for n in range(nights, min(max_nights, (last - start).days) + 1):
+                end_text = (start + timedelta(days=n)).strftime("%Y-%m-%d")
+                hotels = self.web_search.search_hotels(request.destination, start_text, end_text, request.travelers)
+                if not isinstance(hotels, PricedOptions):
+                    hotels = PricedOptions(hotels, "price_per_night", hotel_value)
+                hotel = hotels.best_value(request.budget * 0.3 / n) or hotels.cheapest()
+                hotel_cost = hotel.price_per_night * n if hotel else 0
+                total = round(flight_cost + hotel_cost + stay_costs[n], 2)
+                windows.append(DateWindow(start_text, end_text, n, flight_cost, hotel_cost, stay_costs[n],
+                                          total, total <= request.budget))
+                fares[start_text, end_text] = (flights, hotels)
+        
+        results = []
+        for window in heapq.nsmallest(top_n, windows, key=lambda w: (w.estimated_cost, w.start_date, w.nights)):
+            window_request = replace(request, start_date=window.start_date, end_date=window.end_date)
+            start_date, end_date = self.parse_dates(window_request)
+            flights, hotels = fares[window.start_date, window.end_date]
+            itinerary = self.assemble_itinerary(window_request, start_date, end_date, attractions,
+                                                flights, hotels, pricing, verbose=False)
+            results.append({"window": asdict(window), "itinerary": itinerary})
+        return results
+    
     def plan_daily_activities(self, attractions: List[Attraction], days: int, 
                             budget: float, pricing: Dict, start_date: datetime) -> List[DayItinerary]:
         """Plan activities for each day"""
-        daily_itineraries = []
+        if self.day_scheduler is not None:
+            return self.plan_scheduled_activities(attractions, days, budget, pricing, start_date)
+        
         daily_budget = budget / days if days > 0 else budget
+        return [
+            self.build_day(day + 1, start_date + timedelta(days=day), day_attractions, daily_budget, pricing)
+            for day, day_attractions in enumerate(self.slice_days(attractions, days))
+        ]
+    
+    def plan_chosen_activities(self, activities: List[Attraction], days: int,
+                               budget: float, pricing: Dict, start_date: datetime) -> List[DayItinerary]:
+        """Plan days for an already chosen set of activities, each one exactly once.
         
+        The slicer would cycle a short list over the remaining days, which adds
+        activities (and costs) the budget solver never chose.
+        """
+        if self.day_scheduler is not None:
+            return self.plan_scheduled_activities(activities, days, budget, pricing, start_date)
+        
+        daily_budget = budget / days if days > 0 else budget
+        count = len(activities)
+        return [
+            self.build_day(day + 1, start_date + timedelta(days=day),
+                           activities[day * count // days:(day + 1) * count // days], daily_budget, pricing)
+            for day in range(days)
+        ]
+    
+    def slice_days(self, attractions: List[Attraction], days: int) -> List[List[Attraction]]:
+        """Split the ranked attractions into equal consecutive chunks, one per day"""
+        return [attractions[start:end] for start, end in self.slice_bounds(len(attractions), days)]
+    
+    def slice_bounds(self, count: int, days: int) -> List[Tuple[int, int]]:
+        """(start, end) index of each day's chunk of count ranked attractions"""
         # Ensure at least one attraction per day if available
-        activities_per_day = max(1, len(attractions) // days if days > 0 else len(attractions))
+        activities_per_day = max(1, count // days if days > 0 else count)
         
-        # Distribute attractions across days
+        bounds = []
         for day in range(days):
-            current_date = start_date + timedelta(days=day)
-            activities = []
-            day_cost = 0
-            
-            time_slots = ["Morning", "Afternoon", "Evening"]
-            
             # Cycle through attractions if fewer than days
-            start_idx = (day * activities_per_day) % len(attractions) if attractions else 0
-            end_idx = min(start_idx + activities_per_day, len(attractions)) if attractions else 0
-            day_attractions = attractions[start_idx:end_idx] if attractions else []
+            start_idx = (day * activities_per_day) % count if count else 0
+            end_idx = min(start_idx + activities_per_day, count) if count else 0
+            bounds.append((start_idx, end_idx))
+        return bounds
+    
+    def stay_activity_costs(self, attractions: List[Attraction], days: int, budget: float, pricing: Dict,
+                            start_date: datetime, prefix: Optional[List[float]] = None) -> float:
+        """Sum of the day costs plan_daily_activities gives a stay of days days.
+        
+        Day costs do not depend on the dates, so without a day_scheduler they are
+        taken from prefix sums of the attraction prices instead of building the days.
+        """
+        if self.day_scheduler is not None:
+            return sum(day.estimated_cost
+                       for day in self.plan_scheduled_activities(attractions, days, budget, pricing, start_date))
+        if prefix is None:
+            prefix = list(accumulate((self.parse_price_range(a.price_range) for a in attractions), initial=0))
+        # Same order of additions (and rounding per day) as build_day and calculate_total_cost
+        return sum(round(prefix[end] - prefix[start] + pricing["average_meal"] * 3 + pricing["local_transport"] * 4, 2)
+                   for start, end in self.slice_bounds(len(attractions), days))
+    
+    def build_day(self, day: int, current_date: datetime, day_attractions: List[Attraction],
+                  daily_budget: float, pricing: Dict) -> DayItinerary:
+        activities = []
+        day_cost = 0
+        
+        time_slots = ["Morning", "Afternoon", "Evening"]
+        
+        for i, attraction in enumerate(day_attractions):
+            time_slot = time_slots[i % len(time_slots)]
+            activity_cost = self.parse_price_range(attraction.price_range)
             
-            for i, attraction in enumerate(day_attractions):
-                time_slot = time_slots[i % len(time_slots)]
+            # The same attraction in the same slot is one shared dict across itineraries
+            activity = self.fragments.activity(attraction, time_slot, lambda: {
+                "time": time_slot,
+                "activity": attraction.name,
+                "description": attraction.description,
+                "duration": attraction.duration,
+                "location": attraction.location,
+                "category": attraction.category,
+                "rating": attraction.rating,
+                "estimated_cost": activity_cost
+            })
+            activities.append(activity)
+            day_cost += activity_cost
+        
+        # Add meals and transport
+        day_cost += pricing["average_meal"] * 3
+        day_cost += pricing["local_transport"] * 4
+        
+        notes = self.generate_day_notes(day, activities, daily_budget, day_cost)
+        
+        return DayItinerary(
+            day=day,
+            date=current_date.strftime("%Y-%m-%d"),
+            activities=activities,
+            estimated_cost=round(day_cost, 2),
+            notes=notes
+        )
+    
+    def plan_scheduled_activities(self, attractions: List[Attraction], days: int,
+                                  budget: float, pricing: Dict, start_date: datetime) -> List[DayItinerary]:
+        """Plan days with self.day_scheduler, using attraction durations and locations"""
+        daily_budget = budget / days if days > 0 else budget
+        schedule = self.day_scheduler.schedule(attractions, days, lambda a: self.parse_price_range(a.price_range))
+        
+        daily_itineraries = []
+        for day, day_schedule in enumerate(schedule):
+            activities = []
+            day_cost = 0
+            for attraction, start_hour, hours in day_schedule:
                 activity_cost = self.parse_price_range(attraction.price_range)
-                
-                activity = {
-                    "time": time_slot,
+                start_time = f"{int(start_hour):02d}:{int(round(start_hour % 1 * 60)):02d}"
+                activities.append(self.fragments.activity(attraction, start_time, lambda: {
+                    "time": "Morning" if start_hour < 12 else "Afternoon" if start_hour < 17 else "Evening",
+                    "start_time": start_time,
                     "activity": attraction.name,
                     "description": attraction.description,
                     "duration": attraction.duration,
@@ -448,24 +3866,19 @@ class SimpleItineraryPlanner:
                     "category": attraction.category,
                     "rating": attraction.rating,
                     "estimated_cost": activity_cost
-                }
-                activities.append(activity)
+                }))
                 day_cost += activity_cost
             
-            # Add meals and transport
             day_cost += pricing["average_meal"] * 3
             day_cost += pricing["local_transport"] * 4
             
-            notes = self.generate_day_notes(day + 1, activities, daily_budget, day_cost)
-            
             daily_itineraries.append(DayItinerary(
                 day=day + 1,
-                date=current_date.strftime("%Y-%m-%d"),
+                date=(start_date + timedelta(days=day)).strftime("%Y-%m-%d"),
                 activities=activities,
                 estimated_cost=round(day_cost, 2),
-                notes=notes
+                notes=self.generate_day_notes(day + 1, activities, daily_budget, day_cost)
             ))
-        
         return daily_itineraries
     
     def parse_price_range(self, price_range: str) -> float:
@@ -479,54 +3892,73 @@ class SimpleItineraryPlanner:
         return price_map.get(price_range, 25)
     
     def generate_recommendations(self, request: TravelRequest, flights: List[FlightOption], 
-                               hotels: List[HotelOption], pricing: Dict) -> Dict:
-        flight_budget = request.budget * 0.4
+                               hotels: List[HotelOption], pricing: Dict, nights: Optional[int] = None) -> Dict:
+        if nights is None:
+            start_date, end_date = self.parse_dates(request)
+            nights = max(1, (end_date - start_date).days)
         hotel_budget = request.budget * 0.3
+        if not isinstance(flights, PricedOptions):
+            flights = PricedOptions(flights, "price")
+        if not isinstance(hotels, PricedOptions):
+            hotels = PricedOptions(hotels, "price_per_night", hotel_value)
         
-        affordable_flights = [f for f in flights if f.price <= flight_budget]
-        affordable_hotels = [h for h in hotels if h.price_per_night <= hotel_budget / 7]
-        
-        recommended_flight = min(affordable_flights, key=lambda x: x.price) if affordable_flights else \
-                            min(flights, key=lambda x: x.price) if flights else None
-        
-        recommended_hotel = max(affordable_hotels, key=lambda x: x.rating - (x.price_per_night / 100)) if affordable_hotels else \
-                           min(hotels, key=lambda x: x.price_per_night) if hotels else None
+        # The cheapest flight is also the cheapest within the flight budget (40%) when any fits
+        recommended_flight = flights.cheapest()
+        recommended_hotel = hotels.best_value(hotel_budget / nights) or hotels.cheapest()
         
         return {
-            "recommended_flight": self.flight_to_dict(recommended_flight) if recommended_flight else None,
-            "recommended_hotel": self.hotel_to_dict(recommended_hotel) if recommended_hotel else None,
-            "local_tips": [
-                f"Average meal cost: {pricing['currency']} {pricing['average_meal']}",
-                f"Local transport: {pricing['currency']} {pricing['local_transport']} per ride",
-                "Book attractions in advance for better prices",
-                "Consider city tourist cards for discounts",
-                f"Currency: {pricing['currency']}",
-                "Download offline maps to save on data roaming"
-            ]
+            "recommended_flight": self.fragments.item(recommended_flight, self.flight_to_dict),
+            "recommended_hotel": self.fragments.item(recommended_hotel, self.hotel_to_dict),
+            "local_tips": self.fragments.by_content(
+                "local_tips", (pricing['currency'], pricing['average_meal'], pricing['local_transport']),
+                lambda: self.local_tips(pricing))
         }
     
+    def local_tips(self, pricing: Dict) -> List[str]:
+        return [
+            f"Average meal cost: {pricing['currency']} {pricing['average_meal']}",
+            f"Local transport: {pricing['currency']} {pricing['local_transport']} per ride",
+            "Book attractions in advance for better prices",
+            "Consider city tourist cards for discounts",
+            f"Currency: {pricing['currency']}",
+            "Download offline maps to save on data roaming"
+        ]
+    
     def calculate_total_cost(self, recommendations: Dict, daily_itineraries: List[DayItinerary], days: int) -> float:
         flight_cost = recommendations["recommended_flight"]["price"] * 2 if recommendations.get("recommended_flight") else 0
         hotel_cost = recommendations["recommended_hotel"]["price_per_night"] * days if recommendations.get("recommended_hotel") else 0
         activities_cost = sum(day.estimated_cost for day in daily_itineraries)
         return round(flight_cost + hotel_cost + activities_cost, 2)
     
-    def create_budget_breakdown(self, total_cost: float, days: int) -> Dict:
+    def cost_components(self, recommendations: Dict, daily_itineraries: List[DayItinerary], days: int) -> Dict:
+        """Split calculate_total_cost into flights, accommodation, activities and meals/transport"""
+        flight = recommendations.get("recommended_flight")
+        hotel = recommendations.get("recommended_hotel")
+        activities_cost = sum(a["estimated_cost"] for day in daily_itineraries for a in day.activities)
         return {
-            "total_estimated_cost": total_cost,
-            "daily_average": round(total_cost / days, 2) if days > 0 else 0,
-            "breakdown": {
+            "flights": round(flight["price"] * 2, 2) if flight else 0,
+            "accommodation": round(hotel["price_per_night"] * days, 2) if hotel else 0,
+            "activities": round(activities_cost, 2),
+            "meals_transport": round(sum(day.estimated_cost for day in daily_itineraries) - activities_cost, 2)
+        }
+    
+    def create_budget_breakdown(self, total_cost: float, days: int, costs: Optional[Dict] = None) -> Dict:
+        if costs:
+            total = sum(costs.values())
+            breakdown = {name: f"{round(100 * amount / total) if total else 0}%" for name, amount in costs.items()}
+        else:
+            breakdown = {
                 "flights": "40%",
                 "accommodation": "30%",
                 "activities": "20%",
                 "meals_transport": "10%"
-            },
-            "cost_tips": [
-                "Book flights early for better deals",
-                "Consider staying in neighborhoods outside city center",
-                "Look for free walking tours and attractions",
-                "Eat at local markets for cheaper meals"
-            ]
+            }
+        return {
+            "total_estimated_cost": total_cost,
+            "daily_average": round(total_cost / days, 2) if days > 0 else 0,
+            "breakdown": breakdown,
+            "amounts": costs or {},
+            "cost_tips": self.fragments.by_content("cost_tips", COST_TIPS, lambda: list(COST_TIPS))
         }
     
     def generate_day_notes(self, day: int, activities: List[Dict], budget: float, cost: float) -> str:
@@ -569,10 +4001,694 @@ class SimpleItineraryPlanner:
             "notes": itinerary.notes
         }
 
-def main():
-    """Example usage of the Travel Itinerary Planner"""
+class RouteOptimizer:
+    """Orders the stops of a multi-city trip to minimise transfer cost and time.
+    
+    A transfer's cost is its fare for all travelers plus hour_value per hour of
+    door-to-door travel; trains are assumed below train_max_km, flights above.
+    Up to exact_limit stops the order is exact (Held-Karp, O(2^n n^2)); beyond that
+    nearest neighbour from every start is refined with 2-opt.
+    """
+    
+    def __init__(self, coordinates: Optional[Dict[str, Tuple[float, float]]] = None, hour_value: float = 25.0,
+                 train_max_km: float = 600.0, exact_limit: int = 10):
+        self.coordinates = {city_key(city): point for city, point in (coordinates or CITY_COORDINATES).items()}
+        self.hour_value = hour_value
+        self.train_max_km = train_max_km
+        self.exact_limit = exact_limit
+    
+    def transfer(self, origin: str, destination: str, travelers: int = 1) -> Dict:
+        """Mode, distance, hours and fare of going from origin to destination"""
+        points = [self.coordinates.get(city_key(city)) for city in (origin, destination)]
+        if None in points:
+            missing = [city for city, point in zip((origin, destination), points) if point is None]
+            raise ValueError(f"No coordinates for {', '.join(missing)}")
+        km = haversine_km(*points)
+        if km <= self.train_max_km:
+            mode, hours, fare = "train", 0.5 + km / 110, 20 + 0.10 * km
+        else:
+            mode, hours, fare = "flight", 3.0 + km / 750, 50 + 0.08 * km
+        return {"from": origin, "to": destination, "mode": mode, "distance_km": round(km, 1),
+                "hours": round(hours, 2), "cost": round(fare * travelers, 2)}
+    
+    def cost_matrix(self, cities: List[str], travelers: int) -> List[List[float]]:
+        matrix = [[0.0] * len(cities) for _ in cities]
+        for i, a in enumerate(cities):
+            for j, b in enumerate(cities):
+                if i != j:
+                    leg = self.transfer(a, b, travelers)
+                    matrix[i][j] = leg["cost"] + self.hour_value * leg["hours"]
+        return matrix
+    
+    def order(self, stops: List[str], travelers: int = 1, origin: Optional[str] = None,
+              round_trip: bool = False) -> Tuple[List[str], float]:
+        """Best visiting order of stops (origin excluded) and its weighted transfer cost"""
+        cities = ([origin] if origin else []) + list(stops)
+        if len(stops) <= 1:
+            route = list(range(len(cities)))
+        else:
+            cost = self.cost_matrix(cities, travelers)
+            if len(stops) <= self.exact_limit:
+                route = self.held_karp(cost, origin is not None, round_trip)
+            else:
+                route = self.two_opt_heuristic(cost, origin is not None, round_trip)
+        if origin:
+            route = route[1:]
+        ordered = [cities[i] for i in route]
+        path = ([origin] if origin else []) + ordered + ([origin] if origin and round_trip else [])
+        legs = [self.transfer(a, b, travelers) for a, b in zip(path, path[1:])]
+        return ordered, round(sum(leg["cost"] + self.hour_value * leg["hours"] for leg in legs), 2)
+    
+    def held_karp(self, cost: List[List[float]], fixed_start: bool, round_trip: bool) -> List[int]:
+        n = len(cost)
+        full = (1 << n) - 1
+        best = [[math.inf] * n for _ in range(1 << n)]
+        parent = [[-1] * n for _ in range(1 << n)]
+        for start in ([0] if fixed_start else range(n)):
+            best[1 << start][start] = 0.0
+        
+        for mask in range(1, 1 << n):
+            row = best[mask]
+            for last in range(n):
+                here = row[last]
+                if here == math.inf:
+                    continue
+                edges = cost[last]
+                for nxt in range(n):
+                    if mask & (1 << nxt):
+                        continue
+                    candidate = here + edges[nxt]
+                    next_mask = mask | (1 << nxt)
+                    if candidate < best[next_mask][nxt]:
+                        best[next_mask][nxt] = candidate
+                        parent[next_mask][nxt] = last
+        
+        closing = (lambda last: cost[last][0]) if fixed_start and round_trip else (lambda last: 0.0)
+        last = min(range(n), key=lambda j: best[full][j] + closing(j))
+        route, mask = [], full
+        while last != -1:
+            route.append(last)
+            last, mask = parent[mask][last], mask & ~(1 << last)
+        return route[::-1]
+    
+    def two_opt_heuristic(self, cost: List[List[float]], fixed_start: bool, round_trip: bool) -> List[int]:
+        n = len(cost)
+        
+        def route_cost(route: List[int]) -> float:
+            total = sum(cost[a][b] for a, b in zip(route, route[1:]))
+            return total + (cost[route[-1]][route[0]] if round_trip else 0.0)
+        
+        best_route, best_cost = None, math.inf
+        for start in ([0] if fixed_start else range(n)):
+            route, unvisited = [start], set(range(n)) - {start}
+            while unvisited:
+                nxt = min(unvisited, key=lambda j: (cost[route[-1]][j], j))
+                route.append(nxt)
+                unvisited.remove(nxt)
+            route = self.two_opt(route, cost, 1 if fixed_start else 0, round_trip)
+            total = route_cost(route)
+            if total < best_cost:
+                best_route, best_cost = route, total
+        return best_route
+    
+    def two_opt(self, route: List[int], cost: List[List[float]], first: int, round_trip: bool) -> List[int]:
+        """Reverse segments route[i..k] (i >= first) while that shortens the path"""
+        n = len(route)
+        improved = True
+        while improved:
+            improved = False
+            for i in range(first, n - 1):
+                for k in range(i + 1, n):
+                    before = route[i - 1] if i > 0 else None
+                    after = route[k + 1] if k + 1 < n else (route[0] if round_trip else None)
+                    delta = 0.0
+                    if before is not None:
+                        delta += cost[before][route[k]] - cost[before][route[i]]
+                    if after is not None:
+                        delta += cost[route[i]][after] - cost[route[k]][after]
+                    if delta < -1e-9:
+                        route[i:k + 1] = reversed(route[i:k + 1])
+                        improved = True
+        return route
+
+class MultiCityPlanner:
+    """Plans a MultiCityRequest: stop order, nights per stop, then one itinerary per stop.
+    
+    Attractions, pricing and hotels are fetched once per stop. Every stop gets at
+    least one night; the remaining nights follow the number of matching attractions.
+    Without an origin the flight is booked into the first stop; every other move is a
+    transfer leg priced by the RouteOptimizer.
+    """
+    
+    def __init__(self, planner: Optional[SimpleItineraryPlanner] = None,
+                 route_optimizer: Optional[RouteOptimizer] = None):
+        self.planner = planner or SimpleItineraryPlanner()
+        self.route_optimizer = route_optimizer or RouteOptimizer()
+    
+    def canonical_city(self, city: str) -> str:
+        resolve = getattr(self.planner.web_search, "resolve_city", None)
+        return resolve(city) if resolve else city.strip()
+    
+    def split_nights(self, nights: int, weights: List[float]) -> List[int]:
+        """At least one night per stop, the rest by largest remainder on weights"""
+        if nights < len(weights):
+            raise ValueError(f"{nights} nights are not enough for {len(weights)} stops")
+        total = sum(weights)
+        shares = [(nights - len(weights)) * weight / total for weight in weights]
+        split = [1 + int(share) for share in shares]
+        leftover = nights - sum(split)
+        for i in sorted(range(len(weights)), key=lambda i: (-(shares[i] - int(shares[i])), i))[:leftover]:
+            split[i] += 1
+        return split
+    
+    def create_itinerary(self, request: MultiCityRequest) -> Dict:
+        planner = self.planner
+        start_date, end_date = planner.parse_dates(TravelRequest(
+            "", request.budget, request.start_date, request.end_date, request.travelers, request.interests))
+        nights = (end_date - start_date).days
+        
+        stops = list(dict.fromkeys(self.canonical_city(city) for city in request.destinations))
+        if not stops:
+            raise ValueError("A multi-city request needs at least one destination")
+        origin = self.canonical_city(request.origin) if request.origin else None
+        
+        metrics = planner.instrumentation
+        with metrics.stage("search"):
+            found = {city: planner.find_attractions(TravelRequest(
+                city, request.budget, request.start_date, request.end_date, request.travelers, request.interests))
+                for city in stops}
+        with metrics.stage("pricing"):
+            pricing = {city: planner.web_search.get_current_prices(city) for city in stops}
+        
+        with metrics.stage("routing"):
+            if request.keep_order:
+                order, route_score = stops, None
+            else:
+                order, route_score = self.route_optimizer.order(stops, request.travelers, origin,
+                                                                request.return_to_origin)
+            path = ([origin] if origin else []) + order + ([origin] if origin and request.return_to_origin else [])
+            transfers = [self.route_optimizer.transfer(a, b, request.travelers) for a, b in zip(path, path[1:])]
+        
+        split = self.split_nights(nights, [max(1, len(found[city])) for city in order])
+        transfer_cost = round(sum(leg["cost"] for leg in transfers), 2)
+        stay_budget = max(0.0, request.budget - transfer_cost)
+        
+        stop_itineraries = []
+        arrival = start_date
+        for position, (city, stop_nights) in enumerate(zip(order, split)):
+            departure = arrival + timedelta(days=stop_nights)
+            stop_request = TravelRequest(city, round(stay_budget * stop_nights / nights, 2),
+                                         arrival.strftime("%Y-%m-%d"), departure.strftime("%Y-%m-%d"),
+                                         request.travelers, request.interests)
+            with metrics.stage("flights"):
+                flights = planner.web_search.search_flights("Home City", city, stop_request.start_date,
+                                                            request.travelers) if position == 0 and not origin else []
+            with metrics.stage("hotels"):
+                hotels = planner.web_search.search_hotels(city, stop_request.start_date, stop_request.end_date,
+                                                          request.travelers)
+            stop_itineraries.append(planner.assemble_itinerary(stop_request, arrival, departure, found[city],
+                                                               flights, hotels, pricing[city], verbose=False))
+            arrival = departure
+        
+        # Leave the origin on the first day, every stop on the day its nights end
+        departures = [request.start_date] * (1 if origin else 0) + [stop["dates"].split(" to ")[1]
+                                                                     for stop in stop_itineraries]
+        for leg, date in zip(transfers, departures):
+            leg["date"] = date
+        
+        estimated_cost = round(sum(stop["estimated_cost"] for stop in stop_itineraries) + transfer_cost, 2)
+        return {
+            "destinations": order,
+            "dates": f"{request.start_date} to {request.end_date}",
+            "duration": f"{nights} days",
+            "budget": request.budget,
+            "estimated_cost": estimated_cost,
+            "nights": dict(zip(order, split)),
+            "transfers": transfers,
+            "transfer_cost": transfer_cost,
+            "route_score": route_score,
+            "stops": stop_itineraries,
+        }
+
+class AsyncTravelProvider:
+    """Async interface for flight, hotel and pricing providers"""
+    
+    async def search_flights(self, origin: str, destination: str, date: str, passengers: int = 1) -> List[FlightOption]:
+        raise NotImplementedError
+    
+    async def search_hotels(self, city: str, checkin: str, checkout: str, guests: int = 1) -> List[HotelOption]:
+        raise NotImplementedError
+    
+    async def get_current_prices(self, city: str) -> Dict:
+        raise NotImplementedError
+
+class AsyncWebSearchAdapter(AsyncTravelProvider):
+    """Runs a synchronous SimpleWebSearchTool in worker threads"""
+    
+    def __init__(self, web_search: Optional[SimpleWebSearchTool] = None):
+        self.web_search = web_search or SimpleWebSearchTool()
+    
+    async def search_flights(self, origin: str, destination: str, date: str, passengers: int = 1) -> List[FlightOption]:
+        return await asyncio.to_thread(self.web_search.search_flights, origin, destination, date, passengers)
+    
+    async def search_hotels(self, city: str, checkin: str, checkout: str, guests: int = 1) -> List[HotelOption]:
+        return await asyncio.to_thread(self.web_search.search_hotels, city, checkin, checkout, guests)
+    
+    async def get_current_prices(self, city: str) -> Dict:
+        return await asyncio.to_thread(self.web_search.get_current_prices, city)
+
+class FakeAsyncProvider(AsyncTravelProvider):
+    """Offline provider serving SimpleWebSearchTool data after configurable delays (seconds)"""
+    
+    def __init__(self, flight_delay: float = 0.1, hotel_delay: float = 0.1, pricing_delay: float = 0.1,
+                 web_search: Optional[SimpleWebSearchTool] = None):
+        self.flight_delay = flight_delay
+        self.hotel_delay = hotel_delay
+        self.pricing_delay = pricing_delay
+        self.web_search = web_search or SimpleWebSearchTool()
+    
+    async def search_flights(self, origin: str, destination: str, date: str, passengers: int = 1) -> List[FlightOption]:
+        await asyncio.sleep(self.flight_delay)
+        return self.web_search.search_flights(origin, destination, date, passengers)
+    
+    async def search_hotels(self, city: str, checkin: str, checkout: str, guests: int = 1) -> List[HotelOption]:
+        await asyncio.sleep(self.hotel_delay)
+        return self.web_search.search_hotels(city, checkin, checkout, guests)
+    
+    async def get_current_prices(self, city: str) -> Dict:
+        await asyncio.sleep(self.pricing_delay)
+        return self.web_search.get_current_prices(city)
+
+class AsyncItineraryPlanner:
+    """Asyncio planner that runs the attraction search and provider lookups concurrently.
+    
+    Each lookup has its own timeout; a lookup that times out or fails falls back to
+    an empty result (default pricing for prices) and is listed under "partial_results".
+    """
+    
+    DEFAULT_TIMEOUTS = {"attractions": 2.0, "flights": 5.0, "hotels": 5.0, "pricing": 3.0}
+    
+    def __init__(self, planner: Optional[SimpleItineraryPlanner] = None,
+                 provider: Optional[AsyncTravelProvider] = None,
+                 timeouts: Optional[Dict[str, float]] = None):
+        self.planner = planner or SimpleItineraryPlanner()
+        self.provider = provider or AsyncWebSearchAdapter(self.planner.web_search)
+        self.timeouts = dict(self.DEFAULT_TIMEOUTS, **(timeouts or {}))
+    
+    async def lookup(self, name: str, awaitable, fallback, failed: List[str]):
+        start = time.perf_counter()
+        try:
+            return await asyncio.wait_for(awaitable, self.timeouts[name])
+        except Exception as e:
+            kind = "timed out" if isinstance(e, asyncio.TimeoutError) else f"failed: {e}"
+            rate_limited_log.warning(f"lookup-{name}", "%s lookup %s, continuing without it", name.capitalize(), kind)
+            self.planner.instrumentation.increment("lookup_failures")
+            failed.append(name)
+            return fallback
+        finally:
+            self.planner.instrumentation.observe("search" if name == "attractions" else name,
+                                                 time.perf_counter() - start)
+    
+    async def create_itinerary(self, request: TravelRequest) -> Dict:
+        with self.planner.instrumentation.request():
+            return await self.plan_request(request)
+    
+    async def plan_request(self, request: TravelRequest) -> Dict:
+        key = None
+        if self.planner.itinerary_store is not None:
+            # The version check and the store read query SQLite, so they run off the loop like put
+            key = await asyncio.to_thread(self.planner.store_key, request)
+            stored = await asyncio.to_thread(self.planner.stored_itinerary, key, request)
+            if stored is not None:
+                return stored
+        start_date, end_date = self.planner.parse_dates(request)
+        
+        failed: List[str] = []
+        attractions, flights, hotels, pricing = await asyncio.gather(
+            self.lookup("attractions", asyncio.to_thread(self.planner.find_attractions, request), [], failed),
+            self.lookup("flights", self.provider.search_flights(
+                "Home City", request.destination, request.start_date, request.travelers), [], failed),
+            self.lookup("hotels", self.provider.search_hotels(
+                request.destination, request.start_date, request.end_date, request.travelers), [], failed),
+            self.lookup("pricing", self.provider.get_current_prices(request.destination),
+                        dict(DEFAULT_PRICING), failed),
+        )
+        
+        itinerary = self.planner.assemble_itinerary(request, start_date, end_date, attractions,
+                                                    flights, hotels, pricing, verbose=False)
+        if failed:
+            itinerary["partial_results"] = failed
+        elif key is not None:
+            await asyncio.to_thread(self.planner.itinerary_store.put, key, itinerary)
+        return itinerary
+
+def request_from_dict(data: Dict) -> TravelRequest:
+    """Build a TravelRequest from decoded JSON, raising ValueError on missing or mistyped fields"""
+    if not isinstance(data, dict):
+        raise ValueError("Request must be a JSON object")
+    missing = [key for key in ("destination", "budget", "start_date", "end_date") if key not in data]
+    if missing:
+        raise ValueError(f"Missing request fields: {', '.join(missing)}")
+    interests = data.get("interests") or []
+    if not isinstance(interests, list) or not all(isinstance(i, str) for i in interests):
+        raise ValueError("interests must be a list of strings")
+    try:
+        return TravelRequest(destination=str(data["destination"]), budget=float(data["budget"]),
+                             start_date=str(data["start_date"]), end_date=str(data["end_date"]),
+                             travelers=int(data.get("travelers", 1)), interests=interests)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid request field: {e}") from None
+
+class ServiceOverloaded(Exception):
+    pass
+
+class ItineraryService:
+    """Resident planning service: a local HTTP/JSON API over one warm planner.
+    
+    Endpoints: POST /itinerary (one TravelRequest), POST /itineraries (a list of at
+    most max_batch requests, planned concurrently), GET /health and GET /metrics.
+    At most max_concurrency requests are planned at once and at most max_queue
+    wait for a slot; anything beyond that, or waiting longer than queue_timeout,
+    is answered 503 with Retry-After right away so latency stays bounded. Every
+    request of a batch takes its own slot; an item that is rejected or fails gets
+    an {"error": ...} entry in the batch response instead.
+    """
+    
+    def __init__(self, planner: Optional[SimpleItineraryPlanner] = None, host: str = "127.0.0.1", port: int = 8765,
+                 max_concurrency: int = 8, max_queue: int = 64, queue_timeout: float = 2.0,
+                 max_batch: int = 32, max_body_bytes: int = 1024 * 1024, latency_window: int = 2048):
+        planner = planner or SimpleItineraryPlanner(web_search=CachedWebSearchTool())
+        self.planner = AsyncItineraryPlanner(planner)
+        self.host = host
+        self.port = port
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_batch = max_batch
+        self.max_body_bytes = max_body_bytes
+        self.slots: Optional[asyncio.Semaphore] = None
+        self.waiting = 0
+        self.in_flight = 0
+        self.latencies = deque(maxlen=latency_window)
+        self.counters = {"requests": 0, "itineraries": 0, "batches": 0, "rejected": 0, "errors": 0}
+        self.started_at = time.time()
+        self.server = None
+    
+    async def start(self):
+        self.slots = asyncio.Semaphore(self.max_concurrency)
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        print(f"🚀 Planning service listening on http://{self.host}:{self.port}")
+    
+    async def serve_forever(self):
+        await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+    
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+    
+    @asynccontextmanager
+    async def admission(self):
+        """Wait for a planning slot, or raise ServiceOverloaded when the queue is full or too slow"""
+        if not self.slots.locked():
+            # A free slot is taken without yielding, so it never counts as waiting
+            await self.slots.acquire()
+        else:
+            if self.waiting >= self.max_queue:
+                raise ServiceOverloaded("queue full")
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self.slots.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                raise ServiceOverloaded("timed out waiting for a planning slot") from None
+            finally:
+                self.waiting -= 1
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self.slots.release()
+    
+    async def plan(self, data: Dict) -> Dict:
+        try:
+            request = request_from_dict(data)
+            itinerary = await self.planner.create_itinerary(request)
+        except (ValueError, TypeError, KeyError) as e:
+            self.counters["errors"] += 1
+            return {"error": str(e)}
+        self.counters["itineraries"] += 1
+        return itinerary
+    
+    async def plan_admitted(self, data: Dict) -> Dict:
+        async with self.admission():
+            return await self.plan(data)
+    
+    async def plan_batch_item(self, data: Dict) -> Dict:
+        """plan_admitted for one item of a batch; failures become that item's {"error": ...}"""
+        try:
+            return await self.plan_admitted(data)
+        except ServiceOverloaded as e:
+            self.counters["rejected"] += 1
+            return {"error": f"Service overloaded: {e}"}
+        except Exception as e:
+            self.counters["errors"] += 1
+            return {"error": str(e)}
+    
+    async def route(self, method: str, path: str, body: bytes) -> Tuple[int, object]:
+        if method == "GET" and path == "/health":
+            return 200, {"status": "ok", "uptime_s": round(time.time() - self.started_at, 1)}
+        if method == "GET" and path == "/metrics":
+            return 200, self.stats()
+        if method == "GET" and path == "/metrics/prometheus":
+            return 200, self.planner.planner.instrumentation.export_prometheus()
+        if method != "POST" or path not in ("/itinerary", "/itineraries"):
+            return 404, {"error": f"No route for {method} {path}"}
+        
+        try:
+            data = json.loads(body or b"null")
+        except ValueError as e:
+            return 400, {"error": f"Invalid JSON: {e}"}
+        if path == "/itineraries":
+            items = data.get("requests") if isinstance(data, dict) else data
+            if not isinstance(items, list):
+                return 400, {"error": "Expected a list of requests or {\"requests\": [...]}"}
+            if len(items) > self.max_batch:
+                return 413, {"error": f"Batch of {len(items)} exceeds max_batch={self.max_batch}"}
+        
+        if path == "/itinerary":
+            result = await self.plan_admitted(data)
+            return (400 if "error" in result else 200), result
+        self.counters["batches"] += 1
+        results = await asyncio.gather(*(self.plan_batch_item(item) for item in items))
+        return 200, {"itineraries": results}
+    
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, path, version = (request_line.decode("latin-1").split() + ["", ""])[:3]
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                try:
+                    length = int(headers.get("content-length") or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    # Without a valid length the body cannot be skipped, so the connection is closed
+                    await self.respond(writer, 400, {"error": "Invalid Content-Length"}, keep_alive=False)
+                    break
+                if length > self.max_body_bytes:
+                    await self.respond(writer, 413, {"error": "Request body too large"}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                
+                start = time.perf_counter()
+                self.counters["requests"] += 1
+                extra_headers = {}
+                try:
+                    status, payload = await self.route(method, path.split("?", 1)[0], body)
+                except ServiceOverloaded as e:
+                    self.counters["rejected"] += 1
+                    status, payload = 503, {"error": f"Service overloaded: {e}"}
+                    extra_headers["Retry-After"] = "1"
+                except Exception as e:
+                    self.counters["errors"] += 1
+                    status, payload = 500, {"error": str(e)}
+                if status == 200 and path.startswith("/itinerar"):
+                    self.latencies.append(time.perf_counter() - start)
+                await self.respond(writer, status, payload, keep_alive, extra_headers)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+    
+    async def respond(self, writer: asyncio.StreamWriter, status: int, payload, keep_alive: bool = True,
+                      extra_headers: Optional[Dict[str, str]] = None):
+        reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large",
+                   500: "Internal Server Error", 503: "Service Unavailable"}
+        text = isinstance(payload, str)
+        body = (payload if text else self.planner.planner.fragments.encode(payload)).encode("utf-8")
+        headers = {"Content-Type": "text/plain; version=0.0.4" if text else "application/json", "Content-Length": str(len(body)),
+                   "Connection": "keep-alive" if keep_alive else "close", **(extra_headers or {})}
+        head = f"HTTP/1.1 {status} {reasons.get(status, '')}\r\n" + \
+            "".join(f"{key}: {value}\r\n" for key, value in headers.items()) + "\r\n"
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+    
+    def stats(self) -> Dict:
+        latencies = sorted(self.latencies)
+        
+        def percentile(p: float) -> float:
+            return round(latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1000, 3) if latencies else 0.0
+        
+        planner = self.planner.planner
+        stats = dict(self.counters, in_flight=self.in_flight, waiting=self.waiting,
+                     max_concurrency=self.max_concurrency, max_queue=self.max_queue,
+                     latency_p50_ms=percentile(50), latency_p99_ms=percentile(99),
+                     stages=planner.instrumentation.snapshot(),
+                     search_cache=planner.tourist_db.search_cache_stats(),
+                     connection_pool=planner.tourist_db.connection_stats(),
+                     fragments=planner.fragments.stats())
+        cache = getattr(planner.web_search, "cache", None)
+        if isinstance(cache, LookupCache):
+            stats["lookup_cache"] = cache.stats()
+        if planner.itinerary_store is not None:
+            stats["itinerary_store"] = planner.itinerary_store.stats()
+        return stats
+
+class JSONItineraryWriter:
+    """Collects itineraries and writes them as one pretty-printed JSON object on close"""
+    
+    def __init__(self, path: str, fragments: Optional[ItineraryFragments] = None):
+        self.path = path
+        self.fragments = fragments or ItineraryFragments()
+        self.itineraries: Dict[str, Dict] = {}
+    
+    def write(self, key: str, itinerary: Dict):
+        self.itineraries[key] = itinerary
+    
+    def close(self):
+        with open(self.path, 'w') as f:
+            f.write(self.fragments.encode(self.itineraries, indent=2))
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+class NDJSONItineraryWriter:
+    """Streams itineraries as newline-delimited JSON, one {"key", "itinerary"} record per line.
+    
+    Records are written as soon as they are ready and the file is flushed every
+    flush_every records, so memory stays bounded and a crash only loses the tail.
+    Paths ending in .gz are gzip-compressed unless compress says otherwise.
+    Pass the planner's fragments to reuse the JSON of the parts its itineraries share.
+    """
+    
+    def __init__(self, path: str, compress: Optional[bool] = None, flush_every: int = 1,
+                 fragments: Optional[ItineraryFragments] = None):
+        self.path = path
+        self.fragments = fragments or ItineraryFragments()
+        self.compress = path.endswith(".gz") if compress is None else compress
+        self.flush_every = max(1, flush_every)
+        self.records = 0
+        if self.compress:
+            self.file = gzip.open(path, 'wt', encoding='utf-8')
+        else:
+            self.file = open(path, 'w', encoding='utf-8')
+    
+    def write(self, key: str, itinerary: Dict):
+        self.file.write(self.fragments.encode({"key": key, "itinerary": itinerary}) + "\n")
+        self.records += 1
+        if self.records % self.flush_every == 0:
+            self.file.flush()
+    
+    def close(self):
+        self.file.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+def read_itineraries_ndjson(path: str) -> Iterator[Tuple[str, Dict]]:
+    """Yield (key, itinerary) pairs from a file written by NDJSONItineraryWriter.
+    
+    A truncated last record (from a writer that did not finish) is skipped.
+    """
+    with open(path, 'rb') as f:
+        compressed = f.read(2) == b"\x1f\x8b"
+    opener = gzip.open if compressed else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        try:
+            for line in f:
+                if not line.endswith("\n"):
+                    logger.warning("Skipping truncated last record in %s", path)
+                    break
+                if line.strip():
+                    record = json.loads(line)
+                    yield record["key"], record["itinerary"]
+        except EOFError:
+            logger.warning("%s ends before the end of the gzip stream, stopping early", path)
+
+def open_itinerary_writer(path: str, output_format: str = "json", fragments: Optional[ItineraryFragments] = None):
+    if output_format == "json":
+        return JSONItineraryWriter(path, fragments=fragments)
+    if output_format == "ndjson":
+        return NDJSONItineraryWriter(path, fragments=fragments)
+    raise ValueError(f"Unknown output format: {output_format}")
+
+_batch_planner: Optional[SimpleItineraryPlanner] = None
+
+def _init_batch_worker(db_path: str, planner_options: Dict, snapshot_path: Optional[str] = None):
+    global _batch_planner
+    if snapshot_path:
+        # Workers map the same snapshot file, so its pages are shared instead of copied
+        _batch_planner = snapshot_planner(snapshot_path, **planner_options)
+        return
+    _batch_planner = SimpleItineraryPlanner(tourist_db=SimpleTouristDatabase(db_path, lazy=True),
+                                            **planner_options)
+
+def _plan_batch_chunk(chunk: List) -> List[tuple]:
+    return _batch_planner.plan_batch_chunk(chunk)
+
+def main(output_path: str = "travel_itineraries.json", output_format: str = "json",
+         metrics_path: Optional[str] = None, snapshot_path: Optional[str] = None,
+         fare_files: Iterable[str] = (), store_path: Optional[str] = None):
+    """Example usage of the Travel Itinerary Planner.
+    
+    output_format "json" writes one pretty JSON object at the end, "ndjson" streams
+    each itinerary to output_path as soon as it is planned (gzip for .gz paths).
+    Only the "json" format keeps the itineraries in memory for the return value.
+    metrics_path, if given, receives the per-stage timings in Prometheus text format.
+    snapshot_path plans from a compiled snapshot (see compile_snapshot) instead of attractions.db.
+    fare_files are CSV/NDJSON fare tables (see ProviderStore.load) used instead of the built-in fares.
+    store_path keeps finished itineraries in an ItineraryStore there, so reruns skip planning.
+    """
     print("🎉 Starting Travel Itinerary Planner...")
-    planner = SimpleItineraryPlanner()
+    planner = snapshot_planner(snapshot_path) if snapshot_path else SimpleItineraryPlanner()
+    if store_path:
+        planner.itinerary_store = ItineraryStore(store_path, fragments=planner.fragments)
+    for path in fare_files:
+        planner.web_search.fares.load(path)
+    writer = open_itinerary_writer(output_path, output_format, fragments=planner.fragments)
     
     # List of cities to generate itineraries for
     cities = ["Prague", "Paris", "Rome"]  # Add more cities as needed
@@ -601,7 +4717,9 @@ def main():
         
         try:
             itinerary = planner.create_itinerary(travel_request)
-            all_itineraries[city] = itinerary
+            writer.write(city, itinerary)
+            if output_format == "json":
+                all_itineraries[city] = itinerary
             
             # Display results
             print(f"\n🌟 TRAVEL ITINERARY FOR {itinerary['destination'].upper()}")
@@ -660,16 +4778,74 @@ def main():
         except Exception as e:
             print(f"❌ Error generating itinerary for {city}: {e}")
     
-    # Save all itineraries to JSON
-    with open('travel_itineraries.json', 'w') as f:
-        json.dump(all_itineraries, f, indent=2)
-    print("\n💾 All itineraries saved to 'travel_itineraries.json'")
+    writer.close()
+    print(f"\n💾 All itineraries saved to '{output_path}'")
+    if metrics_path:
+        with open(metrics_path, "w") as f:
+            f.write(planner.instrumentation.export_prometheus())
+        print(f"📈 Stage metrics saved to '{metrics_path}'")
+    if planner.itinerary_store is not None:
+        stats = planner.itinerary_store.stats()
+        print(f"🗄️ Itinerary store: {stats['hits']} hits, {stats['misses']} misses, {stats['entries']} entries")
     
     return all_itineraries
 
 if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Intelligent Travel Itinerary Planner")
+    parser.add_argument("--output", default="travel_itineraries.json", help="Where to save the itineraries")
+    parser.add_argument("--format", choices=["json", "ndjson"], default="json",
+                        help="json: one pretty file written at the end; ndjson: streamed, one itinerary per line")
+    parser.add_argument("--import-attractions", nargs="+", metavar="FILE",
+                        help="Bulk import CSV/NDJSON attraction dumps (.gz allowed) into attractions.db and exit")
+    parser.add_argument("--metrics", metavar="PATH", help="Write per-stage timings in Prometheus text format")
+    parser.add_argument("--log-level", default="WARNING", help="Logging level, e.g. DEBUG for per-request records")
+    parser.add_argument("--serve", action="store_true",
+                        help="Run the resident planning service (HTTP/JSON) instead of the example")
+    parser.add_argument("--port", type=int, default=8765, help="Port for --serve")
+    parser.add_argument("--compile-snapshot", metavar="PATH",
+                        help="Compile attractions.db and provider data into a binary snapshot and exit")
+    parser.add_argument("--snapshot", metavar="PATH",
+                        help="Plan from a compiled snapshot (memory-mapped, reloaded when the file is replaced)")
+    parser.add_argument("--fares", nargs="+", metavar="FILE", default=[],
+                        help="Load per-date flight/hotel fares and pricing from CSV/NDJSON files (.gz allowed)")
+    parser.add_argument("--itinerary-store", metavar="PATH",
+                        help="Serve repeated requests from a persistent itinerary store (SQLite) at PATH")
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level.upper(), format="%(levelname)s: %(message)s")
+    
+    if args.compile_snapshot:
+        if args.fares:
+            parser.error("--fares are not compiled into snapshots; pass them together with --snapshot instead")
+        header = compile_snapshot(args.compile_snapshot)
+        print(f"📦 Compiled {header['attractions']} attractions in {header['cities']} cities "
+              f"into {args.compile_snapshot} (version {header['version']})")
+        raise SystemExit(0)
+    
+    if args.serve:
+        planner = snapshot_planner(args.snapshot) if args.snapshot else None
+        service = ItineraryService(planner, port=args.port)
+        for path in args.fares:
+            service.planner.planner.web_search.fares.load(path)
+        if args.itinerary_store:
+            service.planner.planner.itinerary_store = ItineraryStore(args.itinerary_store,
+                                                                     fragments=service.planner.planner.fragments)
+        try:
+            asyncio.run(service.serve_forever())
+        except KeyboardInterrupt:
+            print("\n👋 Planning service stopped")
+        raise SystemExit(0)
+    
+    if args.import_attractions:
+        importer = AttractionImporter(SimpleTouristDatabase(lazy=True))
+        for path in args.import_attractions:
+            report = importer.import_file(path)
+            print(f"✅ {path}: {report.rows_imported:,} attractions imported, {report.rows_skipped:,} skipped")
+        raise SystemExit(0)
+    
     try:
-        itineraries = main()
+        itineraries = main(args.output, args.format, args.metrics, args.snapshot, args.fares, args.itinerary_store)
         print("\n✅ All itineraries generated successfully!")
     except Exception as e:
         print(f"❌ Error: {e}")